@@ -2,32 +2,30 @@ from __future__ import annotations
 
 import os
 import sys
-import time
 from datetime import datetime
-from typing import TYPE_CHECKING, Tuple
+from typing import TYPE_CHECKING
 
 import click
-from rich.columns import Columns
-from rich.console import Console, ConsoleRenderable
-from rich.filesize import decimal
-from rich.progress import BarColumn, DownloadColumn, Progress, TaskID, TextColumn
-from rich.table import Column
-from rich.text import Text
-
-from ..core import DeletedMetadata, FileMetadata, FolderMetadata
-from ..models import SyncDirection, SyncEvent, SyncStatus
+
 from .common import check_for_fatal_errors, convert_api_errors, inject_proxy
 from .core import DropboxPath
-from .output import RichDateField, echo, rich_table
+from .output import RichDateField, echo, ok, rich_table
 
 if TYPE_CHECKING:
+    from rich.console import ConsoleRenderable
+    from rich.progress import TaskID
+
     from ..main import Maestral
+    from ..models import ActivityUpdate
 
 
 @click.command(help="Show the status of the daemon.")
 @inject_proxy(fallback=False, existing_config=True)
 @convert_api_errors
 def status(m: Maestral) -> None:
+    from rich.console import Console
+    from rich.text import Text
+
     email = m.get_state("account", "email")
     account_type = m.get_state("account", "type").capitalize()
     usage = m.get_state("account", "usage")
@@ -92,17 +90,23 @@ def activity(m: Maestral) -> None:
         return
 
     from Pyro5.errors import ConnectionClosedError
+    from rich.console import Console
+    from rich.progress import BarColumn, DownloadColumn, Progress, TextColumn
 
-    EventKey = Tuple[str, SyncDirection]
-    progressbar_for_path: dict[EventKey, TaskID] = {}
+    from ..models import ActivityChange, SyncDirection, SyncStatus
 
-    def _event_key(e: SyncEvent) -> EventKey:
-        return e.dbx_path, e.direction
+    items: dict[int, ActivityUpdate] = {}
+    progressbar_for_key: dict[int, TaskID] = {}
 
     console = Console()
 
     arrow = {SyncDirection.Up: "↑", SyncDirection.Down: "↓"}
 
+    try:
+        subscription_id = m.subscribe_activity(max_rate=5)
+    except ConnectionClosedError:
+        return echo("Maestral daemon is not running.")
+
     try:
         with console.screen():
             with Progress(
@@ -117,42 +121,55 @@ def activity(m: Maestral) -> None:
                 console=console,
             ) as progress:
                 while True:
+                    # Blocks until there are changes, at most for one second to
+                    # refresh the status line.
+                    updates = m.get_activity_updates(subscription_id, timeout=1)
+
+                    for update in updates:
+                        if update.change is ActivityChange.Removed:
+                            items.pop(update.key, None)
+                        else:
+                            items[update.key] = update
+
                     msg = f"\rStatus: {m.status}, Sync errors: {len(m.sync_errors)}"
                     progress.console.clear()
                     progress.console.print(msg)
 
-                    sync_events = m.get_activity(limit=console.height - 1)
-                    event_keys = set(_event_key(e) for e in sync_events)
+                    visible = list(items)[: console.height - 1]
 
-                    for key, task_id in progressbar_for_path.copy().items():
-                        if key not in event_keys:
+                    for key, task_id in progressbar_for_key.copy().items():
+                        if key not in visible:
                             progress.remove_task(task_id)
-                            progressbar_for_path.pop(key)
+                            progressbar_for_key.pop(key)
 
-                    for event in sync_events:
-                        if event.status is SyncStatus.Failed:
+                    for key in visible:
+                        item = items[key]
+                        if item.status is SyncStatus.Failed:
                             info = "! Sync Error"
                         else:
-                            info = f"{arrow[event.direction]} {event.change_type.name}"
+                            info = f"{arrow[item.direction]} {item.change_type.name}"
                         try:
-                            task_id = progressbar_for_path[_event_key(event)]
+                            task_id = progressbar_for_key[key]
                         except KeyError:
-                            task_id = progress.add_task(
+                            progressbar_for_key[key] = progress.add_task(
                                 info,
-                                total=event.size,
-                                completed=event.completed,
-                                filename=os.path.basename(event.dbx_path),
+                                total=item.size,
+                                completed=item.completed,
+                                filename=os.path.basename(item.dbx_path),
                             )
-                            progressbar_for_path[_event_key(event)] = task_id
                         else:
                             progress.update(
-                                task_id, completed=event.completed, description=info
+                                task_id, completed=item.completed, description=info
                             )
 
-                    time.sleep(0.2)
                     progress.refresh()
     except ConnectionClosedError:
         return echo("Maestral daemon is not running.")
+    finally:
+        try:
+            m.unsubscribe_activity(subscription_id)
+        except ConnectionClosedError:
+            pass
 
 
 @click.command(help="Show sync history.")
@@ -160,6 +177,11 @@ def activity(m: Maestral) -> None:
 @inject_proxy(fallback=True, existing_config=True)
 @convert_api_errors
 def history(m: Maestral, dropbox_path: str) -> None:
+    from rich.console import Console
+    from rich.text import Text
+
+    from ..models import SyncDirection
+
     dbx_path = None if dropbox_path == "/" else dropbox_path
     events = m.get_history(dbx_path)
     table = rich_table("Path", "Change", "Location", "Time")
@@ -178,6 +200,78 @@ def history(m: Maestral, dropbox_path: str) -> None:
     console.print(table)
 
 
+@click.command(help="Show performance metrics of the daemon.")
+@click.option(
+    "--prometheus",
+    is_flag=True,
+    default=False,
+    help="Print metrics in the Prometheus text exposition format.",
+)
+@click.option(
+    "--enable/--disable",
+    "enable",
+    default=None,
+    help="Enable or disable the collection of metrics.",
+)
+@inject_proxy(fallback=True, existing_config=True)
+@convert_api_errors
+def metrics(m: Maestral, prometheus: bool, enable: bool | None) -> None:
+    from rich.console import Console
+    from rich.text import Text
+
+    from ..metrics import to_prometheus_text
+
+    if enable is not None:
+        m.metrics_enabled = enable
+        ok(f"Metrics collection {'enabled' if enable else 'disabled'}.")
+        return
+
+    if not m.metrics_enabled:
+        echo("Metrics collection is disabled. Run 'maestral metrics --enable' first.")
+        return
+
+    families = m.get_metrics()
+
+    if prometheus:
+        echo(to_prometheus_text(families), nl=False)
+        return
+
+    table = rich_table("Metric", "Labels", "Value")
+
+    for family in families:
+        name = family["name"]
+        samples = family["samples"]
+
+        if family["type"] == "histogram":
+            # Summarize histograms by their number of observations and mean.
+            sums = [s for s in samples if s["name"] == f"{name}_sum"]
+            counts = [s for s in samples if s["name"] == f"{name}_count"]
+            rows = []
+
+            for sum_sample, count_sample in zip(sums, counts):
+                count = count_sample["value"]
+                mean = sum_sample["value"] / count if count else 0
+                value = f"{count:.0f} observed, mean {mean:.4g}"
+                rows.append((sum_sample["labels"], value))
+        else:
+            rows = [(s["labels"], f"{s['value']:.6g}") for s in samples]
+
+        for labels, value in rows:
+            labels_str = ", ".join(f"{k}={v}" for k, v in labels.items())
+            table.add_row(
+                Text(name, overflow="fold"),
+                Text(labels_str or "-", overflow="fold"),
+                Text(value, overflow="fold"),
+            )
+
+    if table.row_count == 0:
+        echo("No metrics recorded yet.")
+        return
+
+    console = Console()
+    console.print(table)
+
+
 @click.command(help="List contents of a Dropbox directory.")
 @click.argument("dropbox_path", type=DropboxPath(), default="/")
 @click.option(
@@ -197,6 +291,14 @@ def history(m: Maestral, dropbox_path: str) -> None:
 @inject_proxy(fallback=True, existing_config=True)
 @convert_api_errors
 def ls(m: Maestral, long: bool, dropbox_path: str, include_deleted: bool) -> None:
+    from rich.columns import Columns
+    from rich.console import Console
+    from rich.filesize import decimal
+    from rich.table import Column
+    from rich.text import Text
+
+    from ..core import DeletedMetadata, FileMetadata, FolderMetadata
+
     echo("Loading...\r", nl=False)
 
     entries_iter = m.list_folder_iterator(
@@ -283,6 +385,9 @@ def ls(m: Maestral, long: bool, dropbox_path: str, include_deleted: bool) -> Non
     help="Remove config files without a linked account.",
 )
 def config_files(clean: bool) -> None:
+    from rich.console import Console
+    from rich.text import Text
+
     from ..config import (
         MaestralConfig,
         MaestralState,
@@ -1,22 +1,8 @@
 # external imports
 import click
 
-from .. import __version__
-from .cli_core import auth, gui, pause, resume, sharelink, start, stop
-from .cli_info import activity, config_files, filestatus, history, ls, status
-from .cli_maintenance import (
-    completion,
-    config,
-    diff,
-    log,
-    move_dir,
-    rebuild_index,
-    restore,
-    revs,
-)
-from .cli_settings import autostart, bandwidth_limit, excluded, notify
-
 # local imports
+from .. import __version__
 from .core import OrderedGroup
 
 
@@ -26,31 +12,46 @@ def main() -> None:
     pass
 
 
-main.add_command(start, section="Core Commands")
-main.add_command(stop, section="Core Commands")
-main.add_command(gui, section="Core Commands")
-main.add_command(pause, section="Core Commands")
-main.add_command(resume, section="Core Commands")
-main.add_command(auth, section="Core Commands")
-main.add_command(sharelink, section="Core Commands")
-
-main.add_command(status, section="Information")
-main.add_command(filestatus, section="Information")
-main.add_command(activity, section="Information")
-main.add_command(history, section="Information")
-main.add_command(ls, section="Information")
-main.add_command(config_files, section="Information")
-
-main.add_command(autostart, section="Settings")
-main.add_command(excluded, section="Settings")
-main.add_command(notify, section="Settings")
-main.add_command(bandwidth_limit, section="Settings")
-
-main.add_command(move_dir, section="Maintenance")
-main.add_command(rebuild_index, section="Maintenance")
-main.add_command(revs, section="Maintenance")
-main.add_command(diff, section="Maintenance")
-main.add_command(restore, section="Maintenance")
-main.add_command(log, section="Maintenance")
-main.add_command(config, section="Maintenance")
-main.add_command(completion, section="Maintenance")
+# Commands are only imported when invoked to keep the CLI responsive. This matters for
+# commands which are called frequently from scripts, such as status and filestatus.
+
+_core = "maestral.cli.cli_core"
+_info = "maestral.cli.cli_info"
+_settings = "maestral.cli.cli_settings"
+_maintenance = "maestral.cli.cli_maintenance"
+
+main.add_lazy_command(f"{_core}:start", "start", section="Core Commands")
+main.add_lazy_command(f"{_core}:stop", "stop", section="Core Commands")
+main.add_lazy_command(f"{_core}:gui", "gui", section="Core Commands")
+main.add_lazy_command(f"{_core}:pause", "pause", section="Core Commands")
+main.add_lazy_command(f"{_core}:resume", "resume", section="Core Commands")
+main.add_lazy_command(f"{_core}:auth", "auth", section="Core Commands")
+main.add_lazy_command(f"{_core}:sharelink", "sharelink", section="Core Commands")
+
+main.add_lazy_command(f"{_info}:status", "status", section="Information")
+main.add_lazy_command(f"{_info}:filestatus", "filestatus", section="Information")
+main.add_lazy_command(f"{_info}:activity", "activity", section="Information")
+main.add_lazy_command(f"{_info}:history", "history", section="Information")
+main.add_lazy_command(f"{_info}:metrics", "metrics", section="Information")
+main.add_lazy_command(f"{_info}:ls", "ls", section="Information")
+main.add_lazy_command(f"{_info}:config_files", "config-files", section="Information")
+
+main.add_lazy_command(f"{_settings}:autostart", "autostart", section="Settings")
+main.add_lazy_command(f"{_settings}:excluded", "excluded", section="Settings")
+main.add_lazy_command(f"{_settings}:notify", "notify", section="Settings")
+main.add_lazy_command(
+    f"{_settings}:bandwidth_limit", "bandwidth-limit", section="Settings"
+)
+
+main.add_lazy_command(f"{_maintenance}:move_dir", "move-dir", section="Maintenance")
+main.add_lazy_command(
+    f"{_maintenance}:rebuild_index", "rebuild-index", section="Maintenance"
+)
+main.add_lazy_command(f"{_maintenance}:revs", "revs", section="Maintenance")
+main.add_lazy_command(f"{_maintenance}:diff", "diff", section="Maintenance")
+main.add_lazy_command(f"{_maintenance}:restore", "restore", section="Maintenance")
+main.add_lazy_command(f"{_maintenance}:log", "log", section="Maintenance")
+main.add_lazy_command(f"{_maintenance}:trace", "trace", section="Maintenance")
+main.add_lazy_command(f"{_maintenance}:debug", "debug", section="Maintenance")
+main.add_lazy_command(f"{_maintenance}:config", "config", section="Maintenance")
+main.add_lazy_command(f"{_maintenance}:completion", "completion", section="Maintenance")
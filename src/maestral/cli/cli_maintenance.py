@@ -5,6 +5,7 @@ import io
 import logging
 import os
 import textwrap
+import time
 from os import path as osp
 from typing import TYPE_CHECKING, cast
 
@@ -339,6 +340,127 @@ def log_level(m: Maestral, level_name: str) -> None:
         echo(f"Log level: {level_name}")
 
 
+@log.command(
+    name="format",
+    help="""
+Get or set the format of log files.
+
+The "json" format writes one JSON object per line for ingestion by log processors.
+""",
+)
+@click.argument("format_name", required=False, type=click.Choice(["text", "json"]))
+@inject_proxy(fallback=True, existing_config=True)
+def log_format(m: Maestral, format_name: str | None) -> None:
+    if format_name:
+        m.log_format = format_name
+        ok(f"Log format set to {format_name}.")
+    else:
+        echo(f"Log format: {m.log_format}")
+
+
+@click.group(help="Trace sync activity to find out where time is spent.")
+def trace() -> None:
+    pass
+
+
+@trace.command(
+    name="sample-rate",
+    help="""
+Get or set the fraction of sync cycles to trace.
+
+Tracing records the duration of each stage of a sync cycle, for instance listing
+changes, handling individual items, API requests and database access. Set the rate to
+0 to disable tracing.
+""",
+)
+@click.argument("rate", required=False, type=click.FloatRange(0, 1))
+@inject_proxy(fallback=True, existing_config=True)
+def trace_sample_rate(m: Maestral, rate: float | None) -> None:
+    if rate is not None:
+        m.trace_sample_rate = rate
+        ok(f"Trace sample rate set to {rate}.")
+    else:
+        echo(f"Trace sample rate: {m.trace_sample_rate}")
+
+
+@trace.command(
+    name="export",
+    help="""
+Save recorded traces to a file.
+
+Traces are saved in the Chrome trace event format which can be opened in Perfetto
+(https://ui.perfetto.dev) or chrome://tracing.
+""",
+)
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option(
+    "--clear", is_flag=True, default=False, help="Remove exported traces from memory."
+)
+@inject_proxy(fallback=True, existing_config=True)
+def trace_export(m: Maestral, path: str, clear: bool) -> None:
+    from ..tracing import write_chrome_trace
+
+    trace = m.get_trace(clear=clear)
+    n_spans = sum(1 for event in trace["traceEvents"] if event["ph"] == "X")
+
+    if n_spans == 0 and m.trace_sample_rate == 0:
+        warn("Tracing is disabled. Run 'maestral trace sample-rate RATE' first.")
+
+    try:
+        write_chrome_trace(path, trace)
+    except OSError as exc:
+        raise CliException(f"Could not write trace to '{path}': {exc.strerror}")
+
+    ok(f"Exported {n_spans} spans to '{path}'.")
+
+
+@click.group(help="Tools to debug the sync daemon.")
+def debug() -> None:
+    pass
+
+
+@debug.command(
+    name="profile",
+    help="""
+Profile the running sync daemon.
+
+Modes are "sample" to periodically sample the stacks of all threads, "cprofile" to
+record all function calls with cProfile and "memory" to trace memory allocations. The
+results are saved to a file in the log directory.
+""",
+)
+@click.option(
+    "--mode",
+    "-m",
+    type=click.Choice(["sample", "cprofile", "memory"]),
+    default="sample",
+    show_default=True,
+    help="Profiling mode.",
+)
+@click.option(
+    "--duration",
+    "-d",
+    type=click.FloatRange(min=0, min_open=True),
+    default=30.0,
+    show_default=True,
+    help="Duration in seconds.",
+)
+@inject_proxy(fallback=False, existing_config=True)
+def debug_profile(m: Maestral, mode: str, duration: float) -> None:
+    m.start_profiling(mode, duration)
+
+    echo(f"Profiling for {duration} sec. Press Ctrl+C to stop early.")
+
+    try:
+        time.sleep(duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        path = m.stop_profiling()
+
+    ok(f"Saved profile to '{path}'.")
+
+
 @click.group(
     help="""
 Direct access to config values.
@@ -360,6 +482,7 @@ Currently available config keys are:
 - account_id: the ID of the linked Dropbox account
 - notification_level: the level for desktop notifications
 - log_level: the log level.
+- log_format: the format of log files, "text" or "json"
 - update_notification_interval: interval in secs to check for updates
 - keyring: the keyring backend to use (full path of the class)
 - reindex_interval: the interval in seconds for full reindexing
@@ -367,6 +490,10 @@ Currently available config keys are:
 - keep_history: the sync history to keep in seconds
 - upload: if upload sync is enabled
 - download: if download sync is enabled
+- indexing_shards: number of folders to list concurrently when indexing
+- metrics_enabled: if performance metrics are collected
+- metrics_textfile: file to periodically export metrics to in Prometheus format
+- trace_sample_rate: fraction of sync cycles to trace, between 0 and 1
 """,
 )
 def config() -> None:
@@ -192,9 +192,18 @@ class ConfigName(click.ParamType):
 
 
 class OrderedGroup(click.Group):
-    """Click command group with customizable sections of help output."""
+    """Click command group with customizable sections of help output.
 
-    sections: dict[str, list[tuple[str, click.Command]]] = {}
+    Commands can be registered lazily with :meth:`add_lazy_command`. Their modules will
+    only be imported when the command is invoked or listed in the help output. This
+    keeps the startup time of frequently called commands low.
+    """
+
+    sections: dict[str, list[str]] = {}
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy_commands: dict[str, str] = {}
 
     def add_command(
         self, cmd: click.Command, name: str | None = None, section: str = ""
@@ -204,15 +213,40 @@ class OrderedGroup(click.Group):
         if name is None:
             raise TypeError("Command has no name.")
 
-        self.sections[section] = self.sections.get(section, []) + [(name, cmd)]
+        if name not in self.sections.get(section, []):
+            self.sections[section] = self.sections.get(section, []) + [name]
         super().add_command(cmd, name)
 
+    def add_lazy_command(self, import_path: str, name: str, section: str = "") -> None:
+        """
+        Registers a command without importing it.
+
+        :param import_path: Import path of the command in the form "module:attribute".
+        :param name: Name of the command.
+        :param section: Section of the help output to list the command in.
+        """
+        self.lazy_commands[name] = import_path
+        self.sections[section] = self.sections.get(section, []) + [name]
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            import importlib
+
+            module_name, attr_name = self.lazy_commands[cmd_name].split(":")
+            cmd = getattr(importlib.import_module(module_name), attr_name)
+            super().add_command(cmd, cmd_name)
+
+        return super().get_command(ctx, cmd_name)
+
     def format_commands(
         self, ctx: click.Context, formatter: click.HelpFormatter
     ) -> None:
         commands = []
 
-        for name in self.commands:
+        for name in self.list_commands(ctx):
             cmd = self.get_command(ctx, name)
             # What is this, the tool lied about a command.  Ignore it
             if cmd is None:
@@ -226,15 +260,17 @@ class OrderedGroup(click.Group):
         if len(commands) > 0:
             max_len = max(len(name) for name, cmd in commands)
             limit = formatter.width - 6 - max_len
+            visible = dict(commands)
 
             # format sections individually
-            for section, cmd_list in self.sections.items():
+            for section, names in self.sections.items():
                 rows = []
 
-                for name, cmd in cmd_list:
-                    name = name.ljust(max_len)
-                    help_str = cmd.get_short_help_str(limit)
-                    rows.append((name, help_str))
+                for name in names:
+                    if name not in visible:
+                        continue
+                    help_str = visible[name].get_short_help_str(limit)
+                    rows.append((name.ljust(max_len), help_str))
 
                 if rows:
                     with formatter.section(section):
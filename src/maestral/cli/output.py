@@ -7,14 +7,15 @@ from __future__ import annotations
 
 import enum
 from datetime import datetime
-from typing import Callable, Iterable
+from typing import TYPE_CHECKING, Callable, Iterable
 
 import click
-from rich.console import Console, ConsoleOptions, RenderResult
-from rich.measure import Measurement
-from rich.style import Style
-from rich.table import Column, Table
-from rich.text import Text
+
+if TYPE_CHECKING:
+    from rich.console import Console, ConsoleOptions, RenderResult
+    from rich.measure import Measurement
+    from rich.style import Style
+    from rich.table import Column, Table
 
 TABLE_STYLE = dict(padding=(0, 2, 0, 0), box=None)
 
@@ -23,6 +24,8 @@ TABLE_STYLE = dict(padding=(0, 2, 0, 0), box=None)
 
 
 def rich_table(*headers: Column | str) -> Table:
+    from rich.table import Table
+
     return Table(*headers, padding=(0, 2, 0, 0), box=None, show_header=len(headers) > 0)
 
 
@@ -45,11 +48,15 @@ class RichDateField:
     def __rich_console__(
         self, console: Console, options: ConsoleOptions
     ) -> RenderResult:
+        from rich.text import Text
+
         yield Text(self.format(options.max_width), no_wrap=True, style=self.style)
 
     def __rich_measure__(
         self, console: Console, options: ConsoleOptions
     ) -> Measurement:
+        from rich.measure import Measurement
+
         return Measurement(len(self._shortest_string), 20)
 
 
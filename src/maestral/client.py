@@ -9,9 +9,12 @@ import functools
 
 # system imports
 import os
+import random
 import re
+import threading
 import time
-from contextlib import closing, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
 from datetime import datetime, timezone
 from typing import (
     TYPE_CHECKING,
@@ -35,11 +38,14 @@ from dropbox.dropbox_client import (
     RouteResult,
 )
 from dropbox.oauth import DropboxOAuth2FlowNoRedirect
-from dropbox.session import API_HOST
+from dropbox.session import API_CONTENT_HOST, API_HOST
+from requests.adapters import HTTPAdapter
 from typing_extensions import Concatenate, ParamSpec
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
 
 # local imports
-from . import __version__
+from . import __version__, metrics, tracing
 from .config import MaestralState
 from .constants import DROPBOX_APP_KEY
 from .core import (
@@ -88,7 +94,7 @@ if TYPE_CHECKING:
     from .models import SyncEvent
 
 
-__all__ = ["DropboxClient", "API_HOST"]
+__all__ = ["DropboxClient", "RequestScheduler", "API_HOST"]
 
 
 PRT = TypeVar("PRT", ListFolderResult, ListSharedLinkResult)
@@ -97,6 +103,368 @@ T = TypeVar("T")
 
 USER_AGENT = f"Maestral/v{__version__}"
 
+_API_REQUEST_DURATION = metrics.registry.histogram(
+    "maestral_api_request_duration_seconds",
+    "Duration of Dropbox API requests until the response headers are received.",
+    ("route",),
+)
+_TRANSFERRED_BYTES = metrics.registry.counter(
+    "maestral_transferred_bytes_total",
+    "Number of bytes of file content uploaded to or downloaded from Dropbox.",
+    ("direction",),
+)
+
+
+_API_THROTTLED_TIME = metrics.registry.counter(
+    "maestral_api_throttled_seconds_total",
+    "Time that Dropbox API requests waited before being sent because of concurrency "
+    "limits, rate limits or a retry-after from Dropbox.",
+    ("request_class", "reason"),
+)
+_API_RATE_LIMITED = metrics.registry.counter(
+    "maestral_api_rate_limited_total",
+    "Number of Dropbox API requests which were rejected because of rate limits.",
+    ("request_class",),
+)
+_TLS_HANDSHAKES = metrics.registry.counter(
+    "maestral_tls_handshakes_total",
+    "Number of TLS handshakes with Dropbox servers, one for each new connection.",
+    ("host",),
+)
+_HTTP_REQUESTS = metrics.registry.counter(
+    "maestral_http_requests_total",
+    "Number of HTTP requests to Dropbox servers by whether they were sent over a new "
+    "or a reused connection.",
+    ("host", "connection"),
+)
+_IDLE_CONNECTIONS_CLOSED = metrics.registry.counter(
+    "maestral_http_idle_connections_closed_total",
+    "Number of pooled connections to Dropbox servers which were closed after being "
+    "idle.",
+    ("host",),
+)
+
+# Request classes of Dropbox API routes, see RequestScheduler.
+METADATA = "metadata"
+WRITE = "write"
+TRANSFER = "transfer"
+LONGPOLL = "longpoll"
+
+_TRANSFER_ROUTES = {
+    "files/download",
+    "files/download_zip",
+    "files/export",
+    "files/get_preview",
+    "files/get_thumbnail_v2",
+    "files/upload_session/start",
+    "files/upload_session/append_v2",
+}
+
+# Routes which commit changes to a namespace.
+_WRITE_ROUTES = {
+    "files/copy_v2",
+    "files/copy_batch_v2",
+    "files/create_folder_v2",
+    "files/create_folder_batch",
+    "files/delete_v2",
+    "files/delete_batch",
+    "files/move_v2",
+    "files/move_batch_v2",
+    "files/restore",
+    "files/save_url",
+    "files/upload",
+    "files/upload_session/finish",
+    "files/upload_session/finish_batch_v2",
+    "sharing/share_folder",
+}
+
+_LONGPOLL_ROUTES = {"files/list_folder/longpoll"}
+
+
+def classify_route(route: str) -> str:
+    """
+    Returns the request class of a Dropbox API route.
+
+    :param route: Route name including the namespace and version, for instance
+        "files/delete_v2".
+    :returns: One of "metadata", "write", "transfer" or "longpoll".
+    """
+    if route in _TRANSFER_ROUTES:
+        return TRANSFER
+    elif route in _WRITE_ROUTES:
+        return WRITE
+    elif route in _LONGPOLL_ROUTES:
+        return LONGPOLL
+    else:
+        return METADATA
+
+
+class _RequestClassState:
+    """Concurrency and token bucket of a request class."""
+
+    __slots__ = ("max_concurrent", "rate", "active", "tokens", "last_refill")
+
+    def __init__(self, max_concurrent: int, rate: float) -> None:
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.active = 0
+        self.tokens = max(rate, 1.0)
+        self.last_refill = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(
+            self.tokens + (now - self.last_refill) * self.rate, max(self.rate, 1.0)
+        )
+        self.last_refill = now
+
+
+class RequestScheduler:
+    """
+    Coordinates Dropbox API requests from all threads of a client.
+
+    Requests are grouped into classes: metadata reads, writes which commit changes to
+    the namespace, data transfers and longpolls. Each class has a maximum number of
+    concurrent requests and a token bucket rate in requests per second which allows
+    bursts of up to one second worth of requests. A rate of 0 means unlimited.
+
+    When Dropbox rejects a request because of rate limits, all further requests except
+    longpolls wait for the given retry-after time plus a random jitter, such that
+    waiting threads do not retry at the same time. When Dropbox reports contention of
+    write operations in the namespace, writes are serialized until there has been no
+    such error for :attr:`SERIAL_WRITES_PERIOD` seconds.
+
+    Concurrency is limited until the response headers are received. Streaming the
+    body of a download is not limited.
+
+    :param limits: Maximum number of concurrent requests and rate for each request
+        class. Defaults to :attr:`DEFAULT_LIMITS` for classes which are not given.
+    :param max_jitter: Maximum random delay in seconds to add to a retry-after.
+    """
+
+    DEFAULT_LIMITS: dict[str, tuple[int, float]] = {
+        METADATA: (16, 100.0),
+        WRITE: (8, 50.0),
+        TRANSFER: (16, 0.0),
+        LONGPOLL: (2, 0.0),
+    }
+    """Default maximum number of concurrent requests and rate for each class."""
+
+    DEFAULT_RETRY_AFTER = 5.0
+    """Time in seconds to wait after a rate limit error without retry-after."""
+
+    SERIAL_WRITES_PERIOD = 60.0
+    """Time in seconds to serialize writes after contention was reported."""
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[int, float]] | None = None,
+        max_jitter: float = 1.0,
+    ) -> None:
+        limits = {**self.DEFAULT_LIMITS, **(limits or {})}
+
+        self.max_jitter = max_jitter
+        self._states = {
+            request_class: _RequestClassState(max_concurrent, rate)
+            for request_class, (max_concurrent, rate) in limits.items()
+        }
+        self._backoff_until = 0.0
+        self._serial_writes_until = 0.0
+        self._throttled_time = {request_class: 0.0 for request_class in limits}
+        self._cond = threading.Condition()
+
+    @property
+    def throttled_time(self) -> dict[str, float]:
+        """Total time in seconds that requests of each class have waited."""
+        with self._cond:
+            return dict(self._throttled_time)
+
+    @property
+    def max_concurrent(self) -> int:
+        """Maximum number of concurrent requests of all classes together."""
+        return sum(state.max_concurrent for state in self._states.values())
+
+    @property
+    def backoff_remaining(self) -> float:
+        """Remaining time in seconds until requests can be sent after a rate limit
+        error."""
+        return max(self._backoff_until - time.monotonic(), 0.0)
+
+    @contextmanager
+    def request(self, route: str) -> Iterator[None]:
+        """
+        A context manager which waits until a request to the given route may be sent.
+        Rate limit errors which are raised in its context delay further requests.
+
+        :param route: Route name including the namespace and version.
+        """
+        request_class = classify_route(route)
+        state = self._states[request_class]
+
+        self._acquire(request_class, state)
+
+        try:
+            yield
+        except exceptions.RateLimitError as exc:
+            self._on_rate_limit(request_class, exc)
+            raise
+        finally:
+            with self._cond:
+                state.active -= 1
+                self._cond.notify_all()
+
+    def _max_concurrent(self, request_class: str, state: _RequestClassState) -> int:
+        if request_class == WRITE and time.monotonic() < self._serial_writes_until:
+            return 1
+        return state.max_concurrent
+
+    def _acquire(self, request_class: str, state: _RequestClassState) -> None:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                timeout: float | None
+
+                if request_class != LONGPOLL and now < self._backoff_until:
+                    reason = "retry_after"
+                    timeout = self._backoff_until - now
+                    timeout += random.uniform(0, self.max_jitter)
+                elif state.active >= self._max_concurrent(request_class, state):
+                    reason = "concurrency"
+                    timeout = None
+                else:
+                    state.refill(now)
+
+                    if state.rate == 0 or state.tokens >= 1:
+                        break
+
+                    reason = "rate"
+                    timeout = (1 - state.tokens) / state.rate
+
+                self._cond.wait(timeout)
+
+                waited = time.monotonic() - now
+                self._throttled_time[request_class] += waited
+                _API_THROTTLED_TIME.inc(waited, request_class, reason)
+
+            state.active += 1
+
+            if state.rate > 0:
+                state.tokens -= 1
+
+    def _on_rate_limit(
+        self, request_class: str, exc: exceptions.RateLimitError
+    ) -> None:
+        _API_RATE_LIMITED.inc(1, request_class)
+
+        retry_after = exc.backoff
+        if retry_after is None:
+            retry_after = self.DEFAULT_RETRY_AFTER
+
+        now = time.monotonic()
+        reason = getattr(exc.error, "reason", None)
+
+        with self._cond:
+            self._backoff_until = max(self._backoff_until, now + retry_after)
+
+            if reason and reason.is_too_many_write_operations():
+                self._serial_writes_until = now + self.SERIAL_WRITES_PERIOD
+
+            self._cond.notify_all()
+
+
+class _HTTPSConnection(HTTPSConnection):
+    """HTTPS connection which counts TLS handshakes and records when it was last
+    returned to its pool."""
+
+    last_used = 0.0
+
+    def connect(self) -> None:
+        super().connect()
+        _TLS_HANDSHAKES.inc(1, self.host)
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    """
+    HTTPS connection pool which counts reused connections and closes connections which
+    have been idle for longer than :attr:`idle_timeout` instead of reusing them. Servers
+    and NAT gateways may silently drop such connections, such that requests over them
+    fail or hang until they time out.
+    """
+
+    ConnectionCls = _HTTPSConnection
+
+    idle_timeout = 60.0
+    """Time in seconds after which idle connections are closed."""
+
+    def _is_idle(self, conn: Any, now: float) -> bool:
+        return (
+            isinstance(conn, _HTTPSConnection)
+            and conn.sock is not None
+            and now - conn.last_used > self.idle_timeout
+        )
+
+    def _get_conn(self, timeout: float | None = None) -> Any:
+        conn = super()._get_conn(timeout)
+
+        if self._is_idle(conn, time.monotonic()):
+            conn.close()
+            _IDLE_CONNECTIONS_CLOSED.inc(1, self.host)
+
+        reused = getattr(conn, "sock", None) is not None
+        _HTTP_REQUESTS.inc(1, self.host, "reused" if reused else "new")
+
+        return conn
+
+    def _put_conn(self, conn: Any) -> None:
+        if isinstance(conn, _HTTPSConnection):
+            conn.last_used = time.monotonic()
+
+        super()._put_conn(conn)
+
+    def close_idle_connections(self) -> int:
+        """
+        Closes pooled connections which have been idle for longer than
+        :attr:`idle_timeout`. They are replaced by new connections when needed.
+
+        :returns: Number of closed connections.
+        """
+        pool = self.pool
+
+        if pool is None:
+            return 0
+
+        now = time.monotonic()
+        n_closed = 0
+
+        with pool.mutex:
+            for conn in pool.queue:
+                if self._is_idle(conn, now):
+                    conn.close()
+                    n_closed += 1
+
+        _IDLE_CONNECTIONS_CLOSED.inc(n_closed, self.host)
+
+        return n_closed
+
+
+def _create_session(max_connections: int) -> requests.Session:
+    """
+    Creates a requests session for the Dropbox SDK whose HTTPS connection pools keep up
+    to ``max_connections`` connections to each host. Connections which are released
+    when a pool is full are closed instead of being reused, such that a pool must hold
+    as many connections as there may be concurrent requests to avoid repeated TLS
+    handshakes.
+
+    :param max_connections: Maximum number of connections to keep for each host.
+    :returns: Requests session.
+    """
+    session = create_session(max_connections=max_connections)
+    adapter = cast(HTTPAdapter, session.get_adapter("https://"))
+    adapter.poolmanager.pool_classes_by_scheme = {
+        **adapter.poolmanager.pool_classes_by_scheme,
+        "https": _HTTPSConnectionPool,
+    }
+    return session
+
 
 def get_hash(data: bytes) -> str:
     hasher = DropboxContentHasher()
@@ -105,6 +473,8 @@ def get_hash(data: bytes) -> str:
 
 
 class _DropboxSDK(Dropbox):
+    _scheduler: RequestScheduler | None = None
+
     def request_json_string(
         self,
         host: str,
@@ -114,6 +484,34 @@ class _DropboxSDK(Dropbox):
         auth_type: str,
         request_binary: bytes | Iterator[bytes] | None,
         timeout: float | None = None,
+        extra_headers: dict[str, str] | None = None,
+    ) -> RouteResult | RouteErrorResult:
+        with (
+            self._scheduler.request(func_name) if self._scheduler else nullcontext(),
+            _API_REQUEST_DURATION.time(func_name),
+            tracing.tracer.leaf_span(func_name, "api"),
+        ):
+            return self._request_json_string(
+                host,
+                func_name,
+                route_style,
+                request_json_arg,
+                auth_type,
+                request_binary,
+                timeout,
+                extra_headers,
+            )
+
+    def _request_json_string(
+        self,
+        host: str,
+        func_name: str,
+        route_style: str,
+        request_json_arg: bytes,
+        auth_type: str,
+        request_binary: bytes | Iterator[bytes] | None,
+        timeout: float | None = None,
+        extra_headers: dict[str, str] | None = None,
     ) -> RouteResult | RouteErrorResult:
         # Custom handling to allow for streamed and chunked uploads. This is mostly
         # reproduced from the parent function but without limiting the request body
@@ -135,6 +533,9 @@ class _DropboxSDK(Dropbox):
             if self._headers:
                 headers.update(self._headers)
 
+            if extra_headers:
+                headers.update(extra_headers)
+
             headers["Content-Type"] = "application/octet-stream"
             headers["Dropbox-API-Arg"] = request_json_arg
             body = request_binary
@@ -162,6 +563,8 @@ class _DropboxSDK(Dropbox):
             return RouteResult(raw_resp)
 
         else:
+            # Only pass extra headers if given, older SDK versions do not accept them.
+            kwargs = {"extra_headers": extra_headers} if extra_headers else {}
             return super().request_json_string(
                 host,
                 func_name,
@@ -170,6 +573,7 @@ class _DropboxSDK(Dropbox):
                 auth_type,
                 request_binary,
                 timeout,
+                **kwargs,
             )
 
 
@@ -184,6 +588,12 @@ class DropboxClient:
     errors will be caught and reraised as a subclass of
     :exc:`maestral.exceptions.MaestralApiError`.
 
+    API requests from all threads are coordinated by a :class:`RequestScheduler` which
+    limits their concurrency and rate and backs off when Dropbox reports rate limits.
+    The connection pool of the default session is sized to hold a connection for each
+    request which may run concurrently, such that connections are reused instead of
+    being discarded and opened again.
+
     This class can be used as a context manager to clean up any network resources from
     the API requests.
 
@@ -197,11 +607,14 @@ class DropboxClient:
     :param config_name: Name of config file and state file to use.
     :param timeout: Timeout for individual requests. Defaults to 100 sec if not given.
     :param session: Optional requests session to use. If not given, a new session will
-        be created with :func:`dropbox.dropbox_client.create_session`.
+        be created with :func:`dropbox.dropbox_client.create_session` and a connection
+        pool size which matches the maximum number of concurrent requests.
     :param bandwidth_limit_up: Maximum bandwidth to use for uploads in bytes/sec. Will
         be enforced over all concurrent uploads (0 = unlimited).
     :param bandwidth_limit_down: Maximum bandwidth to use for downloads in bytes/sec.
         Will be enforced over all concurrent downloads (0 = unlimited).
+    :param max_parallel_uploads: Maximum number of concurrent uploads.
+    :param max_parallel_downloads: Maximum number of concurrent downloads.
     """
 
     SDK_VERSION: str = "2.0"
@@ -222,6 +635,8 @@ class DropboxClient:
         session: requests.Session | None = None,
         bandwidth_limit_up: float = 0,
         bandwidth_limit_down: float = 0,
+        max_parallel_uploads: int = 6,
+        max_parallel_downloads: int = 6,
     ) -> None:
         self.config_name = config_name
         self._auth_flow: DropboxOAuth2FlowNoRedirect | None = None
@@ -233,8 +648,15 @@ class DropboxClient:
         self._dropbox_sdk_logger.info = self._dropbox_sdk_logger.debug  # type: ignore
 
         self._timeout = timeout
-        self._session = session or create_session()
         self._backoff_until = 0
+        self.scheduler = RequestScheduler(
+            {TRANSFER: (max_parallel_uploads + max_parallel_downloads, 0.0)}
+        )
+        # Downloads hold on to their connection while streaming the response body,
+        # after the request has been released by the scheduler.
+        self._session = session or _create_session(
+            self.scheduler.max_concurrent + max_parallel_downloads
+        )
         self._dbx: _DropboxSDK | None = None
         self._dbx_base: _DropboxSDK | None = None
         self._cached_account_info: FullAccount | None = None
@@ -267,8 +689,10 @@ class DropboxClient:
         finally:
             self._num_uploads -= 1
 
-    def _throttled_download_iter(self, iterator: Iterator[T]) -> Iterator[T]:
+    def _throttled_download_iter(self, iterator: Iterator[bytes]) -> Iterator[bytes]:
         for i in iterator:
+            _TRANSFERRED_BYTES.inc(len(i), "down")
+
             if self.bandwidth_limit_down == 0:
                 yield i
             else:
@@ -290,6 +714,8 @@ class DropboxClient:
             yield data[pos : pos + self.upload_chunk_size]
             tock = time.monotonic()
 
+            _TRANSFERRED_BYTES.inc(min(self.upload_chunk_size, len(data) - pos), "up")
+
             pos += self.upload_chunk_size
 
             if self.bandwidth_limit_up > 0:
@@ -518,6 +944,10 @@ class DropboxClient:
         self.dbx._logger = self._dropbox_sdk_logger
         self.dbx_base._logger = self._dropbox_sdk_logger
 
+        # Schedule requests of both SDK instances together.
+        self.dbx._scheduler = self.scheduler
+        self.dbx_base._scheduler = self.scheduler
+
     @property
     def account_info(self) -> FullAccount:
         """Returns cached account info. Use :meth:`get_account_info` to get the latest
@@ -549,6 +979,53 @@ class DropboxClient:
         if self._dbx:
             self._dbx.close()
 
+    def warm_up_connections(self, n_connections: int = 4, timeout: float = 10) -> None:
+        """
+        Opens connections to the Dropbox API and content servers before they are needed,
+        such that the first requests do not wait for TLS handshakes. Connections are
+        kept in the pool of the session. Connection errors are logged and otherwise
+        ignored.
+
+        :param n_connections: Number of connections to open to each server.
+        :param timeout: Timeout in seconds for each connection.
+        """
+        urls = [f"https://{host}/" for host in (API_HOST, API_CONTENT_HOST)]
+        urls *= n_connections
+
+        def connect(url: str) -> None:
+            try:
+                self._session.head(url, timeout=timeout)
+            except OSError as exc:
+                self._logger.debug("Could not connect to %s: %s", url, exc)
+
+        with ThreadPoolExecutor(
+            max_workers=len(urls), thread_name_prefix="maestral-connect"
+        ) as executor:
+            executor.map(connect, urls)
+
+    def close_idle_connections(self) -> int:
+        """
+        Closes pooled connections which have not been used for a minute. Only
+        connections of the default session are closed, not those of a session which was
+        passed to the client.
+
+        :returns: Number of closed connections.
+        """
+        adapter = self._session.get_adapter("https://")
+        poolmanager = getattr(adapter, "poolmanager", None)
+
+        if poolmanager is None:
+            return 0
+
+        n_closed = 0
+
+        for key in poolmanager.pools.keys():
+            pool = poolmanager.pools.get(key)
+            if isinstance(pool, _HTTPSConnectionPool):
+                n_closed += pool.close_idle_connections()
+
+        return n_closed
+
     def __enter__(self) -> DropboxClient:
         return self
 
@@ -584,6 +1061,7 @@ class DropboxClient:
         path_root = common.PathRoot.root(root_nsid)
         self._dbx = self.dbx_base.with_path_root(path_root)
         self.dbx._logger = self._dropbox_sdk_logger
+        self.dbx._scheduler = self.scheduler
 
         if isinstance(root_info, UserRootInfo):
             actual_root_type = "user"
@@ -29,11 +29,15 @@ DEFAULTS_CONFIG: _DefaultsType = {
     "app": {
         "notification_level": 15,  # desktop notification level, default: FILECHANGE
         "log_level": 20,  # log level for journal and file, default: INFO
+        "log_format": "text",  # format of log file and stderr, "text" or "json"
         "update_notification_interval": 60 * 60 * 24 * 7,  # default: weekly
         "bandwidth_limit_up": 0.0,  # upload limit in bytes / sec (0 = unlimited)
         "bandwidth_limit_down": 0.0,  # download limit in bytes / sec (0 = unlimited)
         "max_parallel_uploads": 6,  # max number of parallel downloads
         "max_parallel_downloads": 6,  # max number of parallel downloads
+        "metrics_enabled": False,  # if performance metrics are collected
+        "metrics_textfile": "",  # file to export metrics to in Prometheus format
+        "trace_sample_rate": 0.0,  # fraction of sync cycles to trace (0 = disabled)
     },
     "sync": {
         "path": "",  # dropbox folder location
@@ -42,6 +46,7 @@ DEFAULTS_CONFIG: _DefaultsType = {
         "keep_history": 60 * 60 * 24 * 7,  # default: one week
         "upload": True,  # if download sync is enabled
         "download": True,  # if upload sync is enabled
+        "indexing_shards": 4,  # number of concurrent listings for initial indexing
     },
 }
 
@@ -68,7 +73,7 @@ DEFAULTS_STATE: _DefaultsType = {
         "indexing_counter": 0,  # counter for indexing progress between restarts
         "did_finish_indexing": False,  # indicates completed indexing
         "pending_uploads": [],  # incomplete uploads to retry on next sync
-        "pending_downloads": [],  # incomplete downloads to retry on next sync
+        "pending_downloads": [],  # deprecated, now stored in the sync database
     },
 }
 
@@ -89,6 +94,10 @@ for section_name, section_values in DEFAULTS_CONFIG.items():
 # 3. You don't need to touch this value if you're just adding a new option
 CONF_VERSION = Version("20.0")
 
+# Interval in seconds at which changes to the sync state are saved. The state is
+# updated frequently during sync, for instance after every page of remote changes.
+STATE_FLUSH_INTERVAL = 5.0
+
 
 # =============================================================================
 # Factories
@@ -100,6 +109,7 @@ def _get_conf(
     config_path: str,
     defaults: _DefaultsType,
     registry: dict[str, UserConfig],
+    flush_interval: float = 0.0,
 ) -> UserConfig:
     try:
         conf = registry[config_name]
@@ -110,6 +120,7 @@ def _get_conf(
                 defaults=defaults,
                 version=CONF_VERSION,
                 backup=True,
+                flush_interval=flush_interval,
             )
         except OSError:
             conf = UserConfig(
@@ -118,6 +129,7 @@ def _get_conf(
                 version=CONF_VERSION,
                 backup=True,
                 load=False,
+                flush_interval=flush_interval,
             )
 
         registry[config_name] = conf
@@ -152,8 +164,16 @@ def MaestralState(config_name: str) -> UserConfig:
 
     :param config_name: Name of maestral configuration to run. A new state file will
         be created if none exists for the given config_name.
-    :return: Maestral state instance which saves any changes to the drive.
+    :return: Maestral state instance which saves any changes to the drive. Changes
+        are saved every :data:`STATE_FLUSH_INTERVAL` seconds or when calling
+        :meth:`UserConfig.flush`.
     """
     with _state_lock:
         state_path = get_data_path(CONFIG_DIR_NAME, f"{config_name}.state")
-        return _get_conf(config_name, state_path, DEFAULTS_STATE, _state_instances)
+        return _get_conf(
+            config_name,
+            state_path,
+            DEFAULTS_STATE,
+            _state_instances,
+            flush_interval=STATE_FLUSH_INTERVAL,
+        )
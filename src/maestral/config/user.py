@@ -11,14 +11,16 @@ config module of the Spyder IDE.
 from __future__ import annotations
 
 import ast
+import atexit
 import configparser as cp
 import copy
 import logging
 import os
 import os.path as osp
 import shutil
-from threading import RLock
-from typing import Any, Dict, Iterator, MutableSet, TypeVar, Iterable
+from threading import RLock, Timer
+from typing import Any, Dict, Iterator, MutableSet, Tuple, TypeVar, Iterable
+from weakref import WeakValueDictionary
 
 from packaging.version import Version
 
@@ -27,6 +29,9 @@ logger = logging.getLogger(__name__)
 _DefaultsType = Dict[str, Dict[str, Any]]
 _T = TypeVar("_T")
 
+# Values of these types are returned from the cache without copying.
+_IMMUTABLE_TYPES = (str, int, float, bool, bytes, type(None))
+
 # =============================================================================
 # Auxiliary classes
 # =============================================================================
@@ -67,11 +72,27 @@ class DefaultsConfig(cp.ConfigParser):
         super().set(section, option, value)
 
     def save(self) -> None:
-        """Save config into the associated file."""
+        """
+        Save config into the associated file. The file is replaced atomically, such that
+        an interrupted write never leaves a partially written file behind.
+        """
         os.makedirs(self._dirname, exist_ok=True)
 
-        with open(self.config_path, "w", encoding="utf-8") as configfile:
-            self.write(configfile)
+        tmp_path = f"{self.config_path}.tmp"
+
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as configfile:
+                self.write(configfile)
+                configfile.flush()
+                os.fsync(configfile.fileno())
+
+            os.replace(tmp_path, self.config_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
 
     @property
     def config_path(self) -> str:
@@ -95,6 +116,10 @@ class UserConfig(DefaultsConfig):
     :param backup: Whether to create a backup on version changes and on initial setup.
     :param remove_obsolete: If `True`, values that were removed from the configuration
         on version change, are removed from the saved configuration file.
+    :param flush_interval: Interval in seconds at which changes are written to the
+        drive. Multiple changes within this interval are coalesced into a single write.
+        If zero, changes are written immediately. Call :meth:`flush` to write pending
+        changes before the interval has passed.
 
     .. note:: The ``get`` and ``set`` arguments number and type differ from the
         reimplemented methods.
@@ -110,11 +135,19 @@ class UserConfig(DefaultsConfig):
         version: Version = Version("0.0.0"),
         backup: bool = False,
         remove_obsolete: bool = False,
+        flush_interval: float = 0.0,
     ) -> None:
-        super().__init__(path=path)
-
         self._lock = RLock()
 
+        # Parsed values, by section and option.
+        self._values: Dict[Tuple[str, str], Any] = {}
+
+        self._flush_interval = flush_interval
+        self._flush_timer: Timer | None = None
+        self._dirty = False
+
+        super().__init__(path=path)
+
         self._load = load
         self._backup = backup
         self._remove_obsolete = remove_obsolete
@@ -205,11 +238,17 @@ class UserConfig(DefaultsConfig):
         :param path: Path of config file to load.
         """
         with self._lock:
+            self._values.clear()
             try:
                 self.read(path, encoding="utf-8")
             except cp.MissingSectionHeaderError:
                 logger.error("File contains no section headers.")
 
+    def _set(self, section: str, option: str, value: Any) -> None:
+        with self._lock:
+            super()._set(section, option, value)
+            self._values.pop((section, option), None)
+
     def remove_deprecated_options(self, save: bool = True) -> None:
         """
         Remove options which are present in the file but not in defaults.
@@ -324,6 +363,15 @@ class UserConfig(DefaultsConfig):
         :raises cp.NoOptionError: if the option does not exist and no default is given.
         """
         with self._lock:
+            try:
+                value = self._values[(section, option)]
+            except KeyError:
+                pass
+            else:
+                if type(value) in _IMMUTABLE_TYPES:
+                    return value
+                return copy.deepcopy(value)
+
             if not self.has_section(section):
                 if default is NoDefault:
                     raise cp.NoSectionError(section)
@@ -339,7 +387,6 @@ class UserConfig(DefaultsConfig):
 
             raw_value: str = super().get(section, option, raw=True)
             default_value = self.get_default(section, option)
-            value: Any
 
             if isinstance(default_value, str):
                 value = raw_value
@@ -357,7 +404,11 @@ class UserConfig(DefaultsConfig):
                         f"got {value.__class__.__name__}."
                     )
 
-            return value
+            self._values[(section, option)] = value
+
+            if type(value) in _IMMUTABLE_TYPES:
+                return value
+            return copy.deepcopy(value)
 
     def set_default(self, section: str, option: str, default_value: Any) -> None:
         """
@@ -414,6 +465,7 @@ class UserConfig(DefaultsConfig):
         """
         with self._lock:
             res = super().remove_section(section)
+            self._values.clear()
             if save:
                 self.save()
             return res
@@ -429,13 +481,51 @@ class UserConfig(DefaultsConfig):
         """
         with self._lock:
             res = super().remove_option(section, option)
+            self._values.pop((section, option), None)
             if save:
                 self.save()
             return res
 
+    def save(self) -> None:
+        """
+        Save config into the associated file. If a flush interval is set, the file is
+        written once the interval has passed, together with any other changes made in
+        the meantime.
+        """
+        with self._lock:
+            self._dirty = True
+
+            if self._flush_interval <= 0:
+                self.flush()
+            elif self._flush_timer is None:
+                self._flush_timer = Timer(self._flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+                _pending_flush[id(self)] = self
+
+    def flush(self) -> None:
+        """Write any pending changes to the drive immediately."""
+        with self._lock:
+            if self._flush_timer:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            _pending_flush.pop(id(self), None)
+
+            if self._dirty:
+                super().save()
+                self._dirty = False
+
     def cleanup(self) -> None:
         """Remove files associated with config and reset to defaults."""
         with self._lock:
+            if self._flush_timer:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            _pending_flush.pop(id(self), None)
+            self._dirty = False
+
             self.reset_to_defaults(save=False)
             backup_path = osp.join(self._dirname, self._backup_folder)
 
@@ -455,6 +545,20 @@ class UserConfig(DefaultsConfig):
                             pass
 
 
+# Configs with pending changes, by id. Configs are not hashable.
+_pending_flush: WeakValueDictionary[int, UserConfig] = WeakValueDictionary()
+
+
+@atexit.register
+def _flush_pending() -> None:
+    """Writes pending changes of all configs on exit."""
+    for conf in list(_pending_flush.values()):
+        try:
+            conf.flush()
+        except OSError:
+            logger.error("Could not save %s", conf.config_path, exc_info=True)
+
+
 # ======================================================================================
 # Wrapper classes
 # ======================================================================================
@@ -6,11 +6,13 @@ objects for a running daemon.
 from __future__ import annotations
 
 import argparse
+import dataclasses
 import enum
 import fcntl
 
 # system imports
 import inspect
+import marshal
 import os
 import pickle
 import re
@@ -19,15 +21,29 @@ import struct
 import sys
 import threading
 import time
+from datetime import datetime
 from pprint import pformat
 from shlex import quote
-from types import TracebackType
-from typing import TYPE_CHECKING, Any, ContextManager, Iterable
+from types import TracebackType, UnionType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ContextManager,
+    Iterable,
+    Iterator,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
 
 # external imports
 import Pyro5
 from fasteners import InterProcessLock
+from Pyro5 import serializers
 from Pyro5.api import (
+    BatchProxy,
     Daemon,
     Proxy,
     expose,
@@ -35,10 +51,11 @@ from Pyro5.api import (
     register_dict_to_class,
 )
 from Pyro5.errors import CommunicationError
-from Pyro5.serializers import serpent
+from Pyro5.serializers import MarshalSerializer, serpent
 
 from . import core, exceptions, models
 from .constants import ENV, IS_MACOS
+from .database.orm import Model
 
 # local imports
 from .utils import exc_info_tuple
@@ -64,6 +81,8 @@ __all__ = [
     "start_maestral_daemon_process",
     "stop_maestral_daemon_process",
     "MaestralProxy",
+    "MaestralSerializer",
+    "LocalBatchProxy",
     "CommunicationError",
 ]
 
@@ -115,7 +134,7 @@ class Start(enum.Enum):
     Failed = 2
 
 
-# ==== error serialization =============================================================
+# ==== serialization ===================================================================
 
 
 def check_signature(signature: str, obj: bytes) -> None:
@@ -127,6 +146,12 @@ def serialize_api_types(obj: Any) -> dict[str, Any]:
     :param obj: Object to serialize.
     :returns: Serialized object.
     """
+    schema = _record_schemas.get(type(obj).__name__)
+
+    # Note that the serializer may call us for subclasses of registered types.
+    if schema and schema.klass is type(obj):
+        return schema.to_record(obj)
+
     res = pickle.dumps(obj)
     return {"__class__": type(obj).__name__, "object": res, "signature": ""}
 
@@ -142,17 +167,178 @@ def deserialize_api_types(class_name: str, d: dict[str, Any]) -> Any:
     :param d: Dictionary of serialized class.
     :returns: Deserialized object.
     """
+    if "record" in d:
+        return _record_schemas[class_name].from_record(d["record"])
+
     bytes_message = serpent.tobytes(d["object"])
     check_signature(d["signature"], bytes_message)
     return pickle.loads(bytes_message)
 
 
+class RecordSchema:
+    """Encodes instances of an API type as a list of field values
+
+    This is much more compact and faster than pickling each instance, especially for
+    large lists of objects such as :class:`maestral.models.SyncEvent` or
+    :class:`maestral.core.Metadata`. Only database models and dataclasses with fields
+    of type str, int, float, bool, datetime or Enum are supported.
+
+    :param klass: Database model or dataclass.
+    :raises TypeError: if the class is not supported.
+    """
+
+    def __init__(self, klass: type) -> None:
+        self.klass = klass
+        self.field_names: list[str] = []
+        self._encoders: list[Callable[[Any], Any]] = []
+        self._decoders: list[Callable[[Any], Any] | None] = []
+
+        if issubclass(klass, Model) and getattr(klass, "__columns__", None):
+            # Sort columns for a stable order across processes.
+            for column in sorted(klass.__columns__, key=lambda c: c.name):
+                self.field_names.append(column.name)
+                self._encoders.append(column.type.py_to_sql)
+                self._decoders.append(_sql_decoder(column.type.sql_to_py))
+        elif dataclasses.is_dataclass(klass):
+            try:
+                type_hints = get_type_hints(klass)
+            except Exception as exc:
+                raise TypeError(f"Cannot resolve type hints of {klass}") from exc
+
+            for field in dataclasses.fields(klass):
+                self.field_names.append(field.name)
+                self._encoders.append(_encode_value)
+                self._decoders.append(_decoder_for_hint(type_hints[field.name]))
+        else:
+            raise TypeError(f"Unsupported type {klass}")
+
+    def to_record(self, obj: Any) -> dict[str, Any]:
+        """
+        :param obj: Object to serialize.
+        :returns: Serialized object.
+        """
+        values = []
+
+        for name, encoder in zip(self.field_names, self._encoders):
+            value = getattr(obj, name)
+            values.append(None if value is None else encoder(value))
+
+        return {"__class__": self.klass.__name__, "record": values}
+
+    def from_record(self, values: list[Any]) -> Any:
+        """
+        :param values: Serialized field values.
+        :returns: Deserialized object.
+        """
+        kwargs = {}
+
+        for name, decoder, value in zip(self.field_names, self._decoders, values):
+            if value is not None and decoder:
+                value = decoder(value)
+            kwargs[name] = value
+
+        return self.klass(**kwargs)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    elif isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _sql_decoder(sql_to_py: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def decoder(value: Any) -> Any:
+        # Serpent transmits bytes as base64 encoded dicts.
+        if isinstance(value, dict):
+            value = serpent.tobytes(value)
+        return sql_to_py(value)
+
+    return decoder
+
+
+def _decoder_for_hint(hint: Any) -> Callable[[Any], Any] | None:
+    args = [a for a in get_args(hint) if a is not type(None)]
+
+    if get_origin(hint) in (Union, UnionType) and len(args) == 1:
+        hint = args[0]
+
+    if hint in (str, int, float, bool):
+        return None
+    elif hint is datetime:
+        return datetime.fromisoformat
+    elif isinstance(hint, type) and issubclass(hint, enum.Enum):
+        return hint
+
+    raise TypeError(f"Unsupported field type {hint}")
+
+
+_record_schemas: dict[str, RecordSchema] = {}
+
 for module in core, models, exceptions:
     for klass_name, klass in inspect.getmembers(module, inspect.isclass):
+        try:
+            _record_schemas[klass_name] = RecordSchema(klass)
+        except TypeError:
+            pass
+
         register_class_to_dict(klass, serialize_api_types)
         register_dict_to_class(klass_name, deserialize_api_types)
 
 
+class MaestralSerializer(MarshalSerializer):
+    """Binary serializer for communication between the daemon and its clients
+
+    This uses the :mod:`marshal` format with API types encoded as compact records,
+    see :class:`RecordSchema`. This is considerably faster than the default serpent
+    serializer which transmits bytes as base64 encoded strings. The serializer is
+    registered with Pyro so that the daemon will respond in the format of the request.
+    """
+
+    serializer_id = 42
+
+    def dumpsCall(
+        self, obj: str, method: str, vargs: Iterable[Any], kwargs: dict[str, Any] | None
+    ) -> bytes:
+        args = self.convert_obj_into_marshallable(list(vargs))
+        kwds = self.convert_obj_into_marshallable(kwargs or {})
+        return marshal.dumps((obj, method, args, kwds))
+
+    def convert_obj_into_marshallable(self, obj: Any) -> Any:
+        t = type(obj)
+
+        if t in (str, int, float, bool, bytes) or obj is None:
+            return obj
+        elif t is list:
+            return [self.convert_obj_into_marshallable(v) for v in obj]
+        elif t is tuple:
+            return tuple(self.convert_obj_into_marshallable(v) for v in obj)
+        elif t is dict:
+            return {k: self.convert_obj_into_marshallable(v) for k, v in obj.items()}
+        elif t in (set, frozenset):
+            items = [self.convert_obj_into_marshallable(v) for v in obj]
+            try:
+                return t(items)
+            except TypeError:
+                # Items which are not hashable after conversion.
+                return items
+
+        res = super().convert_obj_into_marshallable(obj)
+
+        if type(res) is dict:
+            return self.convert_obj_into_marshallable(res)
+
+        return res
+
+
+SERIALIZER = "maestral"
+
+_serializer = MaestralSerializer()
+serializers.serializers[SERIALIZER] = _serializer
+serializers.serializers_by_id[_serializer.serializer_id] = _serializer
+
+
 # ==== interprocess locking ============================================================
 
 
@@ -593,6 +779,33 @@ def stop_maestral_daemon_process(
     return Stop.Killed
 
 
+class LocalBatchProxy:
+    """Records method calls for a local Maestral instance
+
+    This has the same interface as Pyro's :class:`Pyro5.api.BatchProxy` and is used by
+    :meth:`MaestralProxy.batch` when falling back to a local instance.
+
+    :param m: Maestral instance.
+    """
+
+    def __init__(self, m: Maestral) -> None:
+        self._m = m
+        self._calls: list[tuple[str, tuple[Any, ...], dict[str, Any]]] = []
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        def record_call(*args: Any, **kwargs: Any) -> None:
+            self._calls.append((name, args, kwargs))
+
+        return record_call
+
+    def __call__(self) -> Iterator[Any]:
+        calls = self._calls
+        self._calls = []
+
+        for name, args, kwargs in calls:
+            yield getattr(self._m, name)(*args, **kwargs)
+
+
 class MaestralProxy(ContextManager["MaestralProxy"]):
     """A Proxy to the Maestral daemon
 
@@ -638,6 +851,7 @@ class MaestralProxy(ContextManager["MaestralProxy"]):
             sys.excepthook = Pyro5.errors.excepthook
 
             self._m = Proxy(URI.format(config_name, "./u:" + sock_name))
+            self._m._pyroSerializer = SERIALIZER
             try:
                 self._m._pyroBind()
             except CommunicationError:
@@ -657,6 +871,29 @@ class MaestralProxy(ContextManager["MaestralProxy"]):
         if isinstance(self._m, Proxy):
             self._m._pyroRelease()
 
+    def batch(self) -> BatchProxy | LocalBatchProxy:
+        """
+        Returns a proxy to batch multiple method calls into a single request to the
+        daemon. Call methods on the returned object to record them, then call the
+        object itself to send all calls at once. This returns a generator with the
+        result of each call, in order. Any exception raised by a call will be raised
+        when its result is retrieved and stops processing of subsequent calls.
+
+        :Example:
+
+            >>> with MaestralProxy() as m:
+            ...     batch = m.batch()
+            ...     batch.get_file_status("/Users/sam/Dropbox/file1.txt")
+            ...     batch.get_file_status("/Users/sam/Dropbox/file2.txt")
+            ...     status1, status2 = batch()
+
+        :returns: Batch proxy.
+        """
+        if isinstance(self._m, Proxy):
+            return BatchProxy(self._m)
+        else:
+            return LocalBatchProxy(self._m)
+
     def __enter__(self) -> MaestralProxy:
         return self
 
@@ -5,7 +5,18 @@ This model defines our core SQLite database interface.
 from __future__ import annotations
 
 import sqlite3
-from typing import Any
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Iterator
+
+from .. import metrics
+
+_QUERY_DURATION = metrics.registry.histogram(
+    "maestral_db_query_duration_seconds",
+    "Duration of SQLite statements by statement type.",
+    ("statement",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1, 1.0),
+)
 
 
 class Database:
@@ -14,6 +25,7 @@ class Database:
     def __init__(self, connection: sqlite3.Connection) -> None:
         connection.row_factory = sqlite3.Row
         self.connection = connection
+        self._transaction_depth = 0
 
     def close(self) -> None:
         """Closes the SQL connection."""
@@ -27,9 +39,45 @@ class Database:
         :param args: Parameters to substitute for placeholders in SQL statement.
         :returns: The created cursor.
         """
+        if not _QUERY_DURATION.enabled:
+            return self._execute(sql, args)
+
+        start = perf_counter()
+        cursor = self._execute(sql, args)
+        statement = sql.lstrip().partition(" ")[0].upper()
+        _QUERY_DURATION.observe(perf_counter() - start, statement)
+
+        return cursor
+
+    def _execute(self, sql: str, args: tuple[Any, ...]) -> sqlite3.Cursor:
+        if self._transaction_depth > 0:
+            return self.connection.execute(sql, args)
+
         with self.connection:
             return self.connection.execute(sql, args)
 
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        A context manager which groups all statements executed within its context into
+        a single transaction. Changes are committed when leaving the outermost context
+        and rolled back if an exception is raised. This is considerably faster than
+        committing each statement individually when inserting or deleting many rows.
+        """
+        self._transaction_depth += 1
+
+        try:
+            yield
+        except BaseException:
+            if self._transaction_depth == 1:
+                self.connection.rollback()
+            raise
+        else:
+            if self._transaction_depth == 1:
+                self.connection.commit()
+        finally:
+            self._transaction_depth -= 1
+
     def executescript(self, script: str) -> None:
         """
         Creates a cursor and executes the given SQL script.
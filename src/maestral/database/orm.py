@@ -257,6 +257,12 @@ class Manager(Generic[M]):
                 sql = f"CREATE INDEX IF NOT EXISTS {idx_name} ON {self.table_name} ({column.name});"
                 self.db.executescript(sql)
 
+        for name, expressions in self.model.__indexes__.items():
+            table_name_stripped = self.table_name.strip("'\"")
+            idx_name = f"idx_{table_name_stripped}_{name}"
+            sql = f"CREATE INDEX IF NOT EXISTS {idx_name} ON {self.table_name} ({expressions});"
+            self.db.executescript(sql)
+
         self._did_create_table = True
 
     def clear_cache(self) -> None:
@@ -363,17 +369,16 @@ class Manager(Generic[M]):
         """
         pk_sql = self._get_primary_key(obj)
 
-        if self.has(pk_sql):
+        if pk_sql is not None and self.has(pk_sql):
             raise ValueError(f"Object with primary key {pk_sql} is already registered")
 
         sql_values = (col.py_to_sql(getattr(obj, col.name)) for col in self._columns)
 
-        self.db.execute(self._sql_insert_template, *sql_values)
+        cursor = self.db.execute(self._sql_insert_template, *sql_values)
 
         if pk_sql is None:
-            # Round trip to fetch created primary key.
-            res = self.db.execute("SELECT last_insert_rowid()").fetchone()
-            pk_sql = res["last_insert_rowid()"]
+            # The created primary key is the rowid of the inserted row.
+            pk_sql = cursor.lastrowid
             pk_py = self.pk_column.sql_to_py(pk_sql)
             setattr(obj, self.pk_column.name, pk_py)
 
@@ -456,8 +461,7 @@ class ModelBase(type):
         # Add __columns__ attribute to namespace.
         namespace["__columns__"] = frozenset(columns)
 
-        # Add slots to namespace if we have declared columns. Otherwise, don't set slots
-        # because this prevents subclasses from having weakrefs.
+        # Add slots to namespace if we have declared columns.
         if slots:
             namespace["__slots__"] = slots
 
@@ -476,12 +480,22 @@ class Model(metaclass=ModelBase):
     to use. The ``__columns__`` attribute will be populated automatically for you.
     """
 
+    # Only allow weak references in addition to the slots which are created for columns
+    # by ModelBase. This avoids the memory overhead of an instance dictionary.
+    __slots__ = ("__weakref__",)
+
     __tablename__: str
     """The name of the database table"""
 
     __columns__: frozenset[Column[Any, Any]]
     """The columns of the database table"""
 
+    __indexes__: dict[str, str] = {}
+    """
+    Additional indexes of the database table by name, given as comma separated lists
+    of columns or expressions. Columns with ``index=True`` are indexed automatically.
+    """
+
     def __init__(self, **kwargs: Any) -> None:
         """
         Initialise with keyword arguments corresponding to column names and values.
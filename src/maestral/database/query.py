@@ -6,7 +6,7 @@ queries.
 from __future__ import annotations
 
 import os
-from typing import TYPE_CHECKING, Any, Iterator, Sequence
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Sequence
 
 from .types import SqlPath
 
@@ -57,9 +57,14 @@ class PathTreeQuery(Query):
         self.file_blob = os.fsencode(path)
         self.dir_blob = os.path.join(self.file_blob, b"")
 
+        # All children sort between "{path}/" and "{path}0" because "0" directly
+        # follows "/". Expressing the subtree as a range allows using an index.
+        self.dir_blob_end = self.dir_blob[:-1] + b"0"
+
     def clause(self) -> tuple[str, Sequence[Any]]:
-        query_part = f"({self.column.name} = ? OR substr({self.column.name}, 1, ?) = ?)"
-        args = (self.file_blob, len(self.dir_blob), self.dir_blob)
+        name = self.column.name
+        query_part = f"({name} = ? OR ({name} >= ? AND {name} < ?))"
+        args = (self.file_blob, self.dir_blob, self.dir_blob_end)
 
         return query_part, args
 
@@ -81,6 +86,30 @@ class MatchQuery(Query):
         return f"{self.column.name} = ?", args
 
 
+class InQuery(Query):
+    """
+    Query to match any of the given values.
+
+    :param column: Column to match.
+    :param values: Values to match. Note that SQLite limits the number of parameters in
+        a single statement, callers should split large collections into chunks.
+    """
+
+    def __init__(self, column: Column[Any, Any], values: Iterable[Any]):
+        self.column = column
+        self.values = values
+
+    def clause(self) -> tuple[str, Sequence[Any]]:
+        args = tuple(self.column.py_to_sql(value) for value in self.values)
+
+        if len(args) == 0:
+            # Note: Use "0" instead of "FALSE" for compatibility with older SQLite.
+            return "0", ()
+
+        placeholders = ", ".join(["?"] * len(args))
+        return f"{self.column.name} IN ({placeholders})", args
+
+
 class AllQuery(Query):
     """
     Query to match everything.
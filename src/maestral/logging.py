@@ -3,13 +3,18 @@
 from __future__ import annotations
 
 import concurrent.futures
+import copy
+import json
 import logging
 import os
+import queue
+import threading
 import time
 from collections import deque
 from concurrent.futures import Future, InvalidStateError
-from logging.handlers import RotatingFileHandler
-from typing import Sequence
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Sequence
 
 from .config import MaestralConfig
 from .utils import sanitize_string
@@ -20,11 +25,15 @@ __all__ = [
     "AwaitableHandler",
     "CachedHandler",
     "SdNotificationHandler",
+    "QueueingHandler",
+    "JsonFormatter",
     "EncodingSafeLogRecord",
     "scoped_logger",
     "scoped_logger_name",
     "LOG_FMT_LONG",
     "LOG_FMT_SHORT",
+    "LOG_FMT_JSON",
+    "LOG_FORMATS",
     "setup_logging",
 ]
 
@@ -35,6 +44,50 @@ LOG_FMT_LONG = logging.Formatter(
 LOG_FMT_SHORT = logging.Formatter(fmt="%(message)s")
 
 
+class JsonFormatter(logging.Formatter):
+    """Formats records as JSON objects on a single line
+
+    This is useful to ingest logs into log processing systems. Each object contains
+    the time in ISO 8601 format, the level, logger, module and thread name and the
+    message. The traceback and stack are included if present.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Formats the specified record as JSON object.
+
+        :param record: Log record.
+        :returns: JSON string without line breaks.
+        """
+        created = datetime.fromtimestamp(record.created, timezone.utc)
+
+        data: dict[str, Any] = {
+            "time": created.isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+
+        return json.dumps(data, ensure_ascii=False)
+
+
+LOG_FMT_JSON = JsonFormatter()
+
+LOG_FORMATS = {"text": LOG_FMT_LONG, "json": LOG_FMT_JSON}
+"""Formatters for log files and stderr by name of the format."""
+
+
 class EncodingSafeLogRecord(logging.LogRecord):
     """A log record which ensures that messages contain only unicode characters
 
@@ -178,6 +231,82 @@ class SdNotificationHandler(logging.Handler):
         self.notifier.notify(f"STATUS={record.getMessage()}")
 
 
+class _QueueListener(QueueListener):
+    """Queue listener which handles flush requests in its queue."""
+
+    def handle(self, record: Any) -> None:
+        if isinstance(record, threading.Event):
+            record.set()
+        else:
+            super().handle(record)
+
+
+class QueueingHandler(QueueHandler):
+    """Handler which passes records to other handlers in a background thread
+
+    Logging therefore never blocks on I/O, such as writing to log files or the systemd
+    journal, and threads which log concurrently do not wait for each other. Messages
+    and tracebacks are formatted before queuing, in the thread which logs the record.
+    Records are passed to a handler only if they meet its level.
+
+    :param handlers: Handlers to pass records to.
+    """
+
+    def __init__(self, handlers: Sequence[logging.Handler]) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.handlers = handlers
+        self._listener = _QueueListener(
+            self.queue, *handlers, respect_handler_level=True
+        )
+        self._listener.start()
+        self._closed = False
+        self._closed_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Formats the message and traceback of a record such that it can be pickled and
+        handled later, when its arguments may have changed.
+
+        :param record: Log record.
+        :returns: Copy of the log record with formatted message.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = LOG_FMT_SHORT.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def flush(self) -> None:
+        """Blocks until all queued records have been handled."""
+        handled = threading.Event()
+
+        with self._closed_lock:
+            if self._closed:
+                return
+
+            self.queue.put_nowait(handled)
+
+        handled.wait()
+
+    def close(self) -> None:
+        """Handles all queued records, stops the background thread and closes the
+        handlers which records are passed to."""
+        with self._closed_lock:
+            if not self._closed:
+                self._closed = True
+                self._listener.stop()
+
+                for handler in self.handlers:
+                    handler.close()
+
+        super().close()
+
+
 def scoped_logger_name(module_name: str, config_name: str = "maestral") -> str:
     """
     Returns a logger name for the module ``module_name``, scoped to the given config.
@@ -212,7 +341,8 @@ def setup_logging(
 ) -> Sequence[logging.Handler]:
     """
     Set up loging to external channels. Systemd-related logging will fail silently if
-    the current process was not started by systemd.
+    the current process was not started by systemd. Records are passed to all channels
+    in a background thread by a :class:`QueueingHandler` on the root logger.
 
     :param config_name: Config name to determine log level and namespace for loggers.
         See :meth:`scoped_logger_name` for how the logger name is determined.
@@ -221,9 +351,11 @@ def setup_logging(
     :param journal: Whether to log to the systemd journal.
     :param status: Whether to log to the systemd status notifier. Note that this will
         always be performed at level INFO.
-    :returns: Log handlers.
+    :returns: Log handlers for each channel.
     """
-    level = MaestralConfig(config_name).get("app", "log_level")
+    conf = MaestralConfig(config_name)
+    level = conf.get("app", "log_level")
+    formatter = LOG_FORMATS.get(conf.get("app", "log_format"), LOG_FMT_LONG)
     root_logger = scoped_logger("maestral", config_name)
     root_logger.setLevel(min(level, logging.INFO))
 
@@ -233,9 +365,8 @@ def setup_logging(
     if file:
         logfile = get_log_path("maestral", f"{config_name}.log")
         log_handler_file = RotatingFileHandler(logfile, maxBytes=10**7, backupCount=1)
-        log_handler_file.setFormatter(LOG_FMT_LONG)
+        log_handler_file.setFormatter(formatter)
         log_handler_file.setLevel(level)
-        root_logger.addHandler(log_handler_file)
         handlers.append(log_handler_file)
 
     # Log to systemd journal when launched as systemd service.
@@ -248,7 +379,6 @@ def setup_logging(
             log_handler_journal = JournalHandler(SYSLOG_IDENTIFIER="maestral")
             log_handler_journal.setFormatter(LOG_FMT_SHORT)
             log_handler_journal.setLevel(level)
-            root_logger.addHandler(log_handler_journal)
             handlers.append(log_handler_journal)
 
     # Log to systemd notify status when launched as systemd service.
@@ -256,15 +386,16 @@ def setup_logging(
         log_handler_sd = SdNotificationHandler()
         log_handler_sd.setFormatter(LOG_FMT_SHORT)
         log_handler_sd.setLevel(logging.INFO)
-        root_logger.addHandler(log_handler_sd)
         handlers.append(log_handler_sd)
 
     # Log to stderr if requested.
     if stderr:
         log_handler_stream = logging.StreamHandler()
-        log_handler_stream.setFormatter(LOG_FMT_LONG)
+        log_handler_stream.setFormatter(formatter)
         log_handler_stream.setLevel(level)
-        root_logger.addHandler(log_handler_stream)
         handlers.append(log_handler_stream)
 
+    if handlers:
+        root_logger.addHandler(QueueingHandler(handlers))
+
     return handlers
@@ -5,6 +5,7 @@ from __future__ import annotations
 import asyncio
 import difflib
 import gc
+import itertools
 import logging
 import mimetypes
 
@@ -15,10 +16,11 @@ import random
 import shutil
 import sqlite3
 import tempfile
+import threading
 import time
 from asyncio import AbstractEventLoop, Future
 from datetime import datetime, timezone
-from typing import Any, Collection, Iterator, Sequence
+from typing import Any, Collection, Iterable, Iterator, Sequence
 
 # external imports
 import requests
@@ -31,7 +33,7 @@ except ImportError:
     journal = None
 
 # local imports
-from . import __version__
+from . import __version__, metrics, tracing
 from .client import DropboxClient
 from .config import MaestralConfig, MaestralState, validate_config_name
 from .constants import (
@@ -69,20 +71,22 @@ from .exceptions import (
 from .keyring import CredentialStorage
 from .logging import (
     LOG_FMT_SHORT,
+    LOG_FORMATS,
     AwaitableHandler,
     CachedHandler,
     scoped_logger,
     setup_logging,
 )
 from .manager import SyncManager
-from .models import SyncErrorEntry, SyncEvent, SyncStatus
+from .models import ActivityUpdate, SyncErrorEntry, SyncEvent
 from .notify import MaestralDesktopNotifier
-from .sync import SyncDirection, SyncEngine, pf_repr
+from .profiling import Profiler, create_profiler
+from .sync import ActivityNode, ActivitySubscription, SyncEngine, pf_repr
 from .utils import get_newer_version
-from .utils.appdirs import get_cache_path, get_data_path
+from .utils.appdirs import get_cache_path, get_data_path, get_log_path
 from .utils.path import (
+    PathTrie,
     delete,
-    is_child,
     is_equal_or_child,
     isdir,
     normalize,
@@ -91,6 +95,8 @@ from .utils.path import (
 
 __all__ = ["Maestral"]
 
+_ACTIVITY_SUBSCRIPTION_TIMEOUT = 10 * 60
+
 
 def _sql_add_column(db: Database, table: str, column: str, affinity: str) -> None:
     try:
@@ -108,6 +114,20 @@ def _sql_drop_table(db: Database, table: str) -> None:
         pass
 
 
+def _activity_status(node: ActivityNode) -> FileStatus:
+    # Return effective status of item and its children. Syncing items take precedence
+    # over Failed which take precedence over Synced. Note that Up and Down are mutually
+    # exclusive because they are performed in alternating cycles.
+    if node.num_uploading > 0:
+        return FileStatus.Uploading
+    elif node.num_downloading > 0:
+        return FileStatus.Downloading
+    elif node.num_failed > 0:
+        return FileStatus.Error
+
+    return FileStatus.Synced
+
+
 # ======================================================================================
 # Main API
 # ======================================================================================
@@ -180,6 +200,10 @@ class Maestral:
         self._log_to_stderr = log_to_stderr
         self._root_logger = scoped_logger("maestral", self.config_name)
         self._root_logger.setLevel(min(self.log_level, logging.INFO))
+
+        for handler in self._root_logger.handlers:
+            handler.close()
+
         self._root_logger.handlers.clear()
         self._setup_logging_external()
         self._setup_logging_internal()
@@ -198,10 +222,26 @@ class Maestral:
             self.cred_storage,
             bandwidth_limit_up=self.bandwidth_limit_up,
             bandwidth_limit_down=self.bandwidth_limit_down,
+            max_parallel_uploads=self._conf.get("app", "max_parallel_uploads"),
+            max_parallel_downloads=self._conf.get("app", "max_parallel_downloads"),
         )
         self.sync = SyncEngine(self.client, self._dn)
         self.manager = SyncManager(self.sync, self._dn)
 
+        # Set up collection of metrics.
+        self._metrics_exporter: metrics.TextfileExporter | None = None
+        self._setup_metrics()
+
+        # Set up tracing of sync cycles.
+        tracing.tracer.sample_rate = self.trace_sample_rate
+
+        self._profiler: Profiler | None = None
+        self._profiler_lock = threading.Lock()
+
+        self._activity_subscriptions: dict[int, ActivitySubscription] = {}
+        self._activity_subscription_ids = itertools.count(1)
+        self._activity_subscriptions_lock = threading.Lock()
+
         # Create a future which will return once `shutdown_daemon` is called.
         # This can be used by an event loop to wait until maestral has been stopped.
         if shutdown_future and not shutdown_future.get_loop() is self._loop:
@@ -244,6 +284,22 @@ class Maestral:
         self._log_handler_status_longpoll.setLevel(logging.INFO)
         self._root_logger.addHandler(self._log_handler_status_longpoll)
 
+    def _setup_metrics(self) -> None:
+        """Enables or disables metrics collection and the export of metrics to a
+        textfile according to the config."""
+        enabled = self.metrics_enabled
+        textfile = osp.expanduser(self._conf.get("app", "metrics_textfile"))
+
+        metrics.registry.enabled = enabled
+
+        if self._metrics_exporter:
+            self._metrics_exporter.stop()
+            self._metrics_exporter = None
+
+        if enabled and textfile:
+            self._metrics_exporter = metrics.TextfileExporter(textfile)
+            self._metrics_exporter.start()
+
     @property
     def version(self) -> str:
         """Returns the current Maestral version."""
@@ -435,10 +491,16 @@ class Maestral:
                         self._logger.info("Excluded %s", path)
                         self._remove_after_excluded(path)
 
-                    for path in added_included_items:
-                        if not self.sync.is_excluded_by_user(path):
-                            self._logger.info("Included %s", path)
-                            self.manager.download_queue.put(path)
+                    included_items = [
+                        path
+                        for path in added_included_items
+                        if not self.sync.is_excluded_by_user(path)
+                    ]
+
+                    for path in included_items:
+                        self._logger.info("Included %s", path)
+
+                    self.manager.download_queue.put_batch(included_items)
 
                     self._logger.info(IDLE)
 
@@ -463,6 +525,26 @@ class Maestral:
             handler.setLevel(level)
         self._conf.set("app", "log_level", level)
 
+    @property
+    def log_format(self) -> str:
+        """Format of log files and stderr output, either "text" or "json" for one JSON
+        object per line."""
+        return self._conf.get("app", "log_format")
+
+    @log_format.setter
+    def log_format(self, name: str) -> None:
+        """Setter: log_format."""
+        try:
+            formatter = LOG_FORMATS[name]
+        except KeyError:
+            raise ValueError(f"Unknown log format '{name}'")
+
+        for handler in self._external_log_handlers:
+            if handler.formatter in LOG_FORMATS.values():
+                handler.setFormatter(formatter)
+
+        self._conf.set("app", "log_format", name)
+
     @property
     def notification_snooze(self) -> float:
         """Snooze time for desktop notifications in minutes. Defaults to 0 if
@@ -514,6 +596,31 @@ class Maestral:
         self.client.bandwidth_limit_up = value
         self._conf.set("app", "bandwidth_limit_up", value)
 
+    @property
+    def metrics_enabled(self) -> bool:
+        """Whether performance metrics are collected. If enabled and a file is
+        configured as ``metrics_textfile``, metrics will be exported periodically to
+        that file in the Prometheus text format."""
+        return self._conf.get("app", "metrics_enabled")
+
+    @metrics_enabled.setter
+    def metrics_enabled(self, enabled: bool) -> None:
+        """Setter: metrics_enabled."""
+        self._conf.set("app", "metrics_enabled", enabled)
+        self._setup_metrics()
+
+    @property
+    def trace_sample_rate(self) -> float:
+        """Fraction of sync cycles to trace, between 0 and 1. Tracing is disabled if
+        0. See :meth:`get_trace` to retrieve recorded traces."""
+        return self._conf.get("app", "trace_sample_rate")
+
+    @trace_sample_rate.setter
+    def trace_sample_rate(self, value: float) -> None:
+        """Setter: trace_sample_rate."""
+        tracing.tracer.sample_rate = value
+        self._conf.set("app", "trace_sample_rate", value)
+
     # ==== State information  ==========================================================
 
     def status_change_longpoll(self, timeout: float | None = 60) -> bool:
@@ -682,21 +789,118 @@ class Maestral:
 
             return FileStatus.Unwatched.value
 
-        # Return effective status of item and its children. Syncing items take
-        # precedence over Failed which take precedence over Synced. Note that Up and
-        # Down are mutually exclusive because they are performed in alternating cycles.
-        file_status = FileStatus.Synced
+        return _activity_status(node).value
+
+    def get_file_status_batch(self, local_paths: Iterable[str]) -> dict[str, str]:
+        """
+        Returns the sync status of multiple files or folders. This gives the same
+        results as :meth:`get_file_status` but looks up all items in a single call,
+        using bulk queries for the index. Use this to avoid a round trip per item, for
+        instance when displaying a folder listing in a file manager.
+
+        :param local_paths: Paths to files on the local drive. May be relative to the
+            current working directory.
+        :returns: Mapping of the given paths to their sync status. See
+            :meth:`get_file_status` for possible values.
+        """
+        local_paths = list(local_paths)
+
+        if not self.running:
+            return dict.fromkeys(local_paths, FileStatus.Unwatched.value)
+
+        file_status: dict[str, str] = {}
+        without_activity: dict[str, str] = {}
+
+        for path in local_paths:
+            real_path = osp.realpath(path)
+
+            try:
+                dbx_path_cased = self.sync.to_dbx_path(real_path)
+            except ValueError:
+                file_status[path] = FileStatus.Unwatched.value
+                continue
+
+            node = self.sync.activity.get_node(dbx_path_cased)
+
+            if node:
+                file_status[path] = _activity_status(node).value
+            elif dbx_path_cased == "/":
+                file_status[path] = FileStatus.Synced.value
+            else:
+                without_activity[path] = real_path
+
+        self._add_index_status(file_status, without_activity)
+
+        return file_status
+
+    def get_folder_children_status(self, local_dir: str) -> dict[str, str]:
+        """
+        Returns the sync status of all items in a local folder. The activity tree is
+        only traversed once for the folder itself and the index is queried in bulk for
+        all children.
+
+        :param local_dir: Path to a folder on the local drive. May be relative to the
+            current working directory.
+        :returns: Mapping of item names to their sync status. See
+            :meth:`get_file_status` for possible values. The mapping will be empty if
+            the folder does not exist.
+        """
+        local_dir = osp.realpath(local_dir)
+
+        try:
+            names = os.listdir(local_dir)
+        except OSError:
+            return {}
+
+        try:
+            dbx_dir_cased = self.sync.to_dbx_path(local_dir)
+        except ValueError:
+            # The folder is outside the Dropbox folder but may contain it.
+            paths = {osp.join(local_dir, name): name for name in names}
+            batch_status = self.get_file_status_batch(paths)
+            return {paths[path]: status for path, status in batch_status.items()}
+
+        if not self.running:
+            return dict.fromkeys(names, FileStatus.Unwatched.value)
+
+        dir_node = self.sync.activity.get_node(dbx_dir_cased)
+        children = dir_node.children.copy() if dir_node else {}
+
+        file_status: dict[str, str] = {}
+        without_activity: dict[str, str] = {}
+
+        for name in names:
+            try:
+                node = children[name]
+            except KeyError:
+                without_activity[name] = osp.join(local_dir, name)
+            else:
+                file_status[name] = _activity_status(node).value
+
+        self._add_index_status(file_status, without_activity)
 
-        for event in node.sync_events:
-            if event.status is SyncStatus.Syncing:
-                if event.direction is SyncDirection.Up:
-                    return FileStatus.Uploading.value
-                elif event.direction is SyncDirection.Down:
-                    return FileStatus.Downloading.value
-            elif event.status is SyncStatus.Failed:
-                file_status = FileStatus.Error
+        return file_status
 
-        return file_status.value
+    def _add_index_status(
+        self, file_status: dict[str, str], local_paths: dict[str, str]
+    ) -> None:
+        """
+        Sets the status of items without sync activity to synced if they are in our
+        index and to unwatched otherwise.
+
+        :param file_status: Mapping of keys to status to update.
+        :param local_paths: Mapping of keys to local paths which don't have any sync
+            activity.
+        """
+        index_entries = self.sync.get_index_entries_for_local_paths(
+            local_paths.values()
+        )
+
+        for key, local_path in local_paths.items():
+            if local_path in index_entries:
+                file_status[key] = FileStatus.Synced.value
+            else:
+                file_status[key] = FileStatus.Unwatched.value
 
     def get_activity(self, limit: int | None = 100) -> list[SyncEvent]:
         """
@@ -709,7 +913,74 @@ class Maestral:
         :raises NotLinkedError: if no Dropbox account is linked.
         """
         self._check_linked()
-        return list(self.sync.activity.sync_events)[:limit]
+        return self.sync.activity.get_events(limit)
+
+    def subscribe_activity(self, max_rate: float = 5.0) -> int:
+        """
+        Subscribes to changes in the upload / download activity. Use
+        :meth:`get_activity_updates` to retrieve changes for the subscription. This is
+        more efficient than polling :meth:`get_activity` since only changed items are
+        sent and changes are coalesced to at most ``max_rate`` updates per second.
+
+        Subscriptions which are not polled for 10 min will expire.
+
+        :param max_rate: Maximum number of times per second to deliver updates.
+        :returns: Subscription ID.
+        :raises NotLinkedError: if no Dropbox account is linked.
+        """
+        self._check_linked()
+
+        with self._activity_subscriptions_lock:
+            for subscription_id, sub in list(self._activity_subscriptions.items()):
+                if sub.expired:
+                    self._activity_subscriptions.pop(subscription_id)
+                    self.sync.activity.unsubscribe(sub)
+
+            subscription_id = next(self._activity_subscription_ids)
+            subscription = self.sync.activity.subscribe(
+                max_rate, expire_after=_ACTIVITY_SUBSCRIPTION_TIMEOUT
+            )
+            self._activity_subscriptions[subscription_id] = subscription
+
+        return subscription_id
+
+    def get_activity_updates(
+        self, subscription_id: int, timeout: float | None = 60
+    ) -> list[ActivityUpdate]:
+        """
+        Blocks until there are changes in the upload / download activity or until a
+        timeout occurs. The first call will return all current items as added.
+
+        :param subscription_id: Subscription ID returned by :meth:`subscribe_activity`.
+        :param timeout: Maximum time to block before returning, even if there are no
+            changes.
+        :returns: Changes since the last call.
+        :raises ValueError: if the subscription does not exist or has expired.
+        """
+        with self._activity_subscriptions_lock:
+            subscription = self._activity_subscriptions.get(subscription_id)
+
+            if subscription and subscription.expired:
+                self._activity_subscriptions.pop(subscription_id)
+                self.sync.activity.unsubscribe(subscription)
+                subscription = None
+
+        if not subscription:
+            raise ValueError(f"No activity subscription with ID {subscription_id}")
+
+        return subscription.get_updates(timeout)
+
+    def unsubscribe_activity(self, subscription_id: int) -> None:
+        """
+        Cancels a subscription to the upload / download activity.
+
+        :param subscription_id: Subscription ID returned by :meth:`subscribe_activity`.
+        """
+        with self._activity_subscriptions_lock:
+            subscription = self._activity_subscriptions.pop(subscription_id, None)
+
+        if subscription:
+            self.sync.activity.unsubscribe(subscription)
 
     def get_history(
         self, dbx_path: str | None = None, limit: int | None = 100
@@ -727,8 +998,86 @@ class Maestral:
         :raises NotLinkedError: if no Dropbox account is linked.
         """
         self._check_linked()
-        events = self.sync.get_history(dbx_path=dbx_path)
-        return events[-limit:] if limit else events
+        return self.sync.get_history(dbx_path=dbx_path, limit=limit or None)
+
+    def get_metrics(self) -> list[dict[str, Any]]:
+        """
+        Returns performance metrics of the sync daemon, such as transferred bytes, API
+        and database latencies, queue sizes and sync cycle durations. Metrics are only
+        recorded while :attr:`metrics_enabled` is True. Use
+        :func:`maestral.metrics.to_prometheus_text` to render the result in the
+        Prometheus text exposition format.
+
+        :returns: List of metrics, each given as a dictionary with the name, type,
+            documentation and samples of the metric.
+        """
+        return metrics.registry.collect()
+
+    def get_trace(self, clear: bool = False) -> dict[str, Any]:
+        """
+        Returns recorded spans of sync cycles, indexing and individual sync jobs in the
+        Chrome trace event format. The result can be saved as JSON file and opened in
+        Perfetto or chrome://tracing. Spans are only recorded for the fraction of sync
+        cycles given by :attr:`trace_sample_rate`, and only the most recent spans are
+        kept.
+
+        :param clear: Whether to remove all returned spans from the buffer.
+        :returns: Dictionary with a list of trace events.
+        """
+        trace = tracing.tracer.chrome_trace()
+
+        if clear:
+            tracing.tracer.clear()
+
+        return trace
+
+    def start_profiling(self, mode: str = "sample", duration: float = 30.0) -> str:
+        """
+        Starts profiling the sync daemon. Profiling stops after the given duration or
+        when :meth:`stop_profiling` is called, and the results are saved to a file in
+        the log directory. See :mod:`maestral.profiling` for the supported modes and
+        their result formats.
+
+        :param mode: Profiling mode, either "cprofile", "sample" or "memory".
+        :param duration: Time in seconds after which to stop profiling.
+        :returns: Path of the file which results will be saved to.
+        :raises BusyError: if the profiler is already running.
+        :raises ValueError: for an unknown mode.
+        """
+        with self._profiler_lock:
+            if self._profiler and self._profiler.running:
+                raise BusyError(
+                    "Profiler is already running",
+                    "Please wait for the running profiler to finish.",
+                )
+
+            timestamp = time.strftime("%Y%m%d-%H%M%S")
+            path = get_log_path("maestral", f"{self.config_name}-{mode}-{timestamp}")
+            profiler = create_profiler(mode, path)
+            profiler.start(duration)
+            self._profiler = profiler
+
+        self._logger.info("Started %s profiler for %s sec", mode, duration)
+
+        return profiler.path
+
+    def stop_profiling(self) -> str | None:
+        """
+        Stops the running profiler and saves its results. If the profiler has already
+        stopped, this returns the path of its results.
+
+        :returns: Path of the file with the results of the last profiler or None if no
+            profiler was started.
+        """
+        with self._profiler_lock:
+            profiler = self._profiler
+
+        if not profiler:
+            return None
+
+        profiler.stop()
+
+        return profiler.path
 
     def get_account_info(self) -> FullAccount:
         """
@@ -1175,7 +1524,6 @@ class Maestral:
         dbx_paths_lower = {normalize(p.rstrip("/")) for p in dbx_paths}
 
         # ---- input validation --------------------------------------------------------
-        excluded_items = self.sync.excluded_items
         newly_included_items = {
             p for p in dbx_paths_lower if self.sync.is_excluded_by_user(p)
         }
@@ -1183,37 +1531,39 @@ class Maestral:
             return
 
         # ---- update excluded items list ----------------------------------------------
-        excluded_items.difference_update(newly_included_items)
+        excluded_items = PathTrie(self.sync.excluded_items)
+
+        for dbx_path_lower in newly_included_items:
+            excluded_items.discard(dbx_path_lower)
 
         # Find parent folders that should also be newly included.
         for dbx_path_lower in newly_included_items.copy():
-            for folder in excluded_items.copy():
-                # Include all parents which are required to download dbx_path_lower.
-                if is_child(dbx_path_lower, folder):
-                    # Remove parent folder from excluded list.
-                    excluded_items.discard(folder)
-                    # Re-add their children (except parents of dbx_path_lower).
-                    for res in self.client.list_folder_iterator(folder):
-                        for entry in res.entries:
-                            if not is_equal_or_child(dbx_path_lower, entry.path_lower):
-                                excluded_items.add(entry.path_lower)
-
-                    # Add the parent to the download list.
-                    newly_included_items.add(folder)
-
-                # Include all children of dbx_path_lower.
-                if is_child(folder, dbx_path_lower):
-                    excluded_items.discard(folder)
+            # Include all parents which are required to download dbx_path_lower.
+            for folder in excluded_items.parents(dbx_path_lower):
+                # Remove parent folder from excluded list.
+                excluded_items.discard(folder)
+                # Re-add their children (except parents of dbx_path_lower).
+                for res in self.client.list_folder_iterator(folder):
+                    for entry in res.entries:
+                        if not is_equal_or_child(dbx_path_lower, entry.path_lower):
+                            excluded_items.add(entry.path_lower)
+
+                # Add the parent to the download list.
+                newly_included_items.add(folder)
+
+            # Include all children of dbx_path_lower.
+            for folder in excluded_items.children(dbx_path_lower):
+                excluded_items.discard(folder)
 
         # ---- download items from Dropbox ---------------------------------------------
         if self.sync.sync_lock.acquire(blocking=False):
             self._logger.debug("Excluded items old: %s", pf_repr(self.excluded_items))
-            self._logger.debug("Excluded items new: %s", pf_repr(excluded_items))
+            self._logger.debug("Excluded items new: %s", pf_repr(set(excluded_items)))
             try:
-                self.sync.excluded_items = excluded_items
+                self.sync.excluded_items = set(excluded_items)
                 for dbx_path_lower in newly_included_items:
                     self._logger.info("Included '%s'", dbx_path_lower)
-                    self.manager.download_queue.put(dbx_path_lower)
+                self.manager.download_queue.put_batch(newly_included_items)
             finally:
                 self.sync.sync_lock.release()
 
@@ -1233,9 +1583,9 @@ class Maestral:
 
         dbx_path_lower = normalize(dbx_path.rstrip("/"))
 
-        if any(is_equal_or_child(dbx_path_lower, f) for f in self.sync.excluded_items):
+        if self.sync.is_excluded_by_user(dbx_path_lower):
             return "excluded"
-        elif any(is_child(f, dbx_path_lower) for f in self.sync.excluded_items):
+        elif self.sync.has_excluded_children(dbx_path_lower):
             return "partially excluded"
         else:
             return "included"
@@ -1470,7 +1820,14 @@ class Maestral:
         """
         Stop syncing and notify anyone monitoring ``shutdown_future`` that we are done.
         """
-        self.stop_sync()
+        self.manager.close()
+
+        if self._profiler:
+            self._profiler.stop()
+
+        if self._metrics_exporter:
+            self._metrics_exporter.stop()
+            self._metrics_exporter = None
 
         if self.shutdown_future and self._loop and self._loop.is_running():
             self._loop.call_soon_threadsafe(self.shutdown_future.set_result, True)
@@ -11,18 +11,17 @@ import os
 import time
 from contextlib import contextmanager
 from functools import wraps
-from queue import Empty, Queue
+from queue import Empty
 from tempfile import TemporaryDirectory
-from threading import Event, RLock, Thread
-from typing import Any, Callable, Generic, Iterator, TypeVar
+from threading import Condition, Event, RLock, Thread
+from typing import Any, Callable, Collection, Iterator, TypeVar
 
 from typing_extensions import Concatenate, ParamSpec
 
 # local imports
-from . import __url__, notify
+from . import __url__, metrics, notify
 from .client import API_HOST
-from .config import MaestralConfig, MaestralState, PersistentMutableSet
-from .config.user import UserConfig
+from .config import MaestralConfig, MaestralState
 from .constants import CONNECTED, CONNECTING, DISCONNECTED, IDLE, PAUSED, SYNCING
 from .core import TeamRootInfo, UserRootInfo
 from .exceptions import (
@@ -50,6 +49,17 @@ DROPBOX_API_HOSTNAME = "https://" + API_HOST
 P = ParamSpec("P")
 T = TypeVar("T")
 
+_DOWNLOAD_QUEUE_SIZE = metrics.registry.gauge(
+    "maestral_download_queue_size",
+    "Number of items which are queued for download after being included in sync.",
+    ("config",),
+)
+_FS_EVENT_QUEUE_SIZE = metrics.registry.gauge(
+    "maestral_fs_event_queue_size",
+    "Number of local file system events waiting to be processed.",
+    ("config",),
+)
+
 malloc_trim: Callable[[int], None]
 
 try:
@@ -67,41 +77,121 @@ def _free_memory() -> None:
     malloc_trim(0)
 
 
-class PersistentQueue(Generic[T]):
-    def __init__(self, conf: UserConfig, section: str, option: str) -> None:
-        self._lock = RLock()
-        self._queue: Queue[T] = Queue()
-        self._persistent: PersistentMutableSet[T] = PersistentMutableSet(
-            conf, section, option
-        )
+class DownloadQueue:
+    """
+    Queue of items to download, persisted in the sync database. Items are returned in
+    order of priority and then in the order in which they were queued. Items remain in
+    the database until marked as done with :meth:`task_done`, such that interrupted
+    downloads are resumed after a restart. Queuing a folder removes its queued
+    children, and items inside a queued folder are not queued again.
 
-        for item in self._persistent:
-            self._queue.put(item)
+    :param sync: Sync engine whose database stores the queue.
+    """
+
+    def __init__(self, sync: SyncEngine) -> None:
+        self.sync = sync
+        self._cond = Condition()
+        self._in_progress: set[str] = set()
 
     def qsize(self) -> int:
-        return self._queue.qsize()
+        with self._cond:
+            return self.sync.queued_downloads_count() - len(self._in_progress)
 
     def has_pending(self) -> bool:
-        return not self._queue.empty()
+        return self.qsize() > 0
 
-    def put(self, item: T) -> None:
-        with self._lock:
-            self._persistent.add(item)
-            self._queue.put(item)
+    def put(self, item: str, priority: int = 0) -> None:
+        self.put_batch([item], priority)
 
-    def get(self, block: bool = True, timeout: int | None = None) -> T:
-        return self._queue.get(block, timeout)
+    def put_batch(self, items: Collection[str], priority: int = 0) -> None:
+        """
+        Adds items to the queue in a single transaction.
 
-    def join(self) -> None:
-        self._queue.join()
+        :param items: Normalized lower case Dropbox paths.
+        :param priority: Items with a higher priority are returned first.
+        """
+        with self._cond:
+            self.sync.queue_downloads(items, priority, self._in_progress)
+            # Items which are put back are no longer in progress.
+            self._in_progress.difference_update(items)
+            self._cond.notify_all()
+
+    def get(self, block: bool = True, timeout: float | None = None) -> str:
+        return self.get_batch(1, block, timeout)[0]
+
+    def get_batch(
+        self, size: int, block: bool = True, timeout: float | None = None
+    ) -> list[str]:
+        """
+        Returns up to ``size`` items from the queue which are not in progress yet.
+
+        :param size: Maximum number of items to return.
+        :param block: Whether to wait for items if the queue is empty.
+        :param timeout: Maximum time to wait in seconds.
+        :returns: Normalized lower case Dropbox paths.
+        :raises Empty: if no items are available.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            while True:
+                limit = size + len(self._in_progress)
+                queued = self.sync.get_queued_downloads(limit)
+                items = [i for i in queued if i not in self._in_progress][:size]
+
+                if items:
+                    self._in_progress.update(items)
+                    return items
+
+                if not block:
+                    raise Empty()
+
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Empty()
+                    self._cond.wait(remaining)
+
+    def task_done(self, item: str) -> None:
+        self.task_done_batch([item])
+
+    def task_done_batch(self, items: Collection[str]) -> None:
+        """
+        Removes completed items from the queue.
+
+        :param items: Normalized lower case Dropbox paths.
+        """
+        with self._cond:
+            self.sync.remove_queued_downloads(list(items))
+            self._in_progress.difference_update(items)
+            self._cond.notify_all()
+
+    @contextmanager
+    def task(self, item: str) -> Iterator[None]:
+        """
+        A context manager to process an item returned by :meth:`get`. The item is
+        marked as done when the context exits normally and is put back into the queue
+        if an exception is raised, such that it is retried later.
+
+        :param item: Normalized lower case Dropbox path.
+        """
+        try:
+            yield
+        except BaseException:
+            self.put(item)
+            raise
+        else:
+            self.task_done(item)
 
-    def task_done(self, item: T) -> None:
-        with self._lock:
-            self._persistent.discard(item)
-            self._queue.task_done()
+    def join(self) -> None:
+        with self._cond:
+            while self.sync.queued_downloads_count() > 0:
+                self._cond.wait()
 
-    def __contains__(self, entry: Any) -> bool:
-        return entry in self._persistent
+    def __contains__(self, item: Any) -> bool:
+        return isinstance(item, str) and self.sync.is_download_queued(item)
 
 
 class SyncManager:
@@ -112,7 +202,7 @@ class SyncManager:
         events such as joining or leaving a team or fatal errors.
     """
 
-    download_queue: PersistentQueue[str]
+    download_queue: DownloadQueue
     """Queue of remote paths which have been newly included in syncing."""
 
     def __init__(
@@ -130,7 +220,21 @@ class SyncManager:
         self.startup_completed = Event()
         self.autostart = Event()
 
-        self.download_queue = PersistentQueue(self._state, "sync", "pending_downloads")
+        self.download_queue = DownloadQueue(self.sync)
+
+        _DOWNLOAD_QUEUE_SIZE.set_function(
+            self.download_queue.qsize, self.sync.config_name
+        )
+        _FS_EVENT_QUEUE_SIZE.set_function(
+            self.sync.fs_events.local_file_event_queue.qsize, self.sync.config_name
+        )
+
+        # Move downloads queued by previous versions from the state file.
+        pending_downloads = self._state.get("sync", "pending_downloads")
+
+        if len(pending_downloads) > 0:
+            self.download_queue.put_batch(pending_downloads)
+            self._state.set("sync", "pending_downloads", [])
 
         self._startup_time = -1.0
 
@@ -342,8 +446,20 @@ class SyncManager:
             self.local_observer_thread.stop()
             self.local_observer_thread = None
 
+        self._state.flush()
+
         self._logger.info(PAUSED)
 
+    def close(self) -> None:
+        """
+        Stops syncing and unregisters the metrics of this instance. The instance
+        should not be used afterwards.
+        """
+        self.stop()
+
+        _DOWNLOAD_QUEUE_SIZE.remove(self.sync.config_name)
+        _FS_EVENT_QUEUE_SIZE.remove(self.sync.config_name)
+
     def reset_sync_state(self) -> None:
         """Resets all saved sync state. Settings are not affected."""
         if self.running.is_set():
@@ -582,6 +698,8 @@ class SyncManager:
 
             self.connected = connected
 
+            self.sync.client.close_idle_connections()
+
             time.sleep(self.connection_check_interval)
 
     def download_worker(
@@ -648,9 +766,8 @@ class SyncManager:
                     self.download_queue.put(dbx_path_lower)
                     return
 
-                with self.sync.sync_lock:
+                with self.sync.sync_lock, self.download_queue.task(dbx_path_lower):
                     self.sync.get_remote_item(dbx_path_lower)
-                    self.download_queue.task_done(dbx_path_lower)
                     self._logger.info(IDLE)
 
         _free_memory()
@@ -708,6 +825,9 @@ class SyncManager:
 
             self.sync.client.get_space_usage()
 
+            # Open connections ahead of the first downloads and uploads.
+            self.sync.client.warm_up_connections()
+
             # Update path root and migrate local folders. This is required when a user
             # joins or leaves a team and their root namespace changes.
             self.check_and_update_path_root()
@@ -729,8 +849,9 @@ class SyncManager:
 
             while self.download_queue.has_pending():
                 dbx_path = self.download_queue.get()
-                self.sync.get_remote_item(dbx_path)
-                self.download_queue.task_done(dbx_path)
+
+                with self.download_queue.task(dbx_path):
+                    self.sync.get_remote_item(dbx_path)
 
             if not running.is_set():
                 startup_completed.set()
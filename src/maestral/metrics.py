@@ -0,0 +1,663 @@
+"""
+This module contains a lightweight registry for metrics of the sync daemon, such as
+transferred bytes, API and database latencies, queue sizes and sync cycle durations.
+
+Metrics are shared by all components in a process and are only recorded while
+collection is enabled in :data:`registry`. While disabled, updating a metric returns
+immediately. Collected metrics can be rendered in the Prometheus text exposition format
+with :func:`to_prometheus_text` and periodically exported to a file for the textfile
+collector of the Prometheus node exporter with :class:`TextfileExporter`.
+"""
+
+from __future__ import annotations
+
+import inspect
+import logging
+import math
+import os
+import threading
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import partial
+from time import perf_counter
+from typing import Any, Callable, Iterator, Sequence, Type, TypeVar
+
+from .utils.path import delete
+
+__all__ = [
+    "Metric",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "TextfileExporter",
+    "registry",
+    "to_prometheus_text",
+    "write_textfile",
+    "DEFAULT_BUCKETS",
+]
+
+
+logger = logging.getLogger(__name__)
+
+LabelValues = tuple[str, ...]
+MetricFamily = dict[str, Any]
+FunctionRef = Callable[[], Callable[[], float] | None]
+MetricType = TypeVar("MetricType", bound="Metric")
+T = TypeVar("T")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Default upper bounds of histogram buckets in seconds."""
+
+
+class Metric:
+    """
+    Base class for metrics. A metric has a value for each combination of label values
+    which has been recorded.
+
+    :param registry: Registry which the metric belongs to.
+    :param name: Name of the metric, following Prometheus naming conventions.
+    :param documentation: Description of the metric.
+    :param label_names: Names of the labels of the metric.
+    """
+
+    type_name = "untyped"
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._registry = registry
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether values are currently recorded."""
+        return self._registry.enabled
+
+    def _check_labels(self, label_values: LabelValues) -> None:
+        if len(label_values) != len(self.label_names):
+            raise ValueError(
+                f"Metric {self.name} requires labels {self.label_names}, "
+                f"got {label_values}"
+            )
+
+    def _labels_dict(self, label_values: LabelValues) -> dict[str, str]:
+        return dict(zip(self.label_names, label_values))
+
+    def samples(self) -> list[dict[str, Any]]:
+        """
+        :returns: Current samples of the metric as dictionaries with the sample name,
+            labels and value.
+        """
+        raise NotImplementedError()
+
+    def reset(self) -> None:
+        """Removes all recorded values."""
+        raise NotImplementedError()
+
+    def collect(self) -> MetricFamily:
+        """
+        :returns: Dictionary with the name, type, documentation and samples of the
+            metric. Only contains builtin types such that it can be serialized.
+        """
+        return {
+            "name": self.name,
+            "type": self.type_name,
+            "documentation": self.documentation,
+            "samples": self.samples(),
+        }
+
+
+class Counter(Metric):
+    """A metric whose value only increases, for instance a number of transferred
+    bytes. Names of counters should end in ``_total``."""
+
+    type_name = "counter"
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+    ) -> None:
+        super().__init__(registry, name, documentation, label_names)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        """
+        Increments the counter.
+
+        :param amount: Amount to increment the counter by. Must not be negative.
+        :param label_values: Values for the labels of the metric.
+        """
+        if not self._registry.enabled:
+            return
+
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+
+        self._check_labels(label_values)
+
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        """
+        :param label_values: Values for the labels of the metric.
+        :returns: Current value of the counter.
+        """
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self) -> list[dict[str, Any]]:
+        with self._lock:
+            values = list(self._values.items())
+
+        return [
+            {"name": self.name, "labels": self._labels_dict(lv), "value": value}
+            for lv, value in values
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Metric):
+    """A metric whose value can go up and down, for instance a queue size. Instead of
+    setting values, a function can be registered which is called on collection. Bound
+    methods are only referenced weakly and are removed when their instance is garbage
+    collected, such that a gauge does not keep the instance alive."""
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+    ) -> None:
+        super().__init__(registry, name, documentation, label_names)
+        self._values: dict[LabelValues, float] = {}
+        self._functions: dict[LabelValues, FunctionRef] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        """
+        Sets the gauge to the given value.
+
+        :param value: New value.
+        :param label_values: Values for the labels of the metric.
+        """
+        if not self._registry.enabled:
+            return
+
+        self._check_labels(label_values)
+
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        """
+        Increments the gauge.
+
+        :param amount: Amount to increment the gauge by.
+        :param label_values: Values for the labels of the metric.
+        """
+        if not self._registry.enabled:
+            return
+
+        self._check_labels(label_values)
+
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, amount: float = 1, *label_values: str) -> None:
+        """
+        Decrements the gauge.
+
+        :param amount: Amount to decrement the gauge by.
+        :param label_values: Values for the labels of the metric.
+        """
+        self.inc(-amount, *label_values)
+
+    def set_function(self, func: Callable[[], float], *label_values: str) -> None:
+        """
+        Registers a function which returns the current value of the gauge. It is
+        called on every collection and replaces any previously registered function or
+        value for the same labels.
+
+        :param func: Function which takes no arguments and returns the value.
+        :param label_values: Values for the labels of the metric.
+        """
+        self._check_labels(label_values)
+
+        ref: FunctionRef
+
+        if inspect.ismethod(func):
+            ref = weakref.WeakMethod(func)
+        else:
+            ref = partial(_identity, func)
+
+        with self._lock:
+            self._values.pop(label_values, None)
+            self._functions[label_values] = ref
+
+    def remove(self, *label_values: str) -> None:
+        """
+        Removes the value or function registered for the given labels.
+
+        :param label_values: Values for the labels of the metric.
+        """
+        with self._lock:
+            self._values.pop(label_values, None)
+            self._functions.pop(label_values, None)
+
+    def _get_function(self, label_values: LabelValues) -> Callable[[], float] | None:
+        with self._lock:
+            ref = self._functions.get(label_values)
+
+            if not ref:
+                return None
+
+            func = ref()
+
+            if not func:
+                # The instance of a bound method was garbage collected.
+                del self._functions[label_values]
+
+            return func
+
+    def get(self, *label_values: str) -> float:
+        """
+        :param label_values: Values for the labels of the metric.
+        :returns: Current value of the gauge.
+        """
+        func = self._get_function(label_values)
+
+        if func:
+            return func()
+
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self) -> list[dict[str, Any]]:
+        with self._lock:
+            values = dict(self._values)
+            label_values = list(self._functions)
+
+        for lv in label_values:
+            func = self._get_function(lv)
+
+            if not func:
+                continue
+
+            try:
+                values[lv] = func()
+            except Exception:
+                # Skip samples which cannot be determined, for instance because a
+                # database is closed.
+                pass
+
+        return [
+            {"name": self.name, "labels": self._labels_dict(lv), "value": value}
+            for lv, value in values.items()
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    """A metric which counts observed values, for instance durations, in buckets.
+
+    :param registry: Registry which the metric belongs to.
+    :param name: Name of the metric, following Prometheus naming conventions.
+    :param documentation: Description of the metric.
+    :param label_names: Names of the labels of the metric.
+    :param buckets: Upper bounds of the buckets in ascending order. A bucket for all
+        remaining values is always added.
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(registry, name, documentation, label_names)
+
+        if list(buckets) != sorted(buckets):
+            raise ValueError("Buckets must be sorted in ascending order")
+
+        self.buckets = tuple(float(b) for b in buckets if b != math.inf)
+        # Per labels: counts per bucket, including the last bucket for all remaining
+        # values, followed by the sum of all values.
+        self._values: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Records an observed value.
+
+        :param value: Observed value.
+        :param label_values: Values for the labels of the metric.
+        """
+        if not self._registry.enabled:
+            return
+
+        self._check_labels(label_values)
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            try:
+                counts = self._values[label_values]
+            except KeyError:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 2)
+
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """
+        A context manager which records the time in seconds spent in its context.
+
+        :param label_values: Values for the labels of the metric.
+        """
+        if not self._registry.enabled:
+            yield
+            return
+
+        start = perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, *label_values)
+
+    def get_count(self, *label_values: str) -> int:
+        """
+        :param label_values: Values for the labels of the metric.
+        :returns: Number of observed values.
+        """
+        with self._lock:
+            counts = self._values.get(label_values)
+            return int(sum(counts[:-1])) if counts else 0
+
+    def get_sum(self, *label_values: str) -> float:
+        """
+        :param label_values: Values for the labels of the metric.
+        :returns: Sum of observed values.
+        """
+        with self._lock:
+            counts = self._values.get(label_values)
+            return counts[-1] if counts else 0
+
+    def samples(self) -> list[dict[str, Any]]:
+        with self._lock:
+            values = [(lv, list(counts)) for lv, counts in self._values.items()]
+
+        samples = []
+
+        for lv, counts in values:
+            labels = self._labels_dict(lv)
+            cumulative = 0.0
+
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(
+                    {
+                        "name": f"{self.name}_bucket",
+                        "labels": {**labels, "le": _format_value(bound)},
+                        "value": cumulative,
+                    }
+                )
+
+            samples.append(
+                {"name": f"{self.name}_sum", "labels": labels, "value": counts[-1]}
+            )
+            samples.append(
+                {"name": f"{self.name}_count", "labels": labels, "value": cumulative}
+            )
+
+        return samples
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class MetricsRegistry:
+    """
+    A collection of metrics. Registering a metric with the name of an existing metric
+    returns the existing metric.
+
+    :param enabled: Whether to record values of metrics.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(
+        self, cls: Type[MetricType], name: str, *args: Any, **kwargs: Any
+    ) -> MetricType:
+        with self._lock:
+            try:
+                metric = self._metrics[name]
+            except KeyError:
+                metric = self._metrics[name] = cls(self, name, *args, **kwargs)
+
+        if not isinstance(metric, cls):
+            raise ValueError(
+                f"Metric {name} is already registered as {metric.type_name}"
+            )
+
+        return metric
+
+    def counter(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> Counter:
+        """
+        Registers a counter.
+
+        :param name: Name of the metric.
+        :param documentation: Description of the metric.
+        :param label_names: Names of the labels of the metric.
+        :returns: The registered counter.
+        """
+        return self._register(Counter, name, documentation, label_names)
+
+    def gauge(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> Gauge:
+        """
+        Registers a gauge.
+
+        :param name: Name of the metric.
+        :param documentation: Description of the metric.
+        :param label_names: Names of the labels of the metric.
+        :returns: The registered gauge.
+        """
+        return self._register(Gauge, name, documentation, label_names)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """
+        Registers a histogram.
+
+        :param name: Name of the metric.
+        :param documentation: Description of the metric.
+        :param label_names: Names of the labels of the metric.
+        :param buckets: Upper bounds of the buckets in ascending order.
+        :returns: The registered histogram.
+        """
+        return self._register(Histogram, name, documentation, label_names, buckets)
+
+    def get(self, name: str) -> Metric:
+        """
+        :param name: Name of the metric.
+        :returns: The registered metric.
+        :raises KeyError: if no metric with the name is registered.
+        """
+        with self._lock:
+            return self._metrics[name]
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        :returns: The current samples of all metrics, sorted by name. See
+            :meth:`Metric.collect` for the format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+
+        return [metric.collect() for metric in metrics]
+
+    def reset(self) -> None:
+        """Removes all recorded values. Functions registered for gauges are kept."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        for metric in metrics:
+            metric.reset()
+
+
+registry = MetricsRegistry()
+"""The registry for all metrics of Maestral."""
+
+
+def _identity(value: T) -> T:
+    return value
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _escape(value: str, quote: bool = True) -> str:
+    value = value.replace("\\", r"\\").replace("\n", r"\n")
+    return value.replace('"', r"\"") if quote else value
+
+
+def to_prometheus_text(families: list[MetricFamily]) -> str:
+    """
+    Renders metrics in the Prometheus text exposition format.
+
+    :param families: Metrics as returned by :meth:`MetricsRegistry.collect`.
+    :returns: Metrics in the text exposition format.
+    """
+    lines = []
+
+    for family in families:
+        name = family["name"]
+        lines.append(f"# HELP {name} {_escape(family['documentation'], quote=False)}")
+        lines.append(f"# TYPE {name} {family['type']}")
+
+        for sample in family["samples"]:
+            labels = ",".join(
+                f'{key}="{_escape(str(value))}"'
+                for key, value in sample["labels"].items()
+            )
+            labels_str = f"{{{labels}}}" if labels else ""
+            lines.append(
+                f"{sample['name']}{labels_str} {_format_value(sample['value'])}"
+            )
+
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str, families: list[MetricFamily]) -> None:
+    """
+    Writes metrics in the Prometheus text exposition format to a file. The file is
+    replaced atomically such that readers never see a partially written file.
+
+    :param path: Path of the file to write.
+    :param families: Metrics as returned by :meth:`MetricsRegistry.collect`.
+    """
+    tmp_path = f"{path}.tmp"
+
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(to_prometheus_text(families))
+        os.replace(tmp_path, path)
+    except OSError:
+        delete(tmp_path)
+        raise
+
+
+class TextfileExporter:
+    """
+    Periodically writes all metrics of a registry to a file in a background thread.
+
+    :param path: Path of the file to write. This should have the extension ".prom" to
+        be picked up by the textfile collector of the Prometheus node exporter.
+    :param interval: Interval in seconds between writes.
+    :param metrics_registry: Registry to export. Defaults to :data:`registry`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        interval: float = 15.0,
+        metrics_registry: MetricsRegistry | None = None,
+    ) -> None:
+        self.path = path
+        self.interval = interval
+        self._registry = metrics_registry or registry
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="maestral-metrics-exporter", daemon=True
+        )
+
+    def start(self) -> None:
+        """Starts exporting metrics."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops exporting metrics after writing them a last time."""
+        self._stopped.set()
+
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def export(self) -> None:
+        """Writes the current metrics to the file."""
+        write_textfile(self.path, self._registry.collect())
+
+    def _run(self) -> None:
+        while True:
+            stopped = self._stopped.wait(self.interval)
+
+            try:
+                self.export()
+            except OSError as exc:
+                logger.warning("Could not write metrics to %s: %s", self.path, exc)
+
+            if stopped:
+                return
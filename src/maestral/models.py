@@ -12,18 +12,9 @@ import enum
 # system imports
 import os
 import time
-from typing import TYPE_CHECKING
-
-# external imports
-from watchdog.events import (
-    EVENT_TYPE_CREATED,
-    EVENT_TYPE_DELETED,
-    EVENT_TYPE_MODIFIED,
-    EVENT_TYPE_MOVED,
-    DirMovedEvent,
-    FileMovedEvent,
-    FileSystemEvent,
-)
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from typing import TYPE_CHECKING, Sequence
 
 # local imports
 from .core import DeletedMetadata, FileMetadata, FolderMetadata, Metadata
@@ -33,6 +24,10 @@ from .exceptions import NotLinkedError, SyncError
 from .utils.path import normalize
 
 if TYPE_CHECKING:
+    from typing import Any
+
+    from watchdog.events import FileSystemEvent
+
     from .sync import SyncEngine
 
 
@@ -42,9 +37,12 @@ __all__ = [
     "ItemType",
     "ChangeType",
     "SyncEvent",
+    "ActivityChange",
+    "ActivityUpdate",
     "IndexEntry",
     "HashCacheEntry",
     "SyncErrorEntry",
+    "DownloadQueueEntry",
 ]
 
 
@@ -56,6 +54,10 @@ def get_dest_path(event: FileSystemEvent) -> str | bytes:
     :param event: Watchdog file system event.
     :returns: Destination path for moved event, source path otherwise.
     """
+    # Watchdog is imported lazily because the CLI imports this module to deserialize
+    # results from the daemon.
+    from watchdog.events import DirMovedEvent, FileMovedEvent
+
     if isinstance(event, (FileMovedEvent, DirMovedEvent)):
         return event.dest_path
     return event.src_path
@@ -97,6 +99,106 @@ class ChangeType(enum.Enum):
     Modified = "modified"
 
 
+class _FolderPrefix(str):
+    """
+    Path of the local Dropbox folder, stored in place of a local path which consists of
+    this prefix followed by the Dropbox path of the same event.
+    """
+
+    __slots__ = ()
+
+
+@lru_cache(maxsize=16)
+def _folder_prefix(path: str) -> _FolderPrefix:
+    # Return the same instance for the same folder, such that all events share it.
+    return _FolderPrefix(path)
+
+
+class DbxPathColumn(NonNullColumn[str, bytes]):
+    """
+    Column for the Dropbox path of a :class:`SyncEvent`. Paths of the local item are
+    stored relative to this column by :class:`LocalPathColumn` where possible.
+
+    :param local_path_attr: Name of the column which stores the corresponding local
+        path.
+    """
+
+    def __init__(self, local_path_attr: str) -> None:
+        super().__init__(SqlPath())
+        self.local_path_attr = local_path_attr
+
+    def __set_name__(self, owner: Any, name: str) -> None:
+        super().__set_name__(owner, name)
+        self.owner = owner
+
+    @cached_property
+    def _local_path_name(self) -> str:
+        # Resolve the column on first use because it may be declared after this one.
+        column: LocalPathColumn = getattr(self.owner, self.local_path_attr)
+        return column.private_name
+
+    def __set__(self, obj: Any, value: str | None) -> None:
+        # Expand a local path which is stored relative to the previous value.
+        local_path_name = self._local_path_name
+        local_path = getattr(obj, local_path_name, None)
+
+        if type(local_path) is _FolderPrefix:
+            dbx_path = getattr(obj, self.private_name)
+            setattr(obj, local_path_name, local_path + dbx_path)
+
+        super().__set__(obj, value)
+
+
+class LocalPathColumn(NonNullColumn[str, bytes]):
+    """
+    Column for the local path of a :class:`SyncEvent`. Local paths usually consist of
+    the path of the local Dropbox folder followed by the Dropbox path of the event. In
+    this case, only a reference to a shared instance of the folder path is stored and
+    the full path is reconstructed on access. This avoids keeping a copy of each path in
+    memory for events which are queued for syncing.
+
+    :param dbx_path_attr: Name of the :class:`DbxPathColumn` which stores the
+        corresponding Dropbox path.
+    """
+
+    def __init__(self, dbx_path_attr: str) -> None:
+        super().__init__(SqlPath())
+        self.dbx_path_attr = dbx_path_attr
+
+    def __set_name__(self, owner: Any, name: str) -> None:
+        super().__set_name__(owner, name)
+        self.owner = owner
+
+    @cached_property
+    def _dbx_path_name(self) -> str:
+        column: DbxPathColumn = getattr(self.owner, self.dbx_path_attr)
+        return column.private_name
+
+    def __get__(self, obj: Any, objtype: type | None = None) -> Any:
+        if obj is None:
+            return self
+
+        value = getattr(obj, self.private_name)
+
+        if type(value) is _FolderPrefix:
+            return value + getattr(obj, self._dbx_path_name)
+
+        return value
+
+    def __set__(self, obj: Any, value: str | None) -> None:
+        dbx_path = getattr(obj, self._dbx_path_name, None)
+
+        if (
+            dbx_path
+            and value
+            and len(value) > len(dbx_path)
+            and value.endswith(dbx_path)
+        ):
+            value = _folder_prefix(value[: -len(dbx_path)])
+
+        super().__set__(obj, value)
+
+
 class SyncEvent(Model):
     """Represents a file or folder change in the sync queue
 
@@ -112,6 +214,10 @@ class SyncEvent(Model):
     """
 
     __tablename__ = "history"
+    __indexes__ = {
+        "time": "IFNULL(change_time, sync_time)",
+        "path_time": "dbx_path, IFNULL(change_time, sync_time)",
+    }
 
     id = Column(SqlInt(), primary_key=True)
     """A unique identifier of the SyncEvent."""
@@ -133,7 +239,7 @@ class SyncEvent(Model):
     which are not deletions.
     """
 
-    dbx_path = NonNullColumn(SqlPath())
+    dbx_path = DbxPathColumn(local_path_attr="local_path")
     """
     Correctly cased Dropbox path of the item to sync. If the sync represents a move
     operation, this will be the destination path. Follows the casing from the
@@ -147,7 +253,7 @@ class SyncEvent(Model):
     metadata.
     """
 
-    local_path = NonNullColumn(SqlPath())
+    local_path = LocalPathColumn(dbx_path_attr="dbx_path")
     """
     Local path of the item to sync. If the sync represents a move operation, this will
     be the destination path. This will be correctly cased.
@@ -297,73 +403,112 @@ class SyncEvent(Model):
         :returns: An instance of this class with attributes populated from the given
             Dropbox Metadata.
         """
-        if isinstance(md, DeletedMetadata):
-            # there is currently no API call to determine who deleted a file or folder
-            change_type = ChangeType.Removed
-            change_time = None
-            size = 0
-            rev = None
-            hash_str = None
-            symlink_target = None
-            dbx_id = None
-            change_dbid = None
+        return cls.from_metadata_page([md], sync_engine)[0]
 
-            entry = sync_engine.get_index_entry(md.path_lower)
-            item_type = ItemType.Unknown if entry is None else entry.item_type
+    @classmethod
+    def from_metadata_page(
+        cls, entries: Sequence[Metadata], sync_engine: SyncEngine
+    ) -> list[SyncEvent]:
+        """
+        Initializes SyncEvents for a page of Dropbox metadata. All index entries which
+        are required for the conversion are fetched with a single query and the casing
+        of parent folders is resolved for the entire page at once.
 
-        elif isinstance(md, FolderMetadata):
-            # there is currently no API call to determine who added a folder
-            change_type = ChangeType.Added
-            item_type = ItemType.Folder
-            size = 0
-            rev = "folder"
-            hash_str = "folder"
-            symlink_target = None
-            dbx_id = md.id
-            change_time = None
-            change_dbid = None
+        :param entries: Dropbox Metadata, for instance a page of results from
+            :meth:`maestral.client.DropboxClient.list_folder_iterator`.
+        :param sync_engine: SyncEngine instance.
+        :returns: Instances of this class in the same order as ``entries``.
+        """
+        index_entries = sync_engine.get_index_entries(
+            [md.path_lower for md in entries if not isinstance(md, FolderMetadata)]
+        )
+        sync_engine.correct_case_batch(entries)
 
-        elif isinstance(md, FileMetadata):
-            item_type = ItemType.File
-            rev = md.rev
-            hash_str = md.content_hash
-            symlink_target = md.symlink_target
-            dbx_id = md.id
-            size = md.size
-            change_time = md.client_modified.timestamp()
-            if sync_engine.get_local_rev(md.path_lower):
-                change_type = ChangeType.Modified
-            else:
+        account_id: str | None = None
+        sync_time = time.time()
+        sync_events = []
+
+        for md in entries:
+            if isinstance(md, DeletedMetadata):
+                # there is currently no API call to determine who deleted a file or
+                # folder
+                change_type = ChangeType.Removed
+                change_time = None
+                size = 0
+                rev = None
+                hash_str = None
+                symlink_target = None
+                dbx_id = None
+                change_dbid = None
+
+                entry = index_entries.get(md.path_lower)
+                item_type = ItemType.Unknown if entry is None else entry.item_type
+
+            elif isinstance(md, FolderMetadata):
+                # there is currently no API call to determine who added a folder
                 change_type = ChangeType.Added
-            if md.shared:
-                change_dbid = md.modified_by
+                item_type = ItemType.Folder
+                size = 0
+                rev = "folder"
+                hash_str = "folder"
+                symlink_target = None
+                dbx_id = md.id
+                change_time = None
+                change_dbid = None
+
+            elif isinstance(md, FileMetadata):
+                item_type = ItemType.File
+                rev = md.rev
+                hash_str = md.content_hash
+                symlink_target = md.symlink_target
+                dbx_id = md.id
+                size = md.size
+                change_time = md.client_modified.timestamp()
+                entry = index_entries.get(md.path_lower)
+                if entry and entry.rev:
+                    change_type = ChangeType.Modified
+                else:
+                    change_type = ChangeType.Added
+                if md.shared:
+                    change_dbid = md.modified_by
+                else:
+                    # File is not a shared folder, therefore
+                    # the current user must have added or modified it.
+                    if account_id is None:
+                        account_id = sync_engine.client.account_info.account_id
+                    change_dbid = account_id
             else:
-                # File is not a shared folder, therefore
-                # the current user must have added or modified it.
-                change_dbid = sync_engine.client.account_info.account_id
-        else:
-            raise RuntimeError(f"Cannot convert {md} to SyncEvent")
+                raise RuntimeError(f"Cannot convert {md} to SyncEvent")
 
-        dbx_path_cased = sync_engine.correct_case(md.path_display)
+            dbx_path_cased = sync_engine.correct_case(md.path_display)
 
-        return cls(
-            direction=SyncDirection.Down,
-            item_type=item_type,
-            sync_time=time.time(),
-            dbx_path=dbx_path_cased,
-            dbx_path_lower=md.path_lower,
-            dbx_id=dbx_id,
-            local_path=sync_engine.to_local_path_from_cased(dbx_path_cased),
-            rev=rev,
-            content_hash=hash_str,
-            symlink_target=symlink_target,
-            change_type=change_type,
-            change_time=change_time,
-            change_dbid=change_dbid,
-            status=SyncStatus.Queued,
-            size=size,
-            completed=0,
-        )
+            # Share the string instance if the path is already lower case.
+            if dbx_path_cased == md.path_lower:
+                dbx_path_lower = dbx_path_cased
+            else:
+                dbx_path_lower = md.path_lower
+
+            event = cls(
+                direction=SyncDirection.Down,
+                item_type=item_type,
+                sync_time=sync_time,
+                dbx_path=dbx_path_cased,
+                dbx_path_lower=dbx_path_lower,
+                dbx_id=dbx_id,
+                local_path=sync_engine.to_local_path_from_cased(dbx_path_cased),
+                rev=rev,
+                content_hash=hash_str,
+                symlink_target=symlink_target,
+                change_type=change_type,
+                change_time=change_time,
+                change_dbid=change_dbid,
+                status=SyncStatus.Queued,
+                size=size,
+                completed=0,
+            )
+            sync_events.append(event)
+
+        return sync_events
 
     @classmethod
     def from_file_system_event(
@@ -377,6 +522,13 @@ class SyncEvent(Model):
         :returns: An instance of this class with attributes populated from the given
             SyncEvent.
         """
+        from watchdog.events import (
+            EVENT_TYPE_CREATED,
+            EVENT_TYPE_DELETED,
+            EVENT_TYPE_MODIFIED,
+            EVENT_TYPE_MOVED,
+        )
+
         try:
             change_dbid = sync_engine.client.account_info.account_id
         except NotLinkedError:
@@ -432,6 +584,10 @@ class SyncEvent(Model):
         dbx_path = sync_engine.to_dbx_path(to_path)
         dbx_path_lower = normalize(dbx_path)
 
+        # Share the string instance if the path is already lower case.
+        if dbx_path_lower == dbx_path:
+            dbx_path_lower = dbx_path
+
         dbx_path_from = sync_engine.to_dbx_path(from_path) if from_path else None
         dbx_path_from_lower = normalize(dbx_path_from) if dbx_path_from else None
 
@@ -471,6 +627,40 @@ class SyncEvent(Model):
         )
 
 
+class ActivityChange(enum.Enum):
+    """Enumeration of changes to the sync activity"""
+
+    Added = "added"
+    Updated = "updated"
+    Removed = "removed"
+
+
+@dataclass
+class ActivityUpdate:
+    """A change to a single item in the sync activity
+
+    Those are sent to subscribers of the sync activity instead of full
+    :class:`SyncEvent` instances to keep updates small.
+    """
+
+    change: ActivityChange
+    """The type of change"""
+    key: int
+    """Identifies the sync event across updates of a single subscription"""
+    dbx_path: str
+    """The Dropbox path of the item"""
+    direction: SyncDirection
+    """The sync direction"""
+    status: SyncStatus
+    """The current sync status"""
+    change_type: ChangeType
+    """The change which is being synced"""
+    size: int
+    """The size of the item in bytes"""
+    completed: int
+    """The number of bytes which have already been transferred"""
+
+
 class IndexEntry(Model):
     """Represents an entry in our local sync index"""
 
@@ -572,3 +762,19 @@ class SyncErrorEntry(Model):
     title = Column(SqlString())
     message = Column(SqlString())
     type = Column(SqlString())
+
+
+class DownloadQueueEntry(Model):
+    """Represents an item in the queue of pending downloads"""
+
+    __tablename__ = "download_queue"
+
+    dbx_path_lower = NonNullColumn(SqlPath(), primary_key=True)
+    """Dropbox path of the item to download in lower case."""
+
+    priority = NonNullColumn(SqlInt(), index=True)
+    """Items with a higher priority are downloaded first."""
+
+    queued_time = NonNullColumn(SqlFloat())
+    """Time when the item was queued. Items of equal priority are downloaded in the
+    order in which they were queued."""
@@ -0,0 +1,338 @@
+"""
+This module contains profilers which can be attached to a running sync daemon to find
+out where it spends time or allocates memory.
+
+Three modes are supported:
+
+* "cprofile": Records the time spent in each function with :mod:`cProfile`. Results
+  are saved in the binary format of :mod:`pstats` and can be inspected with
+  ``python -m pstats`` or tools such as snakeviz.
+* "sample": Periodically samples the stack of every thread. This has a much lower
+  overhead than cProfile and includes threads which are blocked, for instance while
+  waiting for network requests. Results are saved as collapsed stacks, one line per
+  stack with the number of samples, which can be rendered as flame graph by
+  speedscope or flamegraph.pl.
+* "memory": Traces memory allocations with :mod:`tracemalloc` and saves a report of
+  the largest allocations and of the allocations made while profiling.
+
+Profilers are started and stopped from any thread and never interrupt syncing.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Any
+
+__all__ = [
+    "Profiler",
+    "CProfiler",
+    "StackSampler",
+    "MemoryProfiler",
+    "create_profiler",
+    "PROFILING_MODES",
+]
+
+
+logger = logging.getLogger(__name__)
+
+PROFILING_MODES = ("cprofile", "sample", "memory")
+"""Names of supported profiling modes."""
+
+
+class Profiler:
+    """
+    Base class for profilers. A profiler can be started once and saves its results to
+    a file when it is stopped.
+
+    :param path: Path of the file to save results to.
+    """
+
+    suffix = ""
+    """File extension for results of the profiler."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._started = False
+        self._running = False
+        self._timer: threading.Timer | None = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the profiler is currently running."""
+        return self._running
+
+    def start(self, duration: float | None = None) -> None:
+        """
+        Starts profiling.
+
+        :param duration: Time in seconds after which to stop profiling and save the
+            results. If None, profiling continues until :meth:`stop` is called.
+        :raises RuntimeError: if the profiler has already been started.
+        """
+        with self._lock:
+            if self._started:
+                raise RuntimeError("Profiler can only be started once")
+
+            self._started = True
+            self._running = True
+            self._start()
+
+            if duration is not None:
+                self._timer = threading.Timer(duration, self._stop_after_duration)
+                self._timer.name = "maestral-profiler-timer"
+                self._timer.daemon = True
+                self._timer.start()
+
+    def stop(self) -> None:
+        """
+        Stops profiling and saves the results. Does nothing if the profiler is not
+        running. Returns only once the results have been saved, also when called while
+        the profiler is already being stopped.
+
+        :raises OSError: if saving the results fails.
+        """
+        with self._lock:
+            if not self._running:
+                return
+
+            self._running = False
+
+            if self._timer:
+                self._timer.cancel()
+
+            self._stop()
+
+        logger.info("Saved profile to %s", self.path)
+
+    def _stop_after_duration(self) -> None:
+        try:
+            self.stop()
+        except OSError as exc:
+            logger.error("Could not save profile to %s: %s", self.path, exc.strerror)
+
+    def _start(self) -> None:
+        raise NotImplementedError()
+
+    def _stop(self) -> None:
+        raise NotImplementedError()
+
+
+class CProfiler(Profiler):
+    """
+    Records function calls with :mod:`cProfile` in all threads.
+
+    Before Python 3.12, a profiler can only be enabled in the thread which it should
+    record. A profiler is therefore enabled in every thread that starts while profiling,
+    which includes all worker pools for uploads, downloads and indexing. Threads which
+    were already running, such as the main sync threads, are not recorded. Worker
+    threads which are still running when profiling stops continue to record calls until
+    they exit, but their results are discarded.
+
+    From Python 3.12, a single profiler records calls in all threads.
+
+    :param path: Path of the file to save results to.
+    """
+
+    suffix = ".prof"
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self._profiles: list[cProfile.Profile] = []
+
+    def _start(self) -> None:
+        if sys.version_info >= (3, 12):
+            profile = cProfile.Profile()
+            profile.enable()
+            self._profiles.append(profile)
+        else:
+            threading.setprofile(self._enable_in_thread)
+
+    def _enable_in_thread(self, frame: FrameType, event: str, arg: Any) -> None:
+        # Called on the first profiling event in a new thread.
+        sys.setprofile(None)
+
+        with self._lock:
+            if not self._running:
+                return
+
+            profile = cProfile.Profile()
+            self._profiles.append(profile)
+
+        profile.enable()
+
+    def _stop(self) -> None:
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+
+        for profile in self._profiles:
+            profile.disable()
+
+        stats = pstats.Stats()
+
+        if self._profiles:
+            stats.add(*self._profiles)
+
+        stats.dump_stats(self.path)
+
+
+class StackSampler(Profiler):
+    """
+    Periodically samples the stacks of all threads and counts how often each stack
+    occurs.
+
+    :param path: Path of the file to save results to.
+    :param interval: Interval between samples in seconds.
+    """
+
+    suffix = ".folded"
+
+    def __init__(self, path: str, interval: float = 0.01) -> None:
+        super().__init__(path)
+        self.interval = interval
+        self.n_samples = 0
+        # Counts of stacks, given by the thread name and the code object of each frame,
+        # starting with the outermost frame.
+        self._counts: Counter[tuple[str, tuple[CodeType, ...]]] = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="maestral-profiler", daemon=True
+        )
+
+    def _start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        own_ident = threading.get_ident()
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+
+            codes: list[CodeType] = []
+            f: FrameType | None = frame
+
+            while f is not None:
+                codes.append(f.f_code)
+                f = f.f_back
+
+            codes.reverse()
+            thread_name = thread_names.get(ident, f"thread-{ident}")
+            self._counts[(thread_name, tuple(codes))] += 1
+
+        self.n_samples += 1
+
+    def _stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+        lines = []
+
+        for (thread_name, codes), count in self._counts.most_common():
+            frames = [thread_name]
+            frames.extend(
+                f"{c.co_name} ({c.co_filename}:{c.co_firstlineno})" for c in codes
+            )
+            lines.append(f"{';'.join(frames)} {count}\n")
+
+        with open(self.path, "w") as f:
+            f.writelines(lines)
+
+
+class MemoryProfiler(Profiler):
+    """
+    Traces memory allocations with :mod:`tracemalloc`. The report lists the lines which
+    hold the most memory when profiling stops and the lines whose allocations grew the
+    most while profiling. Tracing is left running if it was already enabled before.
+
+    :param path: Path of the file to save results to.
+    :param n_frames: Number of frames to store for each allocation.
+    :param limit: Number of lines to include in each section of the report.
+    """
+
+    suffix = ".txt"
+
+    def __init__(self, path: str, n_frames: int = 10, limit: int = 50) -> None:
+        super().__init__(path)
+        self.n_frames = n_frames
+        self.limit = limit
+        self._started_tracing = False
+        self._first_snapshot: tracemalloc.Snapshot | None = None
+
+    def _start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.n_frames)
+            self._started_tracing = True
+
+        self._first_snapshot = self._take_snapshot()
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            )
+        )
+
+    def _stop(self) -> None:
+        snapshot = self._take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        if self._started_tracing:
+            tracemalloc.stop()
+
+        assert self._first_snapshot
+
+        top_stats = snapshot.statistics("lineno")
+        diff_stats = snapshot.compare_to(self._first_snapshot, "lineno")
+
+        lines = [
+            f"Memory profile of {time.strftime('%Y-%m-%d %H:%M:%S')}\n",
+            f"Traced memory: {current / 1024:.1f} KiB, peak: {peak / 1024:.1f} KiB\n",
+            f"\nLargest allocations (top {self.limit}):\n",
+        ]
+        lines.extend(f"{stat}\n" for stat in top_stats[: self.limit])
+        lines.append(f"\nLargest changes while profiling (top {self.limit}):\n")
+        lines.extend(f"{stat}\n" for stat in diff_stats[: self.limit])
+
+        with open(self.path, "w") as f:
+            f.writelines(lines)
+
+
+def create_profiler(mode: str, path: str) -> Profiler:
+    """
+    Creates a profiler for the given mode.
+
+    :param mode: One of :data:`PROFILING_MODES`.
+    :param path: Path of the file to save results to, without extension. The extension
+        for the result format of the mode is appended.
+    :returns: Profiler which has not been started yet.
+    :raises ValueError: for an unknown mode.
+    """
+    profiler_cls: type[Profiler]
+
+    if mode == "cprofile":
+        profiler_cls = CProfiler
+    elif mode == "sample":
+        profiler_cls = StackSampler
+    elif mode == "memory":
+        profiler_cls = MemoryProfiler
+    else:
+        raise ValueError(f"Unknown profiling mode '{mode}'")
+
+    return profiler_cls(path + profiler_cls.suffix)
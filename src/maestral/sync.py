@@ -7,9 +7,9 @@ import enum
 # system imports
 import errno
 import gc
+import json
 import os
 import os.path as osp
-import random
 import sqlite3
 import sys
 import threading
@@ -19,6 +19,7 @@ from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
 from pprint import pformat
 from queue import Empty, Queue
 from stat import S_ISDIR
@@ -60,7 +61,7 @@ from watchdog.events import (
 )
 
 # local imports
-from . import notify
+from . import metrics, notify, tracing
 from .client import DropboxClient
 from .config import MaestralConfig, MaestralState
 from .constants import (
@@ -80,11 +81,19 @@ from .core import (
 )
 from .database.core import Database
 from .database.orm import Manager
-from .database.query import AllQuery, AndQuery, MatchQuery, PathTreeQuery, Query
+from .database.query import (
+    AllQuery,
+    AndQuery,
+    InQuery,
+    MatchQuery,
+    PathTreeQuery,
+    Query,
+)
 from .errorhandling import convert_api_errors, os_to_maestral_error
 from .exceptions import (
     CacheDirError,
     CancelledError,
+    CursorResetError,
     DatabaseError,
     DataChangedError,
     FileConflictError,
@@ -99,7 +108,10 @@ from .exceptions import (
 )
 from .logging import scoped_logger
 from .models import (
+    ActivityChange,
+    ActivityUpdate,
     ChangeType,
+    DownloadQueueEntry,
     HashCacheEntry,
     IndexEntry,
     ItemType,
@@ -108,11 +120,19 @@ from .models import (
     SyncEvent,
     SyncStatus,
 )
-from .utils import exc_info_tuple, removeprefix, sanitize_string
+from .tracing import trace_iter, traced
+from .utils import (
+    exc_info_tuple,
+    parallel_chain,
+    prefetch,
+    sanitize_string,
+)
 from .utils.appdirs import get_data_path
 from .utils.caches import LRUCache
-from .utils.integration import CPU_CORE_COUNT, cpu_usage_percent
+from .utils.integration import CPU_CORE_COUNT, CPUGovernor
+from .utils.mignore import MignoreMatcher
 from .utils.path import (
+    PathTrie,
     content_hash,
     delete,
     equal_but_for_unicode_norm,
@@ -121,7 +141,6 @@ from .utils.path import (
     get_existing_equivalent_paths,
     get_symlink_target,
     getsize,
-    is_child,
     is_equal_or_child,
     is_fs_case_sensitive,
     isdir,
@@ -141,6 +160,7 @@ __all__ = [
     "SyncEngine",
     "ActivityNode",
     "ActivityTree",
+    "ActivitySubscription",
     "pf_repr",
 ]
 
@@ -149,9 +169,50 @@ os.umask(umask)
 
 NUM_THREADS = min(24, CPU_CORE_COUNT)
 
+# Stay below SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions (999).
+_SQL_VARIABLE_LIMIT = 900
+
+# Number of pages of remote changes to fetch while applying the current page.
+_PREFETCH_PAGES = 2
+
+# Prefix of the saved cursor of an interrupted parallel indexing.
+_SHARDED_CURSOR_PREFIX = "sharded:"
+
+# Number of local changes to upload at once when resuming sync.
+_LOCAL_CHANGES_BATCH_SIZE = 1000
+
+# Minimum interval in seconds between removing old events from the sync history.
+_HISTORY_PRUNE_INTERVAL = 60.0
+
+# Minimum interval in seconds between progress reports of parallel tasks.
+_PROGRESS_INTERVAL = 0.2
+
 P = ParamSpec("P")
 T = TypeVar("T")
 
+_HASH_CACHE_REQUESTS = metrics.registry.counter(
+    "maestral_hash_cache_requests_total",
+    "Number of lookups of local content hashes in the cache, by result.",
+    ("result",),
+)
+_SYNC_CYCLE_DURATION = metrics.registry.histogram(
+    "maestral_sync_cycle_duration_seconds",
+    "Duration of upload and download sync cycles.",
+    ("direction",),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+_WORKER_THREADS = metrics.registry.gauge(
+    "maestral_worker_threads",
+    "Maximum number of threads of worker pools.",
+    ("pool",),
+)
+_WORKER_TASK_DURATION = metrics.registry.histogram(
+    "maestral_worker_task_duration_seconds",
+    "Duration of tasks run by worker pools. The rate of the sum divided by the number "
+    "of worker threads gives the utilization of a pool.",
+    ("pool",),
+)
+
 # ======================================================================================
 # Syncing functionality
 # ======================================================================================
@@ -424,26 +485,93 @@ class ActivityNode:
     Each node represents an item in the local Dropbox folder. Apart from the root node,
     items will only be present if they or any of their children have any sync activity.
 
+    SyncEvents are only stored at the node which represents their path. Each node keeps
+    aggregate counters for itself and all of its children instead. Those are updated
+    incrementally by :class:`ActivityTree` when events are added, removed or change
+    their status, at a cost proportional to the depth of the node.
+
     :attr children: All children with sync activity. Leaf nodes must represent items
         that are being uploaded, downloaded, or have a sync error.
-    :attr sync_events: All SyncEvents of this node and its children.
+    :attr events: SyncEvents for the item represented by this node.
+    :attr num_events: Number of SyncEvents of this node and its children.
+    :attr num_uploading: Number of uploads in progress for this node and its children.
+    :attr num_downloading: Number of downloads in progress for this node and its
+        children.
+    :attr num_failed: Number of failed syncs for this node and its children.
+    :attr num_queued: Number of queued syncs for this node and its children.
+    :attr size: Total size in bytes of all SyncEvents of this node and its children.
+    :attr completed: Transferred bytes of all SyncEvents of this node and its children,
+        as of the last status update of each event.
     """
 
-    __slots__ = ["name", "parent", "children", "sync_events"]
-
-    def __init__(
-        self,
-        name: str,
-        sync_events: Iterable[SyncEvent] = (),
-        parent: ActivityNode | None = None,
-    ) -> None:
+    __slots__ = [
+        "name",
+        "parent",
+        "children",
+        "events",
+        "num_events",
+        "num_uploading",
+        "num_downloading",
+        "num_failed",
+        "num_queued",
+        "size",
+        "completed",
+    ]
+
+    def __init__(self, name: str, parent: ActivityNode | None = None) -> None:
         self.name = name
         self.parent = parent
         self.children: dict[str, ActivityNode] = {}
-        self.sync_events = set(sync_events)
+        self.events: set[SyncEvent] = set()
+        self.num_events = 0
+        self.num_uploading = 0
+        self.num_downloading = 0
+        self.num_failed = 0
+        self.num_queued = 0
+        self.size = 0
+        self.completed = 0
+
+    @property
+    def sync_events(self) -> set[SyncEvent]:
+        """
+        All SyncEvents of this node and its children. This traverses the subtree, use
+        the aggregate counters where possible.
+        """
+        sync_events: set[SyncEvent] = set()
+        nodes: list[ActivityNode] = [self]
+
+        while nodes:
+            node = nodes.pop()
+            sync_events.update(node.events)
+            nodes.extend(node.children.values())
+
+        return sync_events
 
     def __repr__(self) -> str:
-        return f"<{self.__class__.__name__}(name={self.name}, children={self.children}, sync_events={self.sync_events})>"
+        return (
+            f"<{self.__class__.__name__}(name={self.name}, "
+            f"children={self.children}, events={self.events})>"
+        )
+
+
+def _activity_counts(event: SyncEvent) -> tuple[int, int, int, int, int, int]:
+    """
+    Returns the contribution of a SyncEvent to the aggregate counters of an
+    :class:`ActivityNode`.
+
+    :param event: SyncEvent.
+    :returns: Tuple of (uploading, downloading, failed, queued, size, completed).
+    """
+    status = event.status
+    syncing = status is SyncStatus.Syncing
+    return (
+        int(syncing and event.direction is SyncDirection.Up),
+        int(syncing and event.direction is SyncDirection.Down),
+        int(status is SyncStatus.Failed),
+        int(status is SyncStatus.Queued),
+        event.size,
+        event.completed,
+    )
 
 
 class ActivityTree(ActivityNode):
@@ -452,22 +580,44 @@ class ActivityTree(ActivityNode):
     def __init__(self) -> None:
         super().__init__(name="/")
         self._lock = RLock()
+        # Counter contributions of all events in the tree, as last accounted for. The
+        # dict preserves insertion order and doubles as a flat index of all events.
+        self._counts: dict[SyncEvent, tuple[int, int, int, int, int, int]] = {}
+        self._subscriptions: set[ActivitySubscription] = set()
+
+    @property
+    def sync_events(self) -> set[SyncEvent]:
+        """All SyncEvents in the tree."""
+        with self._lock:
+            return set(self._counts)
+
+    def get_events(self, limit: int | None = None) -> list[SyncEvent]:
+        """
+        Returns SyncEvents in the tree, in the order they were added.
+
+        :param limit: Maximum number of events to return. If None, all events will be
+            returned.
+        :returns: List of SyncEvents.
+        """
+        with self._lock:
+            return list(islice(self._counts, limit))
 
     def add(self, event: SyncEvent) -> None:
         with self._lock:
-            parts = event.dbx_path.lstrip("/").split("/")
+            if event in self._counts:
+                self.update(event)
+                return
 
             # Remove any failures at this path.
             node = self.get_node(event.dbx_path)
             if node:
-                failed = [e for e in node.sync_events if e.status is SyncStatus.Failed]
+                failed = [e for e in node.events if e.status is SyncStatus.Failed]
                 for fail in failed:
                     self.remove(fail)
 
             # Traverse tree and create children as required.
-            # Insert SyncEvent for each parent as we move down.
+            parts = event.dbx_path.lstrip("/").split("/")
             current_node: ActivityNode = self
-            current_node.sync_events.add(event)
 
             for part in parts:
                 try:
@@ -475,28 +625,32 @@ class ActivityTree(ActivityNode):
                 except KeyError:
                     child_node = ActivityNode(part, parent=current_node)
                     current_node.children[part] = child_node
-                child_node.sync_events.add(event)
                 current_node = child_node
 
+            counts = _activity_counts(event)
+            current_node.events.add(event)
+            self._counts[event] = counts
+            self._propagate(current_node, 1, counts)
+            self._notify(event, ActivityChange.Added)
+
     def remove(self, event: SyncEvent) -> None:
         with self._lock:
             node = self.get_node(event.dbx_path)
             if not node:
                 raise KeyError(f"No node at path {event.dbx_path}")
-            if event not in node.sync_events:
+            if event not in node.events:
                 raise KeyError(f"SyncEvent not found at path {event.dbx_path}")
 
+            node.events.remove(event)
+            counts = self._counts.pop(event)
+            self._propagate(node, -1, tuple(-c for c in counts))
+            self._notify(event, ActivityChange.Removed)
+
             # Walk tree upwards. Remove nodes if no SyncEvents remain.
-            node.sync_events.remove(event)
             parent = node.parent
 
-            while parent:
-                # Remove event from parent.
-                parent.sync_events.remove(event)
-                # Remove node from tree if it is empty.
-                if len(node.sync_events) == 0:
-                    parent.children.pop(node.name)
-                # Move up.
+            while parent and node.num_events == 0:
+                parent.children.pop(node.name)
                 node = parent
                 parent = node.parent
 
@@ -506,6 +660,69 @@ class ActivityTree(ActivityNode):
         except KeyError:
             pass
 
+    def update(self, event: SyncEvent) -> None:
+        """
+        Updates the aggregate counters after the status or progress of an event in the
+        tree has changed. Does nothing if the event is not in the tree.
+
+        :param event: SyncEvent which has been modified.
+        """
+        with self._lock:
+            try:
+                old_counts = self._counts[event]
+            except KeyError:
+                return
+
+            new_counts = _activity_counts(event)
+
+            if new_counts != old_counts:
+                node = self.get_node(event.dbx_path)
+                if node:
+                    self._counts[event] = new_counts
+                    delta = tuple(n - o for n, o in zip(new_counts, old_counts))
+                    self._propagate(node, 0, delta)
+                    self._notify(event, ActivityChange.Updated)
+
+    def subscribe(
+        self, max_rate: float = 5.0, expire_after: float = 10 * 60
+    ) -> ActivitySubscription:
+        """
+        Subscribes to changes of the sync activity. The subscription will initially
+        report all events which are currently in the tree as added.
+
+        :param max_rate: Maximum number of times per second to deliver updates.
+        :param expire_after: Time in seconds after which the subscription expires if
+            it is not polled.
+        :returns: Subscription to collect changes from.
+        """
+        subscription = ActivitySubscription(max_rate, expire_after)
+
+        with self._lock:
+            for event in self._counts:
+                subscription.notify(event, ActivityChange.Added)
+            self._subscriptions.add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: ActivitySubscription) -> None:
+        """
+        Stops delivering changes to the given subscription.
+
+        :param subscription: Subscription returned by :meth:`subscribe`.
+        """
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def _notify(self, event: SyncEvent, change: ActivityChange) -> None:
+        for subscription in list(self._subscriptions):
+            if subscription.expired:
+                # Don't collect changes for subscribers which have gone away without
+                # unsubscribing.
+                self._subscriptions.discard(subscription)
+                subscription.clear()
+            else:
+                subscription.notify(event, change)
+
     def has_path(self, dbx_path: str) -> bool:
         return self.get_node(dbx_path) is not None
 
@@ -524,6 +741,161 @@ class ActivityTree(ActivityNode):
 
             return node
 
+    @staticmethod
+    def _propagate(
+        node: ActivityNode | None, num_events: int, delta: Sequence[int]
+    ) -> None:
+        uploading, downloading, failed, queued, size, completed = delta
+
+        while node:
+            node.num_events += num_events
+            node.num_uploading += uploading
+            node.num_downloading += downloading
+            node.num_failed += failed
+            node.num_queued += queued
+            node.size += size
+            node.completed += completed
+            node = node.parent
+
+
+class ActivitySubscription:
+    """Collects changes to an :class:`ActivityTree` for a single subscriber
+
+    Changes are coalesced per SyncEvent until the subscriber collects them, so that
+    only the latest state of each event is delivered. Events which are added and removed
+    between two calls are never reported. Transfer progress is sampled when updates are
+    collected.
+
+    A subscription expires when :meth:`get_updates` has not been called for
+    ``expire_after`` seconds. Expired subscriptions no longer collect changes.
+
+    :param max_rate: Maximum number of times per second that :meth:`get_updates` will
+        return.
+    :param expire_after: Time in seconds after the last poll until the subscription
+        expires.
+    """
+
+    def __init__(self, max_rate: float = 5.0, expire_after: float = 10 * 60) -> None:
+        if not max_rate > 0:
+            raise ValueError("max_rate must be > 0")
+
+        self._min_interval = 1 / max_rate
+        self._last_return = 0.0
+        self._cond = Condition()
+        self._pending: dict[SyncEvent, ActivityChange] = {}
+        # Last status and progress sent for each event.
+        self._sent: dict[SyncEvent, tuple[SyncStatus, int]] = {}
+        self.last_poll = time.monotonic()
+        self.expire_after = expire_after
+        self._num_polling = 0
+
+    @property
+    def expired(self) -> bool:
+        """Whether the subscription has not been polled for ``expire_after`` seconds."""
+        return (
+            self._num_polling == 0
+            and time.monotonic() - self.last_poll > self.expire_after
+        )
+
+    def clear(self) -> None:
+        """Discards all changes which have not been collected yet."""
+        with self._cond:
+            self._pending.clear()
+            self._sent.clear()
+
+    def notify(self, event: SyncEvent, change: ActivityChange) -> None:
+        """
+        Registers a change of an event. Called by the :class:`ActivityTree`.
+
+        :param event: SyncEvent which changed.
+        :param change: Type of change.
+        """
+        with self._cond:
+            if change is ActivityChange.Updated and event in self._pending:
+                # Updates are always collected with the latest state of the event.
+                return
+            self._pending[event] = change
+            self._cond.notify_all()
+
+    def get_updates(self, timeout: float | None = 60) -> list[ActivityUpdate]:
+        """
+        Blocks until there are changes or until a timeout occurs. Will return at most
+        ``max_rate`` times per second.
+
+        :param timeout: Maximum time to block before returning, even if there are no
+            changes.
+        :returns: Changes since the last call.
+        """
+        with self._cond:
+            self.last_poll = time.monotonic()
+            self._num_polling += 1
+
+        try:
+            delay = self._min_interval - (self.last_poll - self._last_return)
+
+            if delay > 0:
+                time.sleep(delay)
+
+            deadline = None if timeout is None else time.monotonic() + timeout
+
+            with self._cond:
+                while True:
+                    updates = self._collect()
+                    now = time.monotonic()
+                    remaining = None if deadline is None else deadline - now
+
+                    if updates or (remaining is not None and remaining <= 0):
+                        break
+
+                    # Wake up regularly to sample transfer progress.
+                    wait = self._min_interval
+                    if remaining is not None:
+                        wait = min(wait, remaining)
+                    self._cond.wait(wait)
+        finally:
+            with self._cond:
+                self._last_return = self.last_poll = time.monotonic()
+                self._num_polling -= 1
+
+        return updates
+
+    def _collect(self) -> list[ActivityUpdate]:
+        updates: list[ActivityUpdate] = []
+
+        for event, change in self._pending.items():
+            if change is ActivityChange.Removed:
+                if self._sent.pop(event, None) is not None:
+                    updates.append(self._to_update(event, change))
+            else:
+                if event not in self._sent:
+                    change = ActivityChange.Added
+                self._sent[event] = (event.status, event.completed)
+                updates.append(self._to_update(event, change))
+
+        pending = self._pending
+        self._pending = {}
+
+        # Report progress of transfers.
+        for event, (status, completed) in self._sent.items():
+            if event not in pending and event.completed != completed:
+                self._sent[event] = (status, event.completed)
+                updates.append(self._to_update(event, ActivityChange.Updated))
+
+        return updates
+
+    @staticmethod
+    def _to_update(event: SyncEvent, change: ActivityChange) -> ActivityUpdate:
+        return ActivityUpdate(
+            change=change,
+            key=id(event),
+            dbx_path=event.dbx_path,
+            direction=event.direction,
+            status=event.status,
+            change_type=event.change_type,
+            size=event.size,
+            completed=event.completed,
+        )
+
 
 class SyncEngine:
     """Class that handles syncing with Dropbox
@@ -549,6 +921,7 @@ class SyncEngine:
 
         self._conf = MaestralConfig(self.config_name)
         self._state = MaestralState(self.config_name)
+        self._cpu_governor = CPUGovernor(max_percent=100 * CPU_CORE_COUNT)
         self.reload_cached_config()
 
         self.desktop_notifier = desktop_notifier
@@ -557,7 +930,7 @@ class SyncEngine:
         self.sync_lock = RLock()  # Upload and download cycles.
         self._db_lock = RLock()  # DB access.
         self._tree_traversal = RLock()  # Sync activity across multiple levels.
-        max_parallel_downloads = self._conf.get("app", "max_parallel_uploads")
+        max_parallel_downloads = self._conf.get("app", "max_parallel_downloads")
         self._parallel_down_semaphore = threading.Semaphore(max_parallel_downloads)
         max_parallel_uploads = self._conf.get("app", "max_parallel_uploads")
         self._parallel_up_semaphore = threading.Semaphore(max_parallel_uploads)
@@ -568,6 +941,11 @@ class SyncEngine:
         # Data structures for user information.
         self.activity = ActivityTree()
 
+        # Completed sync events which have not been saved to the history yet.
+        self._history_buffer: list[SyncEvent] = []
+        self._history_lock = threading.Lock()
+        self._last_history_pruning = 0.0
+
         # Initialize SQLite database.
         self._db_path = get_data_path("maestral", f"{self.config_name}.db")
 
@@ -604,6 +982,7 @@ class SyncEngine:
             self._history_table = Manager(self._db, SyncEvent)
             self._hash_table = Manager(self._db, HashCacheEntry)
             self._sync_errors_table = Manager(self._db, SyncErrorEntry)
+            self._download_queue_table = Manager(self._db, DownloadQueueEntry)
 
     def reload_cached_config(self) -> None:
         """
@@ -614,17 +993,27 @@ class SyncEngine:
         self._dropbox_path: str = self._conf.get("sync", "path")
         self._mignore_path: str = osp.join(self._dropbox_path, MIGNORE_FILE)
         self._file_cache_path: str = osp.join(self._dropbox_path, FILE_CACHE)
+        self._update_dropbox_path_prefixes()
 
         self._excluded_items: set[str] = set(self._conf.get("sync", "excluded_items"))
+        self._excluded_items_trie = PathTrie(self._excluded_items)
         self._max_cpu_percent: float = (
             self._conf.get("sync", "max_cpu_percent") * CPU_CORE_COUNT
         )
+        self._cpu_governor.max_percent = self._max_cpu_percent
         self._local_cursor: float = self._state.get("sync", "lastsync")
 
         self._is_fs_case_sensitive = self._check_fs_case_sensitive()
 
         self.load_mignore_file()
 
+    def _update_dropbox_path_prefixes(self) -> None:
+        # Precompute the prefixes of local paths inside the Dropbox folder for
+        # converting them to Dropbox paths, see :meth:`_relative_to_dropbox_path`.
+        self._dropbox_path_lower = normalize(self._dropbox_path)
+        self._dropbox_path_prefix = self._dropbox_path.rstrip("/") + "/"
+        self._dropbox_path_prefix_lower = self._dropbox_path_lower.rstrip("/") + "/"
+
     def _check_fs_case_sensitive(self) -> bool:
         try:
             return is_fs_case_sensitive(self._dropbox_path)
@@ -654,6 +1043,7 @@ class SyncEngine:
             self._dropbox_path = path
             self._mignore_path = osp.join(self._dropbox_path, MIGNORE_FILE)
             self._file_cache_path = osp.join(self._dropbox_path, FILE_CACHE)
+            self._update_dropbox_path_prefixes()
             self._conf.set("sync", "path", path)
 
             self._is_fs_case_sensitive = self._check_fs_case_sensitive()
@@ -689,6 +1079,7 @@ class SyncEngine:
         """Setter: excluded_items"""
         with self.sync_lock:
             self._excluded_items = self.clean_excluded_items_list(dbx_paths)
+            self._excluded_items_trie = PathTrie(self._excluded_items)
             self._conf.set("sync", "excluded_items", list(self._excluded_items))
 
     @staticmethod
@@ -703,11 +1094,14 @@ class SyncEngine:
         # Remove duplicate entries by creating set, strip trailing '/'.
         dbx_paths_lower = {normalize(f).rstrip("/") for f in dbx_paths}
 
-        # Remove all children of excluded folders.
-        for path in dbx_paths_lower.copy():
-            dbx_paths_lower = {p for p in dbx_paths_lower if not is_child(p, path)}
+        # Remove all children of excluded folders. Parents are sorted before children.
+        cleaned = PathTrie()
+
+        for path in sorted(dbx_paths_lower, key=lambda p: p.count("/")):
+            if not cleaned.contains_equal_or_parent(path):
+                cleaned.add(path)
 
-        return dbx_paths_lower
+        return set(cleaned)
 
     @property
     def max_cpu_percent(self) -> float:
@@ -722,6 +1116,7 @@ class SyncEngine:
     def max_cpu_percent(self, percent: float) -> None:
         """Setter: max_cpu_percent."""
         self._max_cpu_percent = percent
+        self._cpu_governor.max_percent = percent
         self._conf.set("sync", "max_cpu_percent", percent // CPU_CORE_COUNT)
 
     # ==== Sync state ==================================================================
@@ -774,10 +1169,19 @@ class SyncEngine:
         full indexing should take place."""
         return self._state.get("sync", "last_reindex")
 
-    def get_history(self, dbx_path: str | None = None) -> list[SyncEvent]:
+    def get_history(
+        self, dbx_path: str | None = None, limit: int | None = None
+    ) -> list[SyncEvent]:
         """A list of the last SyncEvents in our history. History will be kept for the
         interval specified by the config value ``keep_history`` (defaults to two weeks)
-        but at most 1,000 events will be kept."""
+        but at most 1,000 events will be kept.
+
+        :param dbx_path: If given, return events for the given Dropbox path only.
+        :param limit: If given, return only this number of most recent events.
+        :returns: List of sync events, sorted by time with the oldest event first.
+        """
+        self._commit_history()
+
         with self._database_access():
             query: Query
             if dbx_path is None:
@@ -785,8 +1189,17 @@ class SyncEngine:
             else:
                 query = MatchQuery(SyncEvent.dbx_path, dbx_path)
 
+            # Sort by the expression of the indexes on the history table.
             order_expr = "IFNULL(change_time, sync_time)"
-            sync_events = self._history_table.select(query.order_by(order_expr))
+
+            if limit is None:
+                return self._history_table.select(query.order_by(order_expr))
+
+            clause, args = query.clause()
+            sync_events = self._history_table.select_sql(
+                f"WHERE {clause} ORDER BY {order_expr} DESC LIMIT ?", *args, limit
+            )
+            sync_events.reverse()
             return sync_events
 
     def reset_sync_state(self) -> None:
@@ -794,11 +1207,15 @@ class SyncEngine:
         if self.busy():
             raise RuntimeError("Cannot reset sync state while syncing.")
 
+        with self._history_lock:
+            self._history_buffer.clear()
+
         with self._database_access():
             self._index_table.clear()
             self._history_table.clear()
             self._sync_errors_table.clear()
             self._hash_table.clear()
+            self._download_queue_table.clear()
 
         self._state.reset_to_defaults("sync")
         self.reload_cached_config()
@@ -881,6 +1298,113 @@ class SyncEngine:
         if event.dbx_path_from_lower is not None:
             self.clear_sync_errors_for_path(event.dbx_path_from_lower, recursive)
 
+    # ==== Download queue ==============================================================
+
+    def queue_downloads(
+        self,
+        dbx_paths_lower: Iterable[str],
+        priority: int = 0,
+        in_progress: Collection[str] = (),
+    ) -> int:
+        """
+        Adds items to the persistent queue of pending downloads. Items which are already
+        queued or which have a queued parent folder are skipped, since they will be
+        downloaded anyways. Queued children of added items are removed from the queue.
+
+        :param dbx_paths_lower: Normalized lower case Dropbox paths to download.
+        :param priority: Priority of the downloads. Items with a higher priority are
+            returned first by :meth:`get_queued_downloads`.
+        :param in_progress: Queued items which are currently being downloaded. They
+            may already have been walked past the added items and therefore do not
+            cover them.
+        :returns: Number of items which were added to the queue.
+        """
+        # Sort so that parents are handled before their children.
+        paths = PathTrie()
+
+        for dbx_path_lower in sorted(set(dbx_paths_lower)):
+            if not paths.contains_equal_or_parent(dbx_path_lower):
+                paths.add(dbx_path_lower)
+
+        queued_time = time.time()
+        n_added = 0
+
+        with self._database_access():
+            with self._db.transaction():
+                for dbx_path_lower in paths:
+                    parts = dbx_path_lower.split("/")
+                    parents = ["/".join(parts[:i]) for i in range(2, len(parts) + 1)]
+                    parents_query = InQuery(DownloadQueueEntry.dbx_path_lower, parents)
+
+                    queued_parents = self._download_queue_table.select(parents_query)
+
+                    if any(
+                        e.dbx_path_lower not in in_progress for e in queued_parents
+                    ):
+                        continue
+
+                    children_query = PathTreeQuery(
+                        DownloadQueueEntry.dbx_path_lower, dbx_path_lower
+                    )
+                    self._download_queue_table.delete(children_query)
+
+                    entry = DownloadQueueEntry(
+                        dbx_path_lower=dbx_path_lower,
+                        priority=priority,
+                        queued_time=queued_time,
+                    )
+                    self._download_queue_table.save(entry)
+                    n_added += 1
+
+        return n_added
+
+    def get_queued_downloads(self, limit: int | None = None) -> list[str]:
+        """
+        Returns items in the queue of pending downloads, in order of priority and then
+        in the order in which they were queued. Items remain in the queue until removed
+        with :meth:`remove_queued_downloads`.
+
+        :param limit: Maximum number of items to return.
+        :returns: List of normalized lower case Dropbox paths.
+        """
+        sql = "ORDER BY priority DESC, queued_time"
+
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        with self._database_access():
+            entries = self._download_queue_table.select_sql(sql)
+
+        return [entry.dbx_path_lower for entry in entries]
+
+    def remove_queued_downloads(self, dbx_paths_lower: Sequence[str]) -> None:
+        """
+        Removes items from the queue of pending downloads.
+
+        :param dbx_paths_lower: Normalized lower case Dropbox paths.
+        """
+        with self._database_access():
+            with self._db.transaction():
+                for i in range(0, len(dbx_paths_lower), _SQL_VARIABLE_LIMIT):
+                    chunk = dbx_paths_lower[i : i + _SQL_VARIABLE_LIMIT]
+                    query = InQuery(DownloadQueueEntry.dbx_path_lower, chunk)
+                    self._download_queue_table.delete(query)
+
+    def is_download_queued(self, dbx_path_lower: str) -> bool:
+        """
+        :param dbx_path_lower: Normalized lower case Dropbox path.
+        :returns: Whether the item is in the queue of pending downloads.
+        """
+        with self._database_access():
+            return self._download_queue_table.has(dbx_path_lower)
+
+    def queued_downloads_count(self) -> int:
+        """
+        :returns: Number of items in the queue of pending downloads.
+        """
+        with self._database_access():
+            return self._download_queue_table.count()
+
     # ==== Index access and management =================================================
 
     def get_index(self) -> list[IndexEntry]:
@@ -925,6 +1449,58 @@ class SyncEngine:
 
         return None
 
+    def get_index_entries(
+        self, dbx_paths_lower: Collection[str]
+    ) -> dict[str, IndexEntry]:
+        """
+        Gets the index entries for multiple Dropbox paths with as few queries as
+        possible.
+
+        :param dbx_paths_lower: Normalized lower case Dropbox paths.
+        :returns: Mapping of Dropbox paths to index entries. Paths without an index
+            entry will be missing from the mapping.
+        """
+        dbx_paths_lower = list(dbx_paths_lower)
+        entries: dict[str, IndexEntry] = {}
+
+        with self._database_access():
+            for i in range(0, len(dbx_paths_lower), _SQL_VARIABLE_LIMIT):
+                chunk = dbx_paths_lower[i : i + _SQL_VARIABLE_LIMIT]
+                query = InQuery(IndexEntry.dbx_path_lower, chunk)
+                for entry in self._index_table.select(query):
+                    entries[entry.dbx_path_lower] = entry
+
+        return entries
+
+    def get_index_entries_for_local_paths(
+        self, local_paths: Iterable[str]
+    ) -> dict[str, IndexEntry]:
+        """
+        Gets the index entries for multiple local paths. This performs the same checks
+        as :meth:`get_index_entry_for_local_path` but uses bulk queries.
+
+        :param local_paths: Local paths as returned by file system APIs.
+        :returns: Mapping of local paths to index entries. Paths without an index entry
+            will be missing from the mapping.
+        """
+        dbx_paths_cased = {path: self.to_dbx_path(path) for path in local_paths}
+        dbx_paths_lower = {
+            path: normalize(dbx_path) for path, dbx_path in dbx_paths_cased.items()
+        }
+
+        index_entries = self.get_index_entries(set(dbx_paths_lower.values()))
+        entries: dict[str, IndexEntry] = {}
+
+        for path, dbx_path_lower in dbx_paths_lower.items():
+            index_entry = index_entries.get(dbx_path_lower)
+
+            if index_entry and equal_but_for_unicode_norm(
+                index_entry.dbx_path_cased, dbx_paths_cased[path]
+            ):
+                entries[path] = index_entry
+
+        return entries
+
     def iter_index(self) -> Iterator[IndexEntry]:
         """
         Returns an iterator over the local index of synced files and folders.
@@ -1099,9 +1675,15 @@ class SyncEngine:
             cache_entry = self._hash_table.get(stat.st_ino)
 
             if cache_entry and cache_entry.mtime == mtime:
+                _HASH_CACHE_REQUESTS.inc(1, "hit")
                 return cache_entry.hash_str
 
-        with convert_api_errors(local_path=local_path):
+        _HASH_CACHE_REQUESTS.inc(1, "miss")
+
+        with (
+            convert_api_errors(local_path=local_path),
+            tracing.tracer.span("content_hash"),
+        ):
             hash_str, mtime = content_hash(local_path)
 
         self._save_local_hash(stat.st_ino, local_path, hash_str, mtime)
@@ -1164,6 +1746,7 @@ class SyncEngine:
             spec = ""
 
         self._mignore_rules = PathSpec.from_lines("gitwildmatch", spec.splitlines())
+        self._mignore_matcher = MignoreMatcher(self._mignore_rules)
 
     # ==== Helper functions ============================================================
 
@@ -1362,6 +1945,50 @@ class SyncEngine:
 
         return dbx_path_cased
 
+    def correct_case_batch(self, entries: Iterable[Metadata]) -> None:
+        """
+        Resolves the casing of all parent folders of the given Dropbox items at once
+        and adds them to our cache. Subsequent calls to :meth:`correct_case` for those
+        items will not require any further lookups.
+
+        The casing of each parent folder is taken, in order of preference, from our
+        cache, from folder entries in ``entries`` themselves, from our index with a
+        single bulk query, and only for the remaining folders from Dropbox servers.
+
+        :param entries: Dropbox metadata, typically a page of results from
+            :meth:`maestral.client.DropboxClient.list_folder_iterator`.
+        """
+        folders: dict[str, str] = {}
+        ancestors: set[str] = set()
+
+        for md in entries:
+            dbx_path_lower = normalize(md.path_display)
+
+            if isinstance(md, FolderMetadata):
+                folders[dbx_path_lower] = md.path_display
+
+            dirname = osp.dirname(dbx_path_lower)
+
+            while dirname != "/" and dirname not in ancestors:
+                ancestors.add(dirname)
+                dirname = osp.dirname(dirname)
+
+        unknown = {p for p in ancestors if not self._case_conversion_cache.get(p)}
+
+        # Prefer casing from the batch, it is more recent than our index.
+        index_entries = self.get_index_entries(unknown.difference(folders))
+
+        for dbx_path_lower, entry in index_entries.items():
+            self._case_conversion_cache.put(dbx_path_lower, entry.dbx_path_cased)
+            unknown.discard(dbx_path_lower)
+
+        # Resolve top-down so that each folder finds its parent in the cache.
+        for dbx_path_lower in sorted(unknown, key=lambda p: p.count("/")):
+            if dbx_path_lower in folders:
+                self.correct_case(folders[dbx_path_lower])
+            else:
+                self._correct_case_helper(dbx_path_lower, dbx_path_lower)
+
     def to_dbx_path(self, local_path: str | bytes) -> str:
         """
         Converts a local path to a path relative to the Dropbox folder. Casing of the
@@ -1371,13 +1998,42 @@ class SyncEngine:
         :returns: Relative path with respect to Dropbox folder.
         :raises ValueError: When the path lies outside the local Dropbox folder.
         """
-        path = os.fsdecode(local_path)
+        path = local_path if isinstance(local_path, str) else os.fsdecode(local_path)
+        dbx_path = self._relative_to_dropbox_path(path)
 
-        if not is_equal_or_child(path, self.dropbox_path, self.is_fs_case_sensitive):
+        if dbx_path is None:
             raise ValueError(f'"{path}" is not in "{self.dropbox_path}"')
-        return "/" + removeprefix(
-            path, self.dropbox_path, self.is_fs_case_sensitive
-        ).lstrip("/")
+        return dbx_path
+
+    def _relative_to_dropbox_path(self, path: str) -> str | None:
+        """
+        Implements :meth:`to_dbx_path` with prefixes of the Dropbox folder computed in
+        advance, without raising an exception for paths outside the Dropbox folder.
+
+        :param path: Absolute path on local drive.
+        :returns: Relative path with respect to Dropbox folder or None if the path lies
+            outside the Dropbox folder.
+        :raises ValueError: When the path lies inside the Dropbox folder only after
+            normalization but does not start with the Dropbox folder path.
+        """
+        root = self._dropbox_path
+
+        if self._is_fs_case_sensitive:
+            path_cmp = path
+            root_cmp = root
+            prefix_cmp = self._dropbox_path_prefix
+        else:
+            path_cmp = normalize(path)
+            root_cmp = self._dropbox_path_lower
+            prefix_cmp = self._dropbox_path_prefix_lower
+
+        if not (path_cmp.rstrip("/").startswith(prefix_cmp) or path == root):
+            return None
+
+        if not path_cmp.startswith(root_cmp):
+            raise ValueError(f'"{path}" does not start with "{root}"')
+
+        return "/" + path[len(root) :].lstrip("/")
 
     def to_dbx_path_lower(self, local_path: str | bytes) -> str:
         """
@@ -1431,7 +2087,8 @@ class SyncEngine:
             just a file name. Does not need to be normalized.
         :returns: Whether the path is excluded from syncing.
         """
-        path = os.fsdecode(path)
+        if not isinstance(path, str):
+            path = os.fsdecode(path)
         dirname, basename = osp.split(path)
 
         # Is in excluded files?
@@ -1440,8 +2097,11 @@ class SyncEngine:
 
         # Is in excluded dirs?
         try:
-            dbx_dirname = self.to_dbx_path(dirname)
+            dbx_dirname = self._relative_to_dropbox_path(dirname)
         except ValueError:
+            dbx_dirname = None
+
+        if dbx_dirname is None:
             # Path is already relative to Dropbox.
             dbx_dirname = dirname
 
@@ -1470,7 +2130,17 @@ class SyncEngine:
         :param dbx_path_lower: Normalised lower case Dropbox path.
         :returns: Whether the path is excluded from download syncing by the user.
         """
-        return any(is_equal_or_child(dbx_path_lower, p) for p in self.excluded_items)
+        return self._excluded_items_trie.contains_equal_or_parent(dbx_path_lower)
+
+    def has_excluded_children(self, dbx_path_lower: str) -> bool:
+        """
+        Check if any children of a folder have been excluded through "selective sync"
+        by the user.
+
+        :param dbx_path_lower: Normalised lower case Dropbox path.
+        :returns: Whether any children of the path are excluded from download syncing.
+        """
+        return self._excluded_items_trie.contains_child(dbx_path_lower)
 
     def is_mignore(self, event: SyncEvent) -> bool:
         """
@@ -1491,27 +2161,24 @@ class SyncEngine:
 
         if is_dir:
             relative_path = f"{relative_path}/"
-        return self.mignore_rules.match_file(relative_path)
+        return self._mignore_matcher.match_file(relative_path)
 
     def _slow_down(self) -> None:
         """
-        Pauses if CPU usage is too high if called from one of our thread pools.
+        Pauses if CPU usage is too high if called from one of our thread pools. CPU usage
+        is sampled by a shared :class:`maestral.utils.integration.CPUGovernor`.
         """
-        if self._max_cpu_percent == 100 * CPU_CORE_COUNT:
+        if self._cpu_governor.wait(timeout=0):
             return
 
-        cpu_usage = cpu_usage_percent()
+        thread_name = current_thread().name
+        cpu_usage = round(self._cpu_governor.usage, 1)
+        self._logger.debug(f"{thread_name}: {cpu_usage}% CPU usage - throttling")
 
-        if cpu_usage > self._max_cpu_percent:
-            thread_name = current_thread().name
-            self._logger.debug(f"{thread_name}: {cpu_usage}% CPU usage - throttling")
+        self._cpu_governor.wait()
 
-            while cpu_usage > self._max_cpu_percent:
-                cpu_usage = cpu_usage_percent(0.5 + 2 * random.random())
-
-            self._logger.debug(
-                f"{thread_name}: {cpu_usage}% CPU usage - end throttling"
-            )
+        cpu_usage = round(self._cpu_governor.usage, 1)
+        self._logger.debug(f"{thread_name}: {cpu_usage}% CPU usage - end throttling")
 
     def cancel_sync(self) -> None:
         """
@@ -1621,7 +2288,7 @@ class SyncEngine:
         new_exc = None
 
         try:
-            with self._db_lock:
+            with tracing.tracer.leaf_span("database_access", "db"), self._db_lock:
                 yield
         except sqlite3.OperationalError as exc:
             title = "Database transaction error"
@@ -1660,6 +2327,7 @@ class SyncEngine:
     def _sync_event_from_fs_event(self, fs_event: FileSystemEvent) -> SyncEvent:
         return SyncEvent.from_file_system_event(fs_event, self)
 
+    @traced()
     def _sync_events_from_fs_events(
         self, fs_events: list[FileSystemEvent]
     ) -> list[SyncEvent]:
@@ -1678,8 +2346,11 @@ class SyncEngine:
         """
         Collects changes while sync has not been running and uploads them to Dropbox.
         Call this method when resuming sync.
+
+        Changes are uploaded in batches while the local folder is still being indexed,
+        such that memory usage does not grow with the number of changes.
         """
-        with self.sync_lock:
+        with self.sync_lock, tracing.tracer.span("upload_local_changes_while_inactive"):
             # Delete upload sync errors before starting indexing. This prevents errors
             # from now deleted or ignored (.mignore) items from lingering on. All other
             # sync errors will be retried automatically by comparing local items against
@@ -1692,35 +2363,56 @@ class SyncEngine:
 
             self._logger.info("Indexing local changes...")
 
-            try:
-                events, local_cursor = self._get_local_changes_while_inactive()
-            except OSError as err:
-                if err.filename == self.dropbox_path:
-                    self.ensure_dropbox_folder_present()
-
-                raise os_to_maestral_error(err)
+            snapshot_time = time.time()
+            n_changes = 0
 
-            events = self._clean_local_events(events)
+            events_iter = trace_iter(
+                self._iter_local_changes_while_inactive(snapshot_time),
+                "index_local_changes",
+            )
 
-            sync_events = self._sync_events_from_fs_events(events)
-            del events
+            for events in events_iter:
+                events = self._clean_local_events(events)
+                sync_events = self._sync_events_from_fs_events(events)
+                del events
 
-            if len(sync_events) > 0:
+                n_changes += len(sync_events)
                 self.apply_local_changes(sync_events)
+                del sync_events
+
+            if n_changes > 0:
                 self._logger.debug("Uploaded local changes while inactive")
             else:
                 self._logger.debug("No local changes while inactive")
 
-            del sync_events
             gc.collect()
 
-            self.local_cursor = local_cursor
+            self.local_cursor = snapshot_time
+            self._state.flush()
 
             self._clear_caches()
 
     def _get_local_changes_while_inactive(self) -> tuple[list[FileSystemEvent], float]:
         """
         Retrieves all local changes since the last sync by performing a full scan of the
+        local folder. See :meth:`_iter_local_changes_while_inactive` for details.
+
+        :returns: Tuple containing local file system events and a cursor / timestamp
+            for the changes.
+        """
+        snapshot_time = time.time()
+        changes: list[FileSystemEvent] = []
+
+        for events in self._iter_local_changes_while_inactive(snapshot_time):
+            changes.extend(events)
+
+        return changes, snapshot_time
+
+    def _iter_local_changes_while_inactive(
+        self, snapshot_time: float, batch_size: int = _LOCAL_CHANGES_BATCH_SIZE
+    ) -> Iterator[list[FileSystemEvent]]:
+        """
+        Retrieves local changes since the last sync by performing a full scan of the
         local folder. Changes are detected by comparing the new directory snapshot to
         our index.
 
@@ -1733,13 +2425,111 @@ class SyncEngine:
         not use the ctime here to avoid resyncing the entire folder after it has been
         moved (moving between partitions and on some file systems can change the ctime).
 
-        :returns: Tuple containing local file system events and a cursor / timestamp
-            for the changes.
+        Changes are returned in batches of up to ``batch_size`` events while the scan is
+        in progress. All deletions are returned before any other changes, parent folders
+        are returned before their children and deletions of children are omitted when
+        their parent folder was deleted. Batches can therefore be applied in order
+        before the scan completes, while only the current batch is held in memory.
+
+        :param snapshot_time: Time when the scan was started. Only items modified before
+            this time are reported.
+        :param batch_size: Maximum number of events per batch. A type change will be
+            reported as a deletion and creation in the same batch and may exceed this
+            limit by one.
+        :returns: Iterator over batches of local file system events.
+        """
+        try:
+            self.ensure_dropbox_folder_present()
+            yield from self._iter_local_deletions_while_inactive(batch_size)
+            yield from self._iter_local_changes_in_snapshot(snapshot_time, batch_size)
+        except OSError as err:
+            if err.filename == self.dropbox_path:
+                self.ensure_dropbox_folder_present()
+
+            raise os_to_maestral_error(err)
+
+        duration = time.time() - snapshot_time
+        self._logger.debug("Local indexing completed in %s sec", round(duration, 4))
+
+    def _iter_local_deletions_while_inactive(
+        self, batch_size: int
+    ) -> Iterator[list[FileSystemEvent]]:
+        """
+        Retrieves items from our index which no longer exist locally or are now excluded
+        by mignore rules. The index is read in pages ordered by path, such that folders
+        are found before their children and the database is not locked while the
+        returned batches are applied.
+
+        :param batch_size: Maximum number of events per batch.
+        :returns: Iterator over batches of deletion events.
+        """
+        changes: list[FileSystemEvent] = []
+        deleted_folders = PathTrie()
+        last_path: bytes = b""
+
+        while True:
+            with self._database_access():
+                entries = self._index_table.select_sql(
+                    "WHERE dbx_path_lower > ? ORDER BY dbx_path_lower LIMIT ?",
+                    last_path,
+                    batch_size,
+                )
+
+            if len(entries) == 0:
+                break
+
+            last_path = os.fsencode(entries[-1].dbx_path_lower)
+
+            for entry in entries:
+                if deleted_folders.contains_equal_or_parent(entry.dbx_path_lower):
+                    # Children are deleted together with their parent folder.
+                    continue
+
+                local_path_indexed = self.to_local_path_from_cased(entry.dbx_path_cased)
+                is_mignore = self._is_mignore_path(
+                    entry.dbx_path_cased, entry.is_directory
+                )
+
+                if is_mignore or not self._exists_with_given_casing(local_path_indexed):
+                    event: FileSystemEvent
+
+                    if entry.is_directory:
+                        event = DirDeletedEvent(local_path_indexed)
+                        deleted_folders.add(entry.dbx_path_lower)
+                    else:
+                        event = FileDeletedEvent(local_path_indexed)
+                    changes.append(event)
+
+                if len(changes) >= batch_size:
+                    yield self._checked_local_deletions(changes)
+                    changes = []
+
+        if changes:
+            yield self._checked_local_deletions(changes)
+
+    def _checked_local_deletions(
+        self, changes: list[FileSystemEvent]
+    ) -> list[FileSystemEvent]:
+        # Ensure that the local Dropbox folder still exists before returning deletions.
+        # This prevents a deletion of the Dropbox folder from being incorrectly
+        # processed as individual file deletions.
+        self.ensure_dropbox_folder_present()
+        self._logger.debug("Retrieved local deletions:\n%s", pf_repr(changes))
+        return changes
+
+    def _iter_local_changes_in_snapshot(
+        self, snapshot_time: float, batch_size: int
+    ) -> Iterator[list[FileSystemEvent]]:
+        """
+        Walks the local folder and retrieves items which were added or modified. Folders
+        are walked top-down, such that parents are found before their children.
+
+        :param snapshot_time: Time when the scan was started.
+        :param batch_size: Maximum number of events per batch.
+        :returns: Iterator over batches of creation and modification events.
         """
         changes: list[FileSystemEvent] = []
-        snapshot_time = time.time()
 
-        # Get modified or added items.
         for local_path, stat in walk(self.dropbox_path, self._scandir_with_ignore):
             is_dir = S_ISDIR(stat.st_mode)
             index_entry = self.get_index_entry_for_local_path(local_path)
@@ -1787,28 +2577,14 @@ class SyncEngine:
                     event1 = FileCreatedEvent(local_path)
                     changes += [event0, event1]
 
-        # Get deleted items.
-        for entry in self.iter_index():
-            local_path_indexed = self.to_local_path_from_cased(entry.dbx_path_cased)
-            is_mignore = self._is_mignore_path(entry.dbx_path_cased, entry.is_directory)
-
-            if is_mignore or not self._exists_with_given_casing(local_path_indexed):
-                if entry.is_directory:
-                    event = DirDeletedEvent(local_path_indexed)
-                else:
-                    event = FileDeletedEvent(local_path_indexed)
-                changes.append(event)
-
-        # Ensure that the local Dropbox folder still exists before returning changes.
-        # This prevents a deletion of the Dropbox folder from being incorrectly
-        # processed as individual file deletions.
-        self.ensure_dropbox_folder_present()
+            if len(changes) >= batch_size:
+                self._logger.debug("Retrieved local changes:\n%s", pf_repr(changes))
+                yield changes
+                changes = []
 
-        duration = time.time() - snapshot_time
-        self._logger.debug("Local indexing completed in %s sec", round(duration, 4))
-        self._logger.debug("Retrieved local changes:\n%s", pf_repr(changes))
-
-        return changes, snapshot_time
+        if changes:
+            self._logger.debug("Retrieved local changes:\n%s", pf_repr(changes))
+            yield changes
 
     def _exists_with_given_casing(self, local_path: str) -> bool:
         """
@@ -1851,7 +2627,11 @@ class SyncEngine:
         Handles updating the local cursor for you. If monitoring for local file events
         was interrupted, call :meth:`upload_local_changes_while_inactive` instead.
         """
-        with self.sync_lock:
+        with (
+            self.sync_lock,
+            _SYNC_CYCLE_DURATION.time("up"),
+            tracing.tracer.span("upload_sync_cycle"),
+        ):
             changes, cursor = self.list_local_changes()
             self.apply_local_changes(changes)
 
@@ -1868,6 +2648,7 @@ class SyncEngine:
             if self._cancel_requested.is_set():
                 raise CancelledError("Sync cancelled")
 
+    @traced()
     def list_local_changes(self, delay: float = 1) -> tuple[list[SyncEvent], float]:
         """
         Returns a list of local changes with at most one entry per path.
@@ -1898,6 +2679,7 @@ class SyncEngine:
 
         return sync_events, local_cursor
 
+    @traced()
     def apply_local_changes(
         self, sync_events: Collection[SyncEvent]
     ) -> list[SyncEvent]:
@@ -1975,6 +2757,7 @@ class SyncEngine:
 
         return results
 
+    @traced()
     def _clean_local_events(
         self, events: Collection[FileSystemEvent]
     ) -> list[FileSystemEvent]:
@@ -2304,32 +3087,35 @@ class SyncEngine:
         self._slow_down()
 
         event.status = SyncStatus.Syncing
+        self.activity.update(event)
 
-        try:
-            if event.is_file and (event.is_added or event.is_changed):
-                status = self._on_local_file_modified(event)
-            elif event.is_directory and event.is_added:
-                status = self._on_local_folder_created(event)
-            elif event.is_moved:
-                status = self._on_local_moved(event)
-            elif event.is_deleted:
-                status = self._on_local_deleted(event)
-            else:
-                status = SyncStatus.Skipped
+        with tracing.tracer.span("create_remote_entry", path=event.dbx_path):
+            try:
+                if event.is_file and (event.is_added or event.is_changed):
+                    status = self._on_local_file_modified(event)
+                elif event.is_directory and event.is_added:
+                    status = self._on_local_folder_created(event)
+                elif event.is_moved:
+                    status = self._on_local_moved(event)
+                elif event.is_deleted:
+                    status = self._on_local_deleted(event)
+                else:
+                    status = SyncStatus.Skipped
 
-            event.status = status
+                event.status = status
 
-        except SyncError as err:
-            self._handle_sync_error(err, direction=SyncDirection.Up)
-            event.status = SyncStatus.Failed
-        else:
-            self.clear_sync_errors_from_event(event)
-            self.activity.discard(event)
+            except SyncError as err:
+                self._handle_sync_error(err, direction=SyncDirection.Up)
+                event.status = SyncStatus.Failed
+                self.activity.update(event)
+            else:
+                self.clear_sync_errors_from_event(event)
+                self.activity.discard(event)
 
         # Add events to history database.
         if event.status == SyncStatus.Done:
-            with self._database_access():
-                self._history_table.save(event)
+            with self._history_lock:
+                self._history_buffer.append(event)
 
         return event
 
@@ -2350,6 +3136,7 @@ class SyncEngine:
         except OSError:
             return
 
+    @traced()
     def _on_local_moved(self, event: SyncEvent) -> SyncStatus:
         """
         Call when a local item is moved.
@@ -2444,6 +3231,7 @@ class SyncEngine:
             for md in result.entries:
                 self.update_index_from_dbx_metadata(md)
 
+    @traced()
     def _on_local_file_modified(self, event: SyncEvent) -> SyncStatus:
         """
         Call when a local file is created or modified.
@@ -2521,6 +3309,7 @@ class SyncEngine:
 
         return status
 
+    @traced()
     def _on_local_folder_created(self, event: SyncEvent) -> SyncStatus:
         """
         Call when a local folder is created.
@@ -2587,6 +3376,7 @@ class SyncEngine:
 
         return status
 
+    @traced()
     def _on_local_deleted(self, event: SyncEvent) -> SyncStatus:
         """
         Call when a local item is deleted. We try not to delete remote items which have
@@ -2821,6 +3611,7 @@ class SyncEngine:
                 self.activity.add(event)
                 e = self._create_local_entry(event)
                 success = e.status in (SyncStatus.Done, SyncStatus.Skipped)
+                self._clean_history()
 
             self._clear_caches()
 
@@ -2838,8 +3629,12 @@ class SyncEngine:
             try:
                 idx = 0
 
-                # Iterate over index and download results.
-                list_iter = self.client.list_folder_iterator(dbx_path, recursive=True)
+                # Iterate over index and download results. Fetch the next pages while
+                # applying the current one.
+                list_iter = prefetch(
+                    self.client.list_folder_iterator(dbx_path, recursive=True),
+                    _PREFETCH_PAGES,
+                )
 
                 for res in list_iter:
                     idx += len(res.entries)
@@ -2850,9 +3645,7 @@ class SyncEngine:
                     res.entries.sort(key=lambda x: x.path_lower.count("/"))
 
                     # Convert metadata to sync_events.
-                    sync_events = [
-                        SyncEvent.from_metadata(md, self) for md in res.entries
-                    ]
+                    sync_events = SyncEvent.from_metadata_page(res.entries, self)
                     download_res = self.apply_remote_changes(sync_events)
 
                     success = all(
@@ -2902,7 +3695,11 @@ class SyncEngine:
         Handles updating the remote cursor and resuming interrupted syncs for you.
         Calling this method will perform a full indexing if this is the first download.
         """
-        with self.sync_lock:
+        with (
+            self.sync_lock,
+            _SYNC_CYCLE_DURATION.time("down"),
+            tracing.tracer.span("download_sync_cycle"),
+        ):
             if self.remote_cursor == "":
                 self._state.set("sync", "last_reindex", time.time())
                 self._state.set("sync", "did_finish_indexing", False)
@@ -2918,7 +3715,10 @@ class SyncEngine:
             else:
                 self._logger.info("Fetching remote changes")
 
-            changes_iter = self.list_remote_changes_iterator(self.remote_cursor)
+            changes_iter = trace_iter(
+                self.list_remote_changes_iterator(self.remote_cursor),
+                "list_remote_changes",
+            )
 
             # Download changes in chunks to reduce memory usage.
             for changes, cursor in changes_iter:
@@ -2947,6 +3747,7 @@ class SyncEngine:
 
             self._state.set("sync", "did_finish_indexing", True)
             self._state.set("sync", "indexing_counter", 0)
+            self._state.flush()
 
             if idx > 0:
                 self._logger.info(IDLE)
@@ -2962,10 +3763,24 @@ class SyncEngine:
         set of changes, continue where we left off. If ``last_cursor`` is an empty
         string, perform a full indexing of the Dropbox folder.
 
+        A full indexing lists all top-level folders concurrently, see
+        :meth:`_list_folder_sharded`, unless the config value "indexing_shards" is set
+        to 1.
+
         :param last_cursor: Cursor from last download sync.
         :returns: Iterator yielding tuples with remote changes and corresponding cursor.
         """
-        if last_cursor == "":
+        num_shards = self._conf.get("sync", "indexing_shards")
+
+        if last_cursor.startswith(_SHARDED_CURSOR_PREFIX):
+            # Pick up an interrupted parallel indexing where we left off.
+            self._logger.debug("Resuming indexing of top-level folders")
+            progress = json.loads(last_cursor[len(_SHARDED_CURSOR_PREFIX) :])
+            changes_iter = self._list_folder_sharded(max(num_shards, 1), progress)
+        elif last_cursor == "" and num_shards > 1:
+            # We are starting from the beginning, do a full indexing in parallel.
+            changes_iter = self._list_folder_sharded(num_shards)
+        elif last_cursor == "":
             # We are starting from the beginning, do a full indexing.
             changes_iter = self.client.list_folder_iterator("/", recursive=True)
         else:
@@ -2974,18 +3789,107 @@ class SyncEngine:
             self._logger.debug("Fetching remote changes since cursor: %s", last_cursor)
             changes_iter = self.client.list_remote_changes_iterator(last_cursor)
 
-        for changes in changes_iter:
+        # Fetch the next pages from Dropbox servers while the caller applies the
+        # current one. Pages are only cleaned up and converted when requested because
+        # this depends on the state of our index.
+        for changes in prefetch(changes_iter, _PREFETCH_PAGES):
             changes = self._clean_remote_changes(changes)
             changes.entries.sort(key=lambda x: x.path_lower.count("/"))
 
             self._logger.debug("Remote changes:\n%s", pf_repr(changes.entries))
 
-            sync_events = [SyncEvent.from_metadata(md, self) for md in changes.entries]
+            with tracing.tracer.span("convert_remote_changes"):
+                sync_events = SyncEvent.from_metadata_page(changes.entries, self)
 
             self._logger.debug("Converted remote changes to SyncEvents")
 
             yield sync_events, changes.cursor
 
+    def _list_folder_sharded(
+        self, num_shards: int, progress: dict[str, Any] | None = None
+    ) -> Iterator[ListFolderResult]:
+        """
+        Lists the entire remote Dropbox with multiple concurrent cursor chains. Lists
+        the root folder non-recursively first and then each top-level folder
+        recursively, using up to ``num_shards`` parallel listings. Mounted shared
+        folders and team folders are top-level folders themselves or are contained in
+        one.
+
+        Results are yielded as they arrive. A final empty result contains the latest
+        cursor of the root folder, retrieved before listing any content so that no
+        changes are missed. The cursor of each other result records the progress of
+        the listing instead: the root cursor and the cursor of each top-level folder
+        which has not been listed completely. Passing this progress back resumes an
+        interrupted listing.
+
+        :param num_shards: Maximum number of concurrent listings.
+        :param progress: Progress of an interrupted listing to resume, decoded from the
+            last cursor which was yielded.
+        :returns: Iterator over the content of the Dropbox.
+        """
+        if progress is None:
+            cursor = self.client.get_latest_cursor("/")
+            root = self.client.list_folder("/", recursive=False)
+
+            # Top-level folders which have not been started yet have an empty cursor.
+            progress = {
+                "cursor": cursor,
+                "shards": {
+                    md.path_lower: ""
+                    for md in root.entries
+                    if isinstance(md, FolderMetadata)
+                },
+            }
+
+            root.cursor = _SHARDED_CURSOR_PREFIX + json.dumps(progress)
+            yield root
+
+        def list_shard(
+            dbx_path_lower: str, shard_cursor: str
+        ) -> Iterator[tuple[str, ListFolderResult]]:
+            if shard_cursor:
+                try:
+                    for res in self.client.list_remote_changes_iterator(shard_cursor):
+                        yield dbx_path_lower, res
+                    return
+                except CursorResetError:
+                    # List the folder again. Items which were already applied will
+                    # be skipped because they are unchanged from our index.
+                    pass
+
+            try:
+                for res in self.client.list_folder_iterator(
+                    dbx_path_lower, recursive=True
+                ):
+                    # The folder itself was already listed with the root folder.
+                    res.entries = [
+                        e for e in res.entries if e.path_lower != dbx_path_lower
+                    ]
+                    yield dbx_path_lower, res
+            except NotFoundError:
+                # The folder was removed after listing the root folder. This will be
+                # picked up with the changes since the root cursor.
+                pass
+
+        shards: dict[str, str] = progress["shards"]
+        shard_iters = (list_shard(path, c) for path, c in list(shards.items()))
+
+        for dbx_path_lower, res in parallel_chain(
+            shard_iters, num_threads=num_shards, n=num_shards
+        ):
+            if res.has_more:
+                shards[dbx_path_lower] = res.cursor
+            else:
+                del shards[dbx_path_lower]
+
+            # All pages up to this one will have been applied when the cursor is
+            # saved, pages are yielded in order.
+            res.cursor = _SHARDED_CURSOR_PREFIX + json.dumps(progress)
+            yield res
+
+        yield ListFolderResult(entries=[], has_more=False, cursor=progress["cursor"])
+
+    @traced()
     def apply_remote_changes(
         self, sync_events: Collection[SyncEvent]
     ) -> list[SyncEvent]:
@@ -3014,7 +3918,7 @@ class SyncEngine:
         folders: defaultdict[int, list[SyncEvent]] = defaultdict(list)
         deleted: defaultdict[int, list[SyncEvent]] = defaultdict(list)
 
-        new_excluded = self.excluded_items
+        new_excluded = PathTrie(self._excluded_items)
 
         for event in sync_events:
             is_excluded = self.is_excluded_by_user(
@@ -3024,11 +3928,9 @@ class SyncEngine:
             if is_excluded:
                 if event.is_deleted:
                     # Remove deleted item and its children from the excluded list.
-                    new_excluded = {
-                        path
-                        for path in new_excluded
-                        if not is_equal_or_child(path, event.dbx_path_lower)
-                    }
+                    for path in new_excluded.children(event.dbx_path_lower):
+                        new_excluded.discard(path)
+                    new_excluded.discard(event.dbx_path_lower)
 
             else:
                 level = event.dbx_path.count("/")
@@ -3043,7 +3945,8 @@ class SyncEngine:
                 # Housekeeping.
                 self.activity.add(event)
 
-        self.excluded_items = new_excluded
+        if len(new_excluded) < len(self._excluded_items):
+            self.excluded_items = set(new_excluded)
 
         # Apply deleted items.
         if deleted:
@@ -3204,6 +4107,7 @@ class SyncEngine:
         else:
             return account_info.display_name
 
+    @traced()
     def _check_download_conflict(self, event: SyncEvent) -> Conflict:
         """
         Check if a local item is conflicting with remote change. The equivalent check
@@ -3363,6 +4267,7 @@ class SyncEngine:
         except OSError as exc:
             raise os_to_maestral_error(exc, local_path=local_path)
 
+    @traced()
     def _clean_remote_changes(self, changes: ListFolderResult) -> ListFolderResult:
         """
         Takes remote file events since last sync and cleans them up so that there is
@@ -3387,12 +4292,16 @@ class SyncEngine:
 
         new_entries = []
 
+        # Fetch index entries for all paths with multiple changes at once.
+        duplicates = [path for path, h in histories.items() if len(h) > 1]
+        index_entries = self.get_index_entries(duplicates)
+
         for h in histories.values():
             if len(h) == 1:
                 new_entries.extend(h)
             else:
                 last_event = h[-1]
-                local_entry = self.get_index_entry(last_event.path_lower)
+                local_entry = index_entries.get(last_event.path_lower)
                 was_dir = local_entry and local_entry.is_directory
 
                 # Dropbox guarantees that applying events in the provided order will
@@ -3435,30 +4344,33 @@ class SyncEngine:
         self._slow_down()
 
         event.status = SyncStatus.Syncing
+        self.activity.update(event)
 
-        try:
-            if event.is_deleted:
-                status = self._on_remote_deleted(event)
-            elif event.is_file:
-                status = self._on_remote_file(event)
-            elif event.is_directory:
-                status = self._on_remote_folder(event)
-            else:
-                status = SyncStatus.Skipped
+        with tracing.tracer.span("create_local_entry", path=event.dbx_path):
+            try:
+                if event.is_deleted:
+                    status = self._on_remote_deleted(event)
+                elif event.is_file:
+                    status = self._on_remote_file(event)
+                elif event.is_directory:
+                    status = self._on_remote_folder(event)
+                else:
+                    status = SyncStatus.Skipped
 
-            event.status = status
+                event.status = status
 
-        except SyncError as e:
-            self._handle_sync_error(e, direction=SyncDirection.Down)
-            event.status = SyncStatus.Failed
-        else:
-            self.clear_sync_errors_from_event(event)
-            self.activity.discard(event)
+            except SyncError as e:
+                self._handle_sync_error(e, direction=SyncDirection.Down)
+                event.status = SyncStatus.Failed
+                self.activity.update(event)
+            else:
+                self.clear_sync_errors_from_event(event)
+                self.activity.discard(event)
 
         # Add events to history database.
         if event.status == SyncStatus.Done:
-            with self._database_access():
-                self._history_table.save(event)
+            with self._history_lock:
+                self._history_buffer.append(event)
 
         return event
 
@@ -3498,6 +4410,7 @@ class SyncEngine:
             suffix = f"conflicted copy {date}"
         return generate_cc_name(local_path, suffix)
 
+    @traced()
     def _on_remote_file(self, event: SyncEvent) -> SyncStatus:
         """
         Applies a remote file change or creation locally.
@@ -3611,6 +4524,7 @@ class SyncEngine:
 
         return status
 
+    @traced()
     def _on_remote_folder(self, event: SyncEvent) -> SyncStatus:
         """
         Applies a remote folder creation locally.
@@ -3679,6 +4593,7 @@ class SyncEngine:
 
         return status
 
+    @traced()
     def _on_remote_deleted(self, event: SyncEvent) -> SyncStatus:
         """
         Applies a remote deletion locally.
@@ -3792,23 +4707,58 @@ class SyncEngine:
                 else:
                     self.fs_events.queue_event(FileDeletedEvent(local_path))
 
+    def _commit_history(self) -> None:
+        """Saves completed sync events to the history in a single transaction."""
+        with self._history_lock:
+            sync_events = self._history_buffer
+            self._history_buffer = []
+
+        if len(sync_events) == 0:
+            return
+
+        with self._database_access():
+            with self._db.transaction():
+                for event in sync_events:
+                    self._history_table.save(event)
+
     def _clean_history(self) -> None:
         """Commits new events and removes all events older than ``_keep_history`` from
-        history."""
+        history. Old events are removed at most every :data:`_HISTORY_PRUNE_INTERVAL`
+        seconds. The queries use the index on the event time instead of scanning the
+        table."""
+        self._commit_history()
+
+        now = time.time()
+
+        if now - self._last_history_pruning < _HISTORY_PRUNE_INTERVAL:
+            return
+
+        self._last_history_pruning = now
+        keep_history = self._conf.get("sync", "keep_history")
+
         with self._database_access():
-            # Drop all entries older than keep_history.
-            now = time.time()
-            keep_history = self._conf.get("sync", "keep_history")
+            with self._db.transaction():
+                # Drop all entries older than keep_history.
+                res_time = self._db.execute(
+                    "DELETE FROM history WHERE IFNULL(change_time, sync_time) < ?",
+                    now - keep_history,
+                )
+                # Drop all entries older than the last _max_history.
+                res_count = self._db.execute(
+                    "DELETE FROM history WHERE IFNULL(change_time, sync_time) < ("
+                    "SELECT IFNULL(change_time, sync_time) FROM history "
+                    "ORDER BY IFNULL(change_time, sync_time) DESC LIMIT 1 OFFSET ?)",
+                    self._max_history - 1,
+                )
 
-            self._db.execute(
-                "DELETE FROM history WHERE IFNULL(change_time, sync_time) < ?",
-                now - keep_history,
-            )
-            self._history_table.clear_cache()
+            if res_time.rowcount > 0 or res_count.rowcount > 0:
+                self._history_table.clear_cache()
 
     def _scandir_with_ignore(
         self, path: str | os.PathLike[str]
     ) -> Iterator[os.DirEntry[str]]:
+        # Ignored folders are not returned, such that walking the tree skips their
+        # content entirely.
         with os.scandir(path) as it:
             for entry in it:
                 dbx_path = self.to_dbx_path(entry.path)
@@ -3835,22 +4785,42 @@ def do_parallel(
     :param func: A callable that will take as many arguments as there are passed iterables.
     :param iterables: Arguments to pass to ``func``. All iterables must have the same size.
     :param thread_name_prefix: Used for internal ThreadPoolExecutor.
-    :param on_progress: Callback when each task is completed. Takes the number of
-        completed items and the total number of items as arguments.
+    :param on_progress: Callback when tasks are completed. Takes the number of
+        completed items and the total number of items as arguments. This is called at
+        most every 0.2 sec and always after the last task is completed, such that
+        progress messages which are logged by the callback are rate-limited.
     """
+    pool = thread_name_prefix or "default"
+    _WORKER_THREADS.set(NUM_THREADS, pool)
+
+    def run_task(*args: Any) -> T:
+        with _WORKER_TASK_DURATION.time(pool):
+            return func(*args)  # type:ignore[call-arg]
+
     with ThreadPoolExecutor(
         max_workers=NUM_THREADS, thread_name_prefix=thread_name_prefix
     ) as thread_pool_executor:
+        # Run each task in a copy of the current context to record spans as part of
+        # the current trace.
         futures = [
-            thread_pool_executor.submit(func, *args)  # type:ignore[call-arg]
+            thread_pool_executor.submit(tracing.run_in_context(run_task), *args)
             for args in zip(*iterables)
         ]
 
         n_done = 0
+        n_total = len(futures)
+        last_progress = 0.0
+
         for future in as_completed(futures):
             n_done += 1
+
             if on_progress:
-                on_progress(n_done, len(iterables[0]))
+                now = time.monotonic()
+
+                if n_done == n_total or now - last_progress >= _PROGRESS_INTERVAL:
+                    on_progress(n_done, n_total)
+                    last_progress = now
+
             yield future.result()
 
 
@@ -0,0 +1,358 @@
+"""
+This module contains lightweight tracing of sync activity with hierarchical spans.
+
+A span records the start and duration of a stage of syncing, for instance a download
+sync cycle, the handling of a single item or a Dropbox API request. Spans which are
+started while another span is active become children of that span. The active span is
+tracked with a context variable and is therefore propagated to worker threads which run
+in a copy of the current context, see :func:`run_in_context`.
+
+Tracing is sampled per trace: a span without parent starts a new trace with the
+probability given by :attr:`Tracer.sample_rate`, and all its children are recorded if
+and only if the trace is recorded. Finished spans are kept in a ring buffer and can be
+exported in the Chrome trace event format, which can be loaded in Perfetto or
+chrome://tracing.
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from typing_extensions import ParamSpec
+
+__all__ = [
+    "Span",
+    "Tracer",
+    "tracer",
+    "traced",
+    "trace_iter",
+    "run_in_context",
+    "write_chrome_trace",
+    "DEFAULT_BUFFER_SIZE",
+]
+
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+DEFAULT_BUFFER_SIZE = 100_000
+"""Default number of finished spans to keep."""
+
+# Active span of the current context. The sentinel _UNSAMPLED marks a trace which is
+# not recorded.
+_current_span: ContextVar[object] = ContextVar("current_span", default=None)
+_UNSAMPLED = object()
+
+
+class Span:
+    """
+    A span which is recorded by its tracer when leaving its context.
+
+    :param tracer: Tracer which records the span.
+    :param name: Name of the span.
+    :param category: Category of the span, for instance "sync", "api" or "db".
+    :param args: Additional information to show for the span.
+    """
+
+    __slots__ = ("_tracer", "name", "category", "args", "start", "_token")
+
+    def __init__(
+        self, tracer: Tracer, name: str, category: str, args: dict[str, Any]
+    ) -> None:
+        self._tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        end = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        self._tracer._record(self, end)
+
+
+class _LeafSpan(Span):
+    """A span which does not become the active span and can therefore not have
+    children. Unlike other spans, it may remain open across a yield."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> Span:
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._tracer._record(self, time.perf_counter_ns())
+
+
+class _UnsampledSpan:
+    """Marks its context as part of a trace which is not recorded."""
+
+    __slots__ = ("_token",)
+
+    def __enter__(self) -> None:
+        self._token = _current_span.set(_UNSAMPLED)
+
+    def __exit__(self, *args: Any) -> None:
+        _current_span.reset(self._token)
+
+
+class _NoopSpan:
+    """Does nothing, used when no span needs to be recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *args: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Records spans in a ring buffer.
+
+    :param sample_rate: Fraction of traces to record, between 0 and 1. Tracing is
+        disabled if 0.
+    :param buffer_size: Maximum number of spans to keep. The oldest spans are discarded
+        first.
+    """
+
+    def __init__(
+        self, sample_rate: float = 0.0, buffer_size: int = DEFAULT_BUFFER_SIZE
+    ) -> None:
+        self.sample_rate = sample_rate
+        # Tuples of name, category, start, duration, thread id and args.
+        self._spans: deque[tuple[str, str, int, int, int, dict[str, Any]]] = deque(
+            maxlen=buffer_size
+        )
+        self._thread_names: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def sample_rate(self) -> float:
+        """Fraction of traces to record, between 0 and 1."""
+        return self._sample_rate
+
+    @sample_rate.setter
+    def sample_rate(self, value: float) -> None:
+        """Setter: sample_rate."""
+        if not 0 <= value <= 1:
+            raise ValueError("Sample rate must be between 0 and 1")
+        self._sample_rate = value
+
+    def span(
+        self, name: str, category: str = "sync", **args: Any
+    ) -> Span | _UnsampledSpan | _NoopSpan:
+        """
+        Creates a span to use as a context manager. It is recorded when leaving the
+        context if it belongs to a sampled trace. The span must not remain open across
+        a yield, see :meth:`leaf_span` and :func:`trace_iter` instead.
+
+        :param name: Name of the span.
+        :param category: Category of the span.
+        :param args: Additional information to show for the span. Values must be
+            serializable to JSON.
+        :returns: Context manager for the span.
+        """
+        if self._sample_rate == 0:
+            return _NOOP_SPAN
+
+        parent = _current_span.get()
+
+        if parent is _UNSAMPLED:
+            return _NOOP_SPAN
+
+        if parent is None:
+            if self._sample_rate < 1 and random.random() >= self._sample_rate:
+                return _UnsampledSpan()
+
+        return Span(self, name, category, args)
+
+    def leaf_span(
+        self, name: str, category: str = "sync", **args: Any
+    ) -> Span | _NoopSpan:
+        """
+        Creates a span for frequent low-level operations, such as database access,
+        which are only of interest as part of a larger operation. It is only recorded
+        within a sampled trace and does not start a new trace. The span never becomes
+        the parent of other spans and may therefore remain open across a yield.
+
+        :param name: Name of the span.
+        :param category: Category of the span.
+        :param args: Additional information to show for the span. Values must be
+            serializable to JSON.
+        :returns: Context manager for the span.
+        """
+        if self._sample_rate == 0:
+            return _NOOP_SPAN
+
+        parent = _current_span.get()
+
+        if parent is None or parent is _UNSAMPLED:
+            return _NOOP_SPAN
+
+        return _LeafSpan(self, name, category, args)
+
+    def _record(self, span: Span, end: int) -> None:
+        thread = threading.current_thread()
+
+        with self._lock:
+            self._spans.append(
+                (
+                    span.name,
+                    span.category,
+                    span.start,
+                    end - span.start,
+                    thread.ident or 0,
+                    span.args,
+                )
+            )
+            self._thread_names[thread.ident or 0] = thread.name
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def clear(self) -> None:
+        """Removes all recorded spans."""
+        with self._lock:
+            self._spans.clear()
+            self._thread_names.clear()
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """
+        Returns all recorded spans in the Chrome trace event format. Timestamps are in
+        microseconds since the start of the oldest recorded span.
+
+        :returns: Dictionary which can be saved as JSON file.
+        """
+        with self._lock:
+            spans = list(self._spans)
+            thread_names = dict(self._thread_names)
+
+        pid = os.getpid()
+        origin = min((span[2] for span in spans), default=0)
+        events: list[dict[str, Any]] = []
+
+        for tid, thread_name in thread_names.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": thread_name},
+                }
+            )
+
+        for name, category, start, duration, tid, args in spans:
+            events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": (start - origin) / 1000,
+                    "dur": duration / 1000,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+tracer = Tracer()
+"""The tracer for all spans of Maestral."""
+
+
+def traced(
+    name: str | None = None, category: str = "sync"
+) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    """
+    Decorator to record each call of a function as span.
+
+    :param name: Name of the span. Defaults to the name of the function.
+    :param category: Category of the span.
+    """
+
+    def decorator(func: Callable[P, T]) -> Callable[P, T]:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with tracer.span(span_name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_iter(iterable: Iterable[T], name: str, category: str = "sync") -> Iterator[T]:
+    """
+    Records the time spent on retrieving each item of an iterable as span. This is
+    useful for generators which do work between yielding items, since spans cannot be
+    active across a yield.
+
+    :param iterable: Iterable to trace.
+    :param name: Name of the spans.
+    :param category: Category of the spans.
+    :returns: Iterator over the items of ``iterable``.
+    """
+    iterator = iter(iterable)
+
+    while True:
+        with tracer.span(name, category):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+
+        yield item
+
+
+def run_in_context(func: Callable[P, T]) -> Callable[P, T]:
+    """
+    Binds a function to a copy of the current context, including the active span. Use
+    this for functions which are run in worker threads to record their spans as part of
+    the current trace. Each returned function may only run in one thread at a time.
+
+    :param func: Function to bind.
+    :returns: Function which runs ``func`` in the copied context.
+    """
+    context = copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+        return context.run(func, *args, **kwargs)
+
+    return wrapper
+
+
+def write_chrome_trace(path: str, trace: dict[str, Any]) -> None:
+    """
+    Saves a trace in the Chrome trace event format as JSON file.
+
+    :param path: Path of the file to write.
+    :param trace: Trace as returned by :meth:`Tracer.chrome_trace`.
+    """
+    with open(path, "w") as f:
+        json.dump(trace, f)
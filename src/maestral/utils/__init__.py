@@ -2,9 +2,12 @@
 
 from __future__ import annotations
 
+import contextvars
 import os
+import queue
+import threading
 from types import TracebackType
-from typing import Iterable, Iterator, Optional, Tuple, Type, TypeVar
+from typing import Iterable, Iterator, Optional, Tuple, Type, TypeVar, cast
 
 from packaging.version import Version
 
@@ -54,6 +57,91 @@ def chunks(lst: list[_T], n: int, consume: bool = False) -> Iterator[list[_T]]:
             yield lst[i : i + n]
 
 
+def prefetch(iterable: Iterable[_T], n: int = 1) -> Iterator[_T]:
+    """
+    Iterates over an iterable in a background thread, staying at most ``n`` items
+    ahead of the consumer. This allows for instance to overlap network requests for the
+    next items with processing the current item. Exceptions raised by the iterable are
+    re-raised to the consumer. The background thread stops when the returned iterator
+    is closed or garbage collected.
+
+    :param iterable: Iterable to consume in the background.
+    :param n: Maximum number of items to fetch ahead.
+    :returns: Iterator over the items of ``iterable``, in the same order.
+    """
+    return parallel_chain([iterable], num_threads=1, n=n)
+
+
+def parallel_chain(
+    iterables: Iterable[Iterable[_T]], num_threads: int, n: int = 1
+) -> Iterator[_T]:
+    """
+    Consumes multiple iterables concurrently in up to ``num_threads`` background
+    threads and yields their items as they become available. Items of each iterable are
+    yielded in order but items from different iterables may be interleaved. Otherwise
+    behaves like :func:`prefetch`.
+
+    :param iterables: Iterables to consume in the background. Each iterable is only
+        started once a thread is available.
+    :param num_threads: Number of background threads.
+    :param n: Maximum number of items to fetch ahead across all iterables.
+    :returns: Iterator over the items of all ``iterables``.
+    """
+    items: queue.Queue[tuple[bool, _T | BaseException | None]] = queue.Queue(n)
+    stop = threading.Event()
+    sources = iter(iterables)
+    sources_lock = threading.Lock()
+
+    def put(item: tuple[bool, _T | BaseException | None]) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            while True:
+                with sources_lock:
+                    iterable = next(sources, None)
+
+                if iterable is None:
+                    break
+
+                for item in iterable:
+                    if not put((False, item)):
+                        return
+        except BaseException as exc:
+            put((True, exc))
+        else:
+            put((True, None))
+
+    for _ in range(num_threads):
+        # Run in a copy of the consumer's context to propagate context variables.
+        thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(produce,),
+            name="maestral-prefetch",
+            daemon=True,
+        )
+        thread.start()
+
+    try:
+        num_done = 0
+        while num_done < num_threads:
+            done, value = items.get()
+            if not done:
+                yield cast(_T, value)
+            elif isinstance(value, BaseException):
+                raise value
+            else:
+                num_done += 1
+    finally:
+        stop.set()
+
+
 def clamp(n: _N, minn: _N, maxn: _N) -> _N:
     """
     Clamps a number between a minimum and maximum value.
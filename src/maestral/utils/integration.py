@@ -9,18 +9,18 @@ import logging
 import os
 import resource
 import socket
+import threading
 import time
 from pathlib import Path
 from typing import Optional, Tuple, Union
 from urllib.parse import urlparse
 
-import requests
-
 __all__ = [
     "cat",
     "get_inotify_limits",
     "CPU_CORE_COUNT",
     "cpu_usage_percent",
+    "CPUGovernor",
     "check_connection",
     "SystemdNotifier",
 ]
@@ -92,12 +92,12 @@ def cpu_usage_percent(interval: float = 0.1) -> float:
         return time.monotonic() * CPU_CORE_COUNT
 
     st1 = timer()
-    rt1 = resource.getrusage(resource.RUSAGE_SELF)
+    pt1 = _process_time()
     time.sleep(interval)
     st2 = timer()
-    rt2 = resource.getrusage(resource.RUSAGE_SELF)
+    pt2 = _process_time()
 
-    delta_proc = (rt2.ru_utime - rt1.ru_utime) + (rt2.ru_stime - rt1.ru_stime)
+    delta_proc = pt2 - pt1
     delta_time = st2 - st1
 
     try:
@@ -109,6 +109,124 @@ def cpu_usage_percent(interval: float = 0.1) -> float:
         return round(single_cpu_percent, 1)
 
 
+def _process_time() -> float:
+    """Returns the user and system CPU time of the current process in sec."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class CPUGovernor:
+    """
+    An admission gate which limits the CPU usage of worker threads.
+
+    A background thread samples the CPU time of the process in regular intervals and
+    maintains a token bucket of CPU time: it is refilled at a rate of
+    :attr:`max_percent` and drained by the CPU time which was actually used. The gate
+    is closed while the bucket is empty. Workers call :meth:`wait` before each unit of
+    work. This returns immediately while the gate is open, workers therefore never
+    sample the CPU usage themselves.
+
+    The background thread is only started on the first call to :meth:`wait` while
+    throttling is enabled and exits again after :attr:`idle_timeout` sec without calls.
+
+    :param max_percent: Maximum CPU usage in percent. A value of 100 corresponds to one
+        fully used core. Values of ``100 * CPU_CORE_COUNT`` or more disable throttling.
+    :param interval: Interval in sec between CPU usage samples.
+    :param idle_timeout: Time in sec after which an unused governor thread exits.
+    """
+
+    def __init__(
+        self, max_percent: float, interval: float = 0.2, idle_timeout: float = 10.0
+    ) -> None:
+        self.max_percent = max_percent
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+
+        self._gate = threading.Event()
+        self._gate.set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_wait = 0.0
+        self._usage = 0.0
+        self._budget = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        """Whether CPU usage is limited."""
+        return self.max_percent < 100 * CPU_CORE_COUNT
+
+    @property
+    def is_open(self) -> bool:
+        """Whether workers are currently admitted without waiting."""
+        return self._gate.is_set()
+
+    @property
+    def usage(self) -> float:
+        """CPU usage of the process in percent during the last sampling interval."""
+        return self._usage
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the CPU usage has dropped below the limit.
+
+        :param timeout: Maximum time to wait in sec. If None, wait indefinitely.
+        :returns: False if the call timed out while the gate was closed, True otherwise.
+        """
+        if not self.enabled:
+            return True
+
+        self._last_wait = time.monotonic()
+
+        if self._thread is None:
+            self._start()
+
+        return self._gate.wait(timeout)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="maestral-cpu-governor", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        t0 = time.monotonic()
+        pt0 = _process_time()
+
+        while True:
+            time.sleep(self.interval)
+
+            t1 = time.monotonic()
+            pt1 = _process_time()
+
+            try:
+                self._usage = (pt1 - pt0) / (t1 - t0) * 100
+            except ZeroDivisionError:
+                self._usage = 0.0
+
+            # Refill the bucket with our share of CPU time and drain the time used.
+            # Limit bursts to a single sampling interval at full allowance.
+            allowance = self.max_percent / 100
+            self._budget += allowance * (t1 - t0) - (pt1 - pt0)
+            self._budget = min(self._budget, allowance * self.interval)
+
+            t0, pt0 = t1, pt1
+
+            with self._lock:
+                if not self.enabled or t1 - self._last_wait > self.idle_timeout:
+                    # Never leave the gate closed without a thread to open it.
+                    self._gate.set()
+                    self._budget = 0.0
+                    self._thread = None
+                    return
+
+                if self._budget < 0:
+                    self._gate.clear()
+                else:
+                    self._gate.set()
+
+
 def check_connection(
     hostname: str, timeout: int = 2, logger: Optional[logging.Logger] = None
 ) -> bool:
@@ -121,6 +239,8 @@ def check_connection(
         this logger with the level DEBUG.
     :returns: Connection availability.
     """
+    import requests
+
     if urlparse(hostname).scheme not in ["http", "https"]:
         hostname = "http://" + hostname
     try:
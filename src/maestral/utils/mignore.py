@@ -0,0 +1,347 @@
+"""
+This module contains a compiled matcher for mignore rules, the gitignore-style patterns
+which exclude local items from syncing.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Iterable, cast
+
+from pathspec import PathSpec
+from pathspec.pattern import Pattern, RegexPattern
+
+from .caches import LRUCache
+
+__all__ = ["MignoreMatcher"]
+
+
+_NAMED_GROUP = re.compile(r"\(\?P<\w+>")
+_LITERAL_PREFIX = re.compile(r"(?:[^\\.^$*+?{}\[\]|()/]|\\\W)*")
+_ESCAPED_CHAR = re.compile(r"\\(.)")
+
+# Prefix and suffixes of the regular expressions which pathspec generates for patterns
+# without a slash, e.g., "*.pyc" or "build/". Such patterns match a single path
+# component anywhere in the tree.
+_FLOATING_PREFIX = "^(?:.+/)?"
+_SUFFIX_ANY = "(?:(?:/)|$)"
+_SUFFIX_DIR = "(?:/)"
+_WILDCARD = "[^/]*"
+
+
+def _compile(alternatives: Iterable[tuple[int, str]]) -> re.Pattern[str] | None:
+    """
+    Combines regular expressions into a single alternation. The alternatives are tried
+    in reverse order so that a match reports the highest index which matches.
+
+    :param alternatives: Tuples of pattern index and regular expression.
+    :returns: Compiled regular expression or None if there are no alternatives.
+    """
+    parts = [f"(?P<_{index}>{regex})" for index, regex in sorted(alternatives)]
+
+    if not parts:
+        return None
+
+    return re.compile("|".join(reversed(parts)))
+
+
+def _match_index(regex: re.Pattern[str] | None, string: str, full: bool) -> int:
+    if regex is None:
+        return -1
+
+    match = regex.fullmatch(string) if full else regex.match(string)
+
+    if match is None or match.lastgroup is None:
+        return -1
+
+    return int(match.lastgroup[1:])
+
+
+def _literal(regex: str) -> str | None:
+    """
+    :param regex: Regular expression.
+    :returns: The string matched by the regular expression if it is a plain literal,
+        None otherwise.
+    """
+    string = _ESCAPED_CHAR.sub(r"\1", regex)
+    return string if re.escape(string) == regex else None
+
+
+def _first_component(regex: str) -> str | None:
+    """
+    :param regex: Regular expression.
+    :returns: The first path component of any path matched by the regular expression
+        if it is fixed, None otherwise.
+    """
+    if not regex.startswith("^"):
+        return None
+
+    prefix = cast(re.Match[str], _LITERAL_PREFIX.match(regex, 1)).group()
+    rest = regex[1 + len(prefix) :]
+
+    if prefix and (rest.startswith("/") or rest in (_SUFFIX_ANY, _SUFFIX_DIR)):
+        return _ESCAPED_CHAR.sub(r"\1", prefix)
+
+    return None
+
+
+def _required_literal(regex: str) -> str:
+    """
+    :param regex: Regular expression.
+    :returns: The longest string which must be contained in any string matched by the
+        regular expression. May be empty.
+    """
+    runs = [""]
+    depth = 0
+    i = 0
+
+    while i < len(regex):
+        char = regex[i]
+        literal = None
+
+        if char == "\\" and i + 1 < len(regex):
+            literal = regex[i + 1] if not regex[i + 1].isalnum() else None
+            i += 2
+        elif char == "[":
+            # Skip character classes, including escaped characters and a leading "]".
+            i += 2 if regex[i + 1 : i + 2] == "^" else 1
+            i += 1 if regex[i : i + 1] == "]" else 0
+            while i < len(regex) and regex[i] != "]":
+                i += 2 if regex[i] == "\\" else 1
+            i += 1
+        elif char == "(":
+            depth += 1
+            i += 1
+        elif char == ")":
+            depth -= 1
+            i += 1
+        elif char == "|" and depth == 0:
+            return ""
+        else:
+            literal = char if char not in ".^$*+?{}|" else None
+            i += 1
+
+        if regex[i : i + 1] in ("?", "*", "+", "{"):
+            # Quantified items are not required.
+            literal = None
+
+        if literal is not None and depth == 0:
+            runs[-1] += literal
+        elif runs[-1]:
+            runs.append("")
+
+    return max(runs, key=len)
+
+
+class _NameMatcher:
+    """
+    Matches a single path component against patterns. Literal names and extensions are
+    looked up in dictionaries, all other patterns are combined into a single regular
+    expression.
+
+    :param alternatives: Tuples of pattern index and regular expression which must match
+        the full path component.
+    """
+
+    def __init__(self, alternatives: Iterable[tuple[int, str]]) -> None:
+        self._names: dict[str, int] = {}
+        self._suffixes: dict[str, int] = {}
+        other: list[tuple[int, str]] = []
+
+        for index, regex in alternatives:
+            name = _literal(regex)
+            suffix = (
+                _literal(regex[len(_WILDCARD) :])
+                if regex.startswith(_WILDCARD)
+                else None
+            )
+
+            if name is not None:
+                self._names[name] = max(index, self._names.get(name, -1))
+            elif suffix is not None:
+                self._suffixes[suffix] = max(index, self._suffixes.get(suffix, -1))
+            else:
+                other.append((index, regex))
+
+        self._suffix_lengths = sorted({len(suffix) for suffix in self._suffixes})
+        self._regex = _compile(other)
+
+    def match(self, name: str) -> int:
+        """
+        :param name: Path component.
+        :returns: The highest index of any pattern that matches, or -1.
+        """
+        index = self._names.get(name, -1)
+        size = len(name)
+
+        for length in self._suffix_lengths:
+            if length > size:
+                break
+            suffix_index = self._suffixes.get(name[size - length :], -1)
+            if suffix_index > index:
+                index = suffix_index
+
+        if self._regex is None:
+            return index
+
+        return max(index, _match_index(self._regex, name, full=True))
+
+
+class MignoreMatcher:
+    """
+    Matches paths against gitignore-style patterns with the same result as
+    :meth:`pathspec.PathSpec.match_file` but without trying each pattern in turn.
+
+    Patterns which match a single path component, such as "*.pyc" or "build/", are
+    matched against the components of a path individually. Their results for the
+    components of a directory are cached, such that only the file name needs to be
+    matched for items in the same directory. Patterns which are anchored to a top-level
+    folder are only tried for paths in that folder. All remaining patterns are matched
+    against the full path, after checking for a substring which any match must contain.
+
+    :param spec: PathSpec with gitwildmatch patterns.
+    :param cache_size: Maximum number of directories to cache results for.
+    :raises TypeError: if the patterns are not based on regular expressions.
+    """
+
+    def __init__(self, spec: PathSpec[Pattern], cache_size: int = 10_000) -> None:
+        self.spec = spec
+        self._include: list[bool] = []
+
+        floating_any: list[tuple[int, str]] = []
+        floating_dir: list[tuple[int, str]] = []
+        anchored: dict[str, list[tuple[int, str]]] = {}
+        other: list[tuple[int, str]] = []
+
+        for pattern in spec.patterns:
+            if not isinstance(pattern, RegexPattern):
+                raise TypeError(f"Unsupported pattern type {type(pattern).__name__}")
+
+            if pattern.include is None or pattern.regex is None:
+                continue
+
+            index = len(self._include)
+            self._include.append(pattern.include)
+
+            regex = _NAMED_GROUP.sub("(?:", pattern.regex.pattern)
+
+            if not regex.startswith("^"):
+                # Patterns are searched for anywhere in the path.
+                regex = f".*?(?:{regex})"
+
+            name_regex, dir_only = self._split_floating(regex)
+            first_component = _first_component(regex)
+
+            if name_regex is not None and dir_only:
+                floating_dir.append((index, name_regex))
+            elif name_regex is not None:
+                floating_any.append((index, name_regex))
+            elif first_component is not None:
+                anchored.setdefault(first_component, []).append((index, regex))
+            else:
+                other.append((index, regex))
+
+        self._names = _NameMatcher(floating_any)
+        self._dir_names = _NameMatcher(floating_any + floating_dir)
+        self._anchored = {
+            first_component: _compile(alternatives)
+            for first_component, alternatives in anchored.items()
+        }
+        self._other = [
+            (index, _required_literal(regex), re.compile(regex))
+            for index, regex in sorted(other, reverse=True)
+        ]
+
+        self._dir_cache = LRUCache(capacity=cache_size)
+
+    @staticmethod
+    def _split_floating(regex: str) -> tuple[str | None, bool]:
+        """
+        Checks if a regular expression matches a single path component.
+
+        :param regex: Regular expression generated for a gitwildmatch pattern.
+        :returns: Tuple of the expression for the path component, or None if the
+            regular expression may span multiple components, and whether the pattern
+            only matches directories.
+        """
+        if not regex.startswith(_FLOATING_PREFIX):
+            return None, False
+
+        body = regex[len(_FLOATING_PREFIX) :]
+
+        if body.endswith(_SUFFIX_ANY):
+            name_regex = body[: -len(_SUFFIX_ANY)]
+            dir_only = False
+        elif body.endswith(_SUFFIX_DIR):
+            name_regex = body[: -len(_SUFFIX_DIR)]
+            dir_only = True
+        else:
+            return None, False
+
+        if any(c in name_regex.replace("[^/]", "") for c in "/^$"):
+            return None, False
+
+        return name_regex, dir_only
+
+    def __len__(self) -> int:
+        return len(self._include)
+
+    def match_file(self, path: str) -> bool:
+        """
+        Checks if a path is matched by the patterns.
+
+        :param path: Path relative to the root of the patterns, using "/" as separator.
+            Paths of directories must end with a "/".
+        :returns: Whether the last pattern which matches the path is not negated.
+        """
+        if not self._include:
+            return False
+
+        if "\n" in path or path.startswith("/"):
+            # Component-wise matching does not replicate the handling of line breaks
+            # and leading slashes by the full regular expressions.
+            return self.spec.match_file(path)
+
+        dirname, _, name = path.rpartition("/")
+        first_component = path.partition("/")[0]
+
+        index = max(
+            self._match_dir(dirname),
+            self._names.match(name),
+            _match_index(self._anchored.get(first_component), path, full=False),
+        )
+
+        for other_index, literal, regex in self._other:
+            if other_index <= index:
+                break
+            if literal in path and regex.match(path):
+                index = other_index
+                break
+
+        return index >= 0 and self._include[index]
+
+    def match_dir(self, path: str) -> bool:
+        """
+        Checks if a directory is matched by the patterns.
+
+        :param path: Path relative to the root of the patterns, using "/" as separator.
+        :returns: Whether the last pattern which matches the directory is not negated.
+        """
+        return self.match_file(f"{path.rstrip('/')}/")
+
+    def _match_dir(self, dirname: str) -> int:
+        """
+        Returns the highest index of any pattern for single path components which
+        matches a component of the given directory path. Results are cached.
+        """
+        if not dirname:
+            return -1
+
+        index = self._dir_cache.get(dirname)
+
+        if index is None:
+            parent, _, name = dirname.rpartition("/")
+            index = max(self._match_dir(parent), self._dir_names.match(name))
+            self._dir_cache.put(dirname, index)
+
+        return index
@@ -14,6 +14,7 @@ import os.path as osp
 import platform
 import shutil
 import unicodedata
+from functools import lru_cache
 from stat import S_ISDIR
 from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
 
@@ -27,6 +28,10 @@ from .hashing import DropboxContentHasher
 
 F_GETPATH = 50
 
+# Maximum number of normalized paths to keep in memory. Paths are typically normalized
+# repeatedly within a short time, e.g., while handling a single sync event.
+NORMALIZE_CACHE_SIZE = 8192
+
 
 def _path_components(path: str) -> List[str]:
     components = path.strip(osp.sep).split(osp.sep)
@@ -54,8 +59,10 @@ def is_child(
         path = normalize(path)
         parent = normalize(parent)
     else:
-        path = os.fsdecode(path)
-        parent = os.fsdecode(parent)
+        if not isinstance(path, str):
+            path = os.fsdecode(path)
+        if not isinstance(parent, str):
+            parent = os.fsdecode(parent)
 
     parent = parent.rstrip(osp.sep) + osp.sep
     path = path.rstrip(osp.sep)
@@ -79,6 +86,188 @@ def is_equal_or_child(
     return is_child(path, parent, case_sensitive) or path == parent
 
 
+class _TrieNode:
+    __slots__ = ("children", "is_member")
+
+    def __init__(self) -> None:
+        self.children: dict[str, _TrieNode] = {}
+        self.is_member = False
+
+
+class PathTrie:
+    """
+    A set of paths, stored as a tree of path components. In addition to the usual set
+    operations, this supports looking up the parents and children of a given path in
+    the set with a cost that scales with the depth of the path instead of the number of
+    items in the set. All paths must be given in the same normalization, for instance
+    as returned by :func:`normalize`.
+
+    :param paths: Initial paths in the set.
+    """
+
+    def __init__(self, paths: Iterable[str] = ()) -> None:
+        self._root = _TrieNode()
+        self._len = 0
+
+        for path in paths:
+            self.add(path)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._members(self._root, []))
+
+    def __contains__(self, path: object) -> bool:
+        if not isinstance(path, str):
+            return False
+        node = self._find(path)
+        return node is not None and node.is_member
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}({list(self)})>"
+
+    def add(self, path: str) -> None:
+        """
+        Adds a path to the set.
+
+        :param path: Path to add.
+        """
+        node = self._root
+
+        for component in _path_components(path):
+            node = node.children.setdefault(component, _TrieNode())
+
+        if not node.is_member:
+            node.is_member = True
+            self._len += 1
+
+    def discard(self, path: str) -> None:
+        """
+        Removes a path from the set if present.
+
+        :param path: Path to remove.
+        """
+        components = _path_components(path)
+        nodes = [self._root]
+
+        for component in components:
+            try:
+                nodes.append(nodes[-1].children[component])
+            except KeyError:
+                return
+
+        if not nodes[-1].is_member:
+            return
+
+        nodes[-1].is_member = False
+        self._len -= 1
+
+        # Prune nodes which no longer lead to any member.
+        for component, parent, node in zip(
+            reversed(components), reversed(nodes[:-1]), reversed(nodes)
+        ):
+            if node.is_member or node.children:
+                break
+            del parent.children[component]
+
+    def contains_equal_or_parent(self, path: str) -> bool:
+        """
+        Checks if the given path or any of its parents is in the set.
+
+        :param path: Path to check.
+        :returns: Whether ``is_equal_or_child(path, p)`` for any ``p`` in the set.
+        """
+        node = self._root
+
+        if node.is_member:
+            return True
+
+        for component in _path_components(path):
+            try:
+                node = node.children[component]
+            except KeyError:
+                return False
+            if node.is_member:
+                return True
+
+        return False
+
+    def contains_child(self, path: str) -> bool:
+        """
+        Checks if any child of the given path is in the set.
+
+        :param path: Path to check.
+        :returns: Whether ``is_child(p, path)`` for any ``p`` in the set.
+        """
+        node = self._find(path)
+        return node is not None and len(node.children) > 0
+
+    def parents(self, path: str) -> list[str]:
+        """
+        Returns all parents of the given path which are in the set.
+
+        :param path: Path to check.
+        :returns: All ``p`` in the set with ``is_child(path, p)``, top-down.
+        """
+        components = _path_components(path)
+        node = self._root
+        parents = [osp.sep] if node.is_member and components else []
+
+        for i, component in enumerate(components[:-1]):
+            try:
+                node = node.children[component]
+            except KeyError:
+                break
+            if node.is_member:
+                parents.append(osp.sep + osp.sep.join(components[: i + 1]))
+
+        return parents
+
+    def children(self, path: str) -> list[str]:
+        """
+        Returns all children of the given path which are in the set.
+
+        :param path: Path to check.
+        :returns: All ``p`` in the set with ``is_child(p, path)``.
+        """
+        components = _path_components(path)
+        node = self._find(path)
+
+        if node is None:
+            return []
+
+        return [
+            p
+            for name, child in node.children.items()
+            for p in self._members(child, components + [name])
+        ]
+
+    def _find(self, path: str) -> Optional[_TrieNode]:
+        node = self._root
+
+        for component in _path_components(path):
+            try:
+                node = node.children[component]
+            except KeyError:
+                return None
+
+        return node
+
+    def _members(self, node: _TrieNode, components: List[str]) -> List[str]:
+        members = []
+        stack = [(node, components)]
+
+        while stack:
+            node, components = stack.pop()
+            if node.is_member:
+                members.append(osp.sep + osp.sep.join(components))
+            for name, child in node.children.items():
+                stack.append((child, components + [name]))
+
+        return members
+
+
 # ==== case sensitivity and normalization ==============================================
 
 
@@ -100,6 +289,8 @@ def normalize_unicode(string: str) -> str:
     :param string: Original string.
     :returns: Normalized string.
     """
+    if string.isascii():
+        return string
     return unicodedata.normalize("NFC", string)
 
 
@@ -123,10 +314,20 @@ def normalize(path: str | bytes) -> str:
 
     Todo: Follow Python 2.5 / Dropbox conventions instead of Python 3 conventions.
 
+    Results are cached for the most recently used paths, such that repeated calls with
+    the same path return the same string object.
+
     :param path: Original path.
     :returns: Normalized path.
     """
-    return normalize_case(normalize_unicode(os.fsdecode(path)))
+    if not isinstance(path, str):
+        path = os.fsdecode(path)
+    return _normalize_str(path)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_str(path: str) -> str:
+    return normalize_case(normalize_unicode(path))
 
 
 def is_fs_case_sensitive(path: str) -> bool:
@@ -0,0 +1,93 @@
+import os
+import os.path as osp
+
+import pytest
+
+from maestral.client import DropboxClient
+from maestral.config import remove_configuration
+from maestral.fsevents import Observer
+from maestral.keyring import CredentialStorage
+from maestral.sync import SyncEngine
+from maestral.utils.appdirs import get_home_dir
+from maestral.utils.integration import CPU_CORE_COUNT
+from maestral.utils.path import delete
+
+from .fake_dropbox import FakeDropbox
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--scale",
+        action="store",
+        type=float,
+        default=1.0,
+        dest="SCALE",
+        help="Factor for the number and size of files in each benchmark scenario.",
+    )
+    parser.addoption(
+        "--api-latency",
+        action="store",
+        type=float,
+        default=0.0,
+        dest="API_LATENCY",
+        help="Simulated latency of each Dropbox API request in seconds.",
+    )
+    parser.addoption(
+        "--api-bandwidth",
+        action="store",
+        type=float,
+        default=0.0,
+        dest="API_BANDWIDTH",
+        help="Simulated bandwidth of the Dropbox API in bytes/sec (0 = unlimited).",
+    )
+
+
+@pytest.fixture
+def scale(pytestconfig) -> float:
+    """Factor for the number and size of files in a benchmark scenario."""
+    return pytestconfig.option.SCALE
+
+
+@pytest.fixture
+def fake_dropbox(pytestconfig):
+    return FakeDropbox(
+        latency=pytestconfig.option.API_LATENCY,
+        bandwidth=pytestconfig.option.API_BANDWIDTH,
+    )
+
+
+@pytest.fixture
+def sync(fake_dropbox):
+    """
+    Returns a sync engine which is linked to the fake Dropbox and watches a new local
+    Dropbox folder for changes.
+    """
+    config_name = "benchmark-config"
+    local_dir = osp.join(get_home_dir(), "benchmark_dir")
+    os.mkdir(local_dir)
+
+    client = DropboxClient(
+        config_name, CredentialStorage(config_name), session=fake_dropbox.session()
+    )
+    res = client.link(access_token="fake-access-token")
+
+    if res > 0:
+        raise RuntimeError(f"[error {res}] linking failed")
+
+    sync = SyncEngine(client)
+    sync.fs_events.enable()
+    # Measure the sync engine itself instead of the default CPU usage limit.
+    sync.max_cpu_percent = 100 * CPU_CORE_COUNT
+    sync.dropbox_path = local_dir
+
+    observer = Observer()
+    observer.schedule(sync.fs_events, sync.dropbox_path, recursive=True)
+    observer.start()
+
+    yield sync
+
+    observer.stop()
+    observer.join()
+
+    remove_configuration(config_name)
+    delete(sync.dropbox_path)
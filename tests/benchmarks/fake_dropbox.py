@@ -0,0 +1,1004 @@
+"""
+An in-process fake of the Dropbox API for benchmarks.
+
+:class:`FakeDropbox` keeps the content of a Dropbox in memory and implements the API
+routes which Maestral uses for syncing: listing folders and changes, longpoll,
+downloads, uploads and upload sessions, creating, moving and deleting items and the
+corresponding batch operations. The Dropbox SDK always connects to its hosts via
+HTTPS, therefore the fake is not served on a socket but mounted as transport adapter of
+a requests session, see :meth:`FakeDropbox.session`. Requests still pass through the
+Dropbox SDK, JSON serialization and requests as they would in production.
+
+Network latency and bandwidth are simulated for each request. The bandwidth is shared
+by all concurrent requests and applies to uploaded and downloaded file content.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os.path as osp
+import random
+import re
+import threading
+import time
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator
+from urllib.parse import urlsplit
+
+import dropbox
+import requests
+from dropbox import async_, common, files, stone_serializers, users, users_common
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from maestral.utils.hashing import DropboxContentHasher
+
+__all__ = ["FakeDropbox"]
+
+
+ACCOUNT_ID = "dbid:" + "A" * 35
+NAMESPACE_ID = "1"
+
+BLOCK_SIZE = DropboxContentHasher.BLOCK_SIZE
+LIST_FOLDER_LIMIT = 2000
+SNAPSHOT_CACHE_SIZE = 8
+
+_ROUTE_PATH = re.compile(
+    r"^/2/(?P<namespace>\w+)/(?P<name>[\w/]+?)(_v(?P<version>\d+))?$"
+)
+
+
+def _now() -> datetime:
+    # The Dropbox API uses naive datetimes in UTC with second precision.
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def _content_hash(data: bytes) -> str:
+    hasher = DropboxContentHasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
+
+class _Content:
+    """
+    Content of a file. Content is either given as bytes or generated by repeating a
+    random block of 4 MB, which allows serving large files without keeping them in
+    memory. Uploaded content may be discarded to benchmark large uploads, in which case
+    the file cannot be downloaded.
+    """
+
+    _pattern_block = random.Random(0).randbytes(BLOCK_SIZE)
+    _pattern_block_hash = hashlib.sha256(_pattern_block).digest()
+
+    def __init__(self, size: int, content_hash: str, data: bytes | None = None) -> None:
+        self.size = size
+        self.content_hash = content_hash
+        self._data = data
+        self._is_pattern = False
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> _Content:
+        return cls(len(data), _content_hash(data), data)
+
+    @classmethod
+    def pattern(cls, size: int) -> _Content:
+        n_blocks, remainder = divmod(size, BLOCK_SIZE)
+        block_hashes = cls._pattern_block_hash * n_blocks
+
+        if remainder:
+            block_hashes += hashlib.sha256(cls._pattern_block[:remainder]).digest()
+
+        content = cls(size, hashlib.sha256(block_hashes).hexdigest())
+        content._is_pattern = True
+        return content
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        if self._data is not None:
+            yield self._data
+        elif self._is_pattern:
+            n_blocks, remainder = divmod(self.size, BLOCK_SIZE)
+            for _ in range(n_blocks):
+                yield self._pattern_block
+            if remainder:
+                yield self._pattern_block[:remainder]
+        else:
+            raise RuntimeError("Content of file was discarded after upload")
+
+
+class _UploadSession:
+    def __init__(self, keep_data: bool) -> None:
+        self.hasher = DropboxContentHasher()
+        self.chunks: list[bytes] | None = [] if keep_data else None
+        self.offset = 0
+        self.closed = False
+
+    def append(self, data: bytes) -> None:
+        self.hasher.update(data)
+        if self.chunks is not None:
+            self.chunks.append(data)
+        self.offset += len(data)
+
+    def content(self) -> _Content:
+        data = b"".join(self.chunks) if self.chunks is not None else None
+        return _Content(self.offset, self.hasher.hexdigest(), data)
+
+
+class _RouteError(Exception):
+    """Raised by route handlers to return an API error with status 409."""
+
+    def __init__(self, error: Any, summary: str) -> None:
+        self.error = error
+        self.summary = summary
+
+
+class _Link:
+    """A network link with limited bandwidth, shared by all requests."""
+
+    def __init__(self, bandwidth: float) -> None:
+        self.bandwidth = bandwidth
+        self._free_at = 0.0
+        self._lock = threading.Lock()
+
+    def transfer(self, n_bytes: int) -> None:
+        """Blocks until the given number of bytes could be transferred."""
+        if self.bandwidth <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._free_at = max(self._free_at, now) + n_bytes / self.bandwidth
+            delay = self._free_at - now
+
+        # Let small delays accumulate to avoid the overhead of many short sleeps.
+        if delay > 0.001:
+            time.sleep(delay)
+
+
+class _ResponseBody(io.RawIOBase):
+    """Streams file content for a download response."""
+
+    def __init__(self, chunks: Iterator[bytes], link: _Link) -> None:
+        self._chunks = chunks
+        self._link = link
+        self._buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b: Any) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        self._link.transfer(n)
+        return n
+
+
+class _Adapter(BaseAdapter):
+    def __init__(self, server: FakeDropbox) -> None:
+        super().__init__()
+        self._server = server
+
+    def send(
+        self, request: requests.PreparedRequest, *args: Any, **kwargs: Any
+    ) -> requests.Response:
+        return self._server.handle_request(request)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeDropbox:
+    """
+    An in-memory Dropbox for a single user account.
+
+    :param latency: Simulated round trip time of each API request in seconds.
+    :param bandwidth: Simulated bandwidth for file content in bytes / sec, shared by all
+        requests (0 = unlimited).
+    :param keep_uploads: Whether to keep the content of uploaded files. If False,
+        uploaded files cannot be downloaded again but memory usage remains constant
+        when uploading large files.
+    """
+
+    def __init__(
+        self, latency: float = 0.0, bandwidth: float = 0.0, keep_uploads: bool = True
+    ) -> None:
+        self.latency = latency
+        self.keep_uploads = keep_uploads
+        self.request_counts: Counter[str] = Counter()
+
+        self._link = _Link(bandwidth)
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+
+        self._items: dict[str, files.FileMetadata | files.FolderMetadata] = {}
+        self._contents: dict[str, _Content] = {}
+        self._revisions: dict[str, str] = {}
+        self._log: list[files.Metadata] = []
+        self._snapshots: OrderedDict[tuple[str, bool, int], list[files.Metadata]] = (
+            OrderedDict()
+        )
+        self._upload_sessions: dict[str, _UploadSession] = {}
+        self._jobs: dict[str, Any] = {}
+        self._counter = 0
+
+        self._routes: dict[str, Callable[..., Any]] = {
+            "files/list_folder": self._list_folder,
+            "files/list_folder/continue": self._list_folder_continue,
+            "files/list_folder/get_latest_cursor": self._list_folder_get_latest_cursor,
+            "files/list_folder/longpoll": self._list_folder_longpoll,
+            "files/get_metadata": self._get_metadata,
+            "files/download": self._download,
+            "files/upload": self._upload,
+            "files/upload_session/start": self._upload_session_start,
+            "files/upload_session/append:2": self._upload_session_append,
+            "files/upload_session/finish": self._upload_session_finish,
+            "files/create_folder:2": self._create_folder,
+            "files/delete:2": self._delete,
+            "files/move:2": self._move,
+            "files/delete_batch": self._delete_batch,
+            "files/delete_batch/check": self._check_job,
+            "files/create_folder_batch": self._create_folder_batch,
+            "files/create_folder_batch/check": self._check_job,
+            "users/get_current_account": self._get_current_account,
+            "users/get_space_usage": self._get_space_usage,
+        }
+
+    @property
+    def bandwidth(self) -> float:
+        """Simulated bandwidth in bytes / sec (0 = unlimited)."""
+        return self._link.bandwidth
+
+    @bandwidth.setter
+    def bandwidth(self, value: float) -> None:
+        """Setter: bandwidth."""
+        self._link.bandwidth = value
+
+    def session(self) -> requests.Session:
+        """
+        :returns: Requests session which sends all requests to this fake Dropbox. Pass
+            it to :class:`maestral.client.DropboxClient`.
+        """
+        session = requests.Session()
+        session.mount("https://", _Adapter(self))
+        return session
+
+    # ==== Setup and remote changes ====================================================
+
+    def add_file(
+        self, path: str, data: bytes | None = None, size: int = 0
+    ) -> files.FileMetadata:
+        """
+        Adds a file and all its parent folders to the Dropbox.
+
+        :param path: Path of the file.
+        :param data: Content of the file. If not given, content of the given size is
+            generated.
+        :param size: Size of generated content in bytes.
+        :returns: Metadata of the file.
+        """
+        content = (
+            _Content.from_bytes(data) if data is not None else _Content.pattern(size)
+        )
+
+        with self._lock:
+            return self._commit(path, files.WriteMode.overwrite, False, None, content)
+
+    def add_folder(self, path: str) -> files.FolderMetadata:
+        """
+        Adds a folder and all its parent folders to the Dropbox.
+
+        :param path: Path of the folder.
+        :returns: Metadata of the folder.
+        """
+        with self._lock:
+            return self._make_folder(path)
+
+    def delete(self, path: str) -> None:
+        """
+        Deletes an item and all its children from the Dropbox.
+
+        :param path: Path of the item.
+        """
+        with self._lock:
+            self._remove(path.lower())
+
+    def move(self, from_path: str, to_path: str) -> None:
+        """
+        Moves an item and all its children.
+
+        :param from_path: Current path of the item.
+        :param to_path: New path of the item.
+        """
+        with self._lock:
+            self._relocate(from_path, to_path)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    # ==== Request handling ============================================================
+
+    def handle_request(self, request: requests.PreparedRequest) -> requests.Response:
+        """
+        Handles an API request as the Dropbox servers would.
+
+        :param request: Request to the Dropbox API.
+        :returns: Response to the request.
+        """
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        match = _ROUTE_PATH.match(urlsplit(request.url).path)
+        route_key = ""
+        route = None
+
+        if match:
+            route_key = f"{match['namespace']}/{match['name']}"
+            if match["version"]:
+                route_key += f":{match['version']}"
+            namespace = getattr(dropbox, match["namespace"], None)
+            route = getattr(namespace, "ROUTES", {}).get(route_key.split("/", 1)[1])
+
+        if route is None or route_key not in self._routes:
+            return self._response(request, 400, b"Unknown API function", "text/plain")
+
+        self.request_counts[route_key] += 1
+        style = route.attrs["style"] or "rpc"
+
+        if style == "rpc":
+            raw_arg = request.body
+        else:
+            raw_arg = request.headers["Dropbox-API-Arg"]
+
+        if isinstance(raw_arg, bytes):
+            raw_arg = raw_arg.decode()
+
+        arg = stone_serializers.json_decode(route.arg_type, raw_arg or "null")
+
+        try:
+            if style == "upload":
+                data = self._read_body(request.body)
+                result = self._routes[route_key](arg, data)
+            else:
+                result = self._routes[route_key](arg)
+        except _RouteError as exc:
+            error = {
+                "error_summary": exc.summary,
+                "error": stone_serializers.json_compat_obj_encode(
+                    route.error_type, exc.error
+                ),
+            }
+            return self._response(request, 409, json.dumps(error).encode())
+
+        if style == "download":
+            md, content = result
+            headers = {
+                "Dropbox-API-Result": stone_serializers.json_encode(
+                    route.result_type, md
+                )
+            }
+            body = _ResponseBody(content.iter_chunks(), self._link)
+            return self._response(
+                request, 200, body, "application/octet-stream", headers
+            )
+
+        raw_result = stone_serializers.json_encode(route.result_type, result)
+        return self._response(request, 200, raw_result.encode())
+
+    def _read_body(self, body: Any) -> bytes:
+        if body is None:
+            data = b""
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = b"".join(body)
+
+        self._link.transfer(len(data))
+        return data
+
+    @staticmethod
+    def _response(
+        request: requests.PreparedRequest,
+        status_code: int,
+        body: bytes | io.RawIOBase,
+        content_type: str = "application/json",
+        headers: dict[str, str] | None = None,
+    ) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers or {})
+        response.headers["Content-Type"] = content_type
+        response.headers["X-Dropbox-Request-Id"] = uuid.uuid4().hex
+        response.raw = io.BytesIO(body) if isinstance(body, bytes) else body
+        response.url = request.url or ""
+        response.request = request
+        response.encoding = "utf-8"
+        return response
+
+    # ==== Internal state ==============================================================
+
+    def _next_rev(self) -> str:
+        self._counter += 1
+        return f"{self._counter:015x}"
+
+    def _next_id(self) -> str:
+        self._counter += 1
+        return f"id:{self._counter:022d}"
+
+    def _record(self, md: files.Metadata) -> None:
+        old_md = self._items.get(md.path_lower)
+
+        if isinstance(old_md, files.FileMetadata):
+            self._revisions.pop(old_md.rev, None)
+        if isinstance(md, files.FileMetadata):
+            self._revisions[md.rev] = md.path_lower
+
+        if isinstance(md, files.DeletedMetadata):
+            self._items.pop(md.path_lower, None)
+        else:
+            self._items[md.path_lower] = md
+        self._log.append(md)
+        self._changed.notify_all()
+
+    def _make_folder(self, path: str) -> files.FolderMetadata:
+        """Creates a folder and its parents if they do not exist yet."""
+        existing = self._items.get(path.lower())
+
+        if isinstance(existing, files.FolderMetadata):
+            return existing
+
+        if existing:
+            raise _RouteError(
+                files.WriteError.conflict(files.WriteConflictError.file),
+                "path/conflict/file/",
+            )
+
+        self._make_parent(path)
+
+        md = files.FolderMetadata(
+            name=osp.basename(path),
+            id=self._next_id(),
+            path_lower=path.lower(),
+            path_display=path,
+        )
+        self._record(md)
+        return md
+
+    def _make_parent(self, path: str) -> None:
+        parent = osp.dirname(path)
+        if parent != "/":
+            self._make_folder(parent)
+
+    def _commit(
+        self,
+        path: str,
+        mode: files.WriteMode,
+        autorename: bool,
+        client_modified: datetime | None,
+        content: _Content,
+    ) -> files.FileMetadata:
+        existing = self._items.get(path.lower())
+
+        if isinstance(existing, files.FileMetadata):
+            if existing.content_hash == content.content_hash:
+                return existing
+
+            if mode.is_overwrite() or (
+                mode.is_update() and mode.get_update() == existing.rev
+            ):
+                return self._write_file(path, client_modified, content, existing.id)
+
+        if existing:
+            if not autorename:
+                conflict = (
+                    files.WriteConflictError.file
+                    if isinstance(existing, files.FileMetadata)
+                    else files.WriteConflictError.folder
+                )
+                raise _RouteError(files.WriteError.conflict(conflict), "path/conflict/")
+            path = self._free_path(path)
+
+        return self._write_file(path, client_modified, content, self._next_id())
+
+    def _write_file(
+        self,
+        path: str,
+        client_modified: datetime | None,
+        content: _Content,
+        file_id: str,
+    ) -> files.FileMetadata:
+        self._make_parent(path)
+
+        # Only keep the content of the latest revision.
+        old_md = self._items.get(path.lower())
+        if isinstance(old_md, files.FileMetadata):
+            self._contents.pop(old_md.rev, None)
+
+        now = _now()
+        client_modified = client_modified or now
+        rev = self._next_rev()
+
+        md = files.FileMetadata(
+            name=osp.basename(path),
+            id=file_id,
+            client_modified=client_modified.replace(tzinfo=None, microsecond=0),
+            server_modified=now,
+            rev=rev,
+            size=content.size,
+            path_lower=path.lower(),
+            path_display=path,
+            content_hash=content.content_hash,
+            is_downloadable=True,
+        )
+        self._contents[rev] = content
+        self._record(md)
+        return md
+
+    def _free_path(self, path: str) -> str:
+        stem, ext = osp.splitext(path)
+        i = 1
+        while f"{stem} ({i}){ext}".lower() in self._items:
+            i += 1
+        return f"{stem} ({i}){ext}"
+
+    def _subtree(self, path_lower: str) -> list[files.Metadata]:
+        """Returns an item and all its children, parents before children."""
+        prefix = path_lower + "/"
+        children = [md for p, md in self._items.items() if p.startswith(prefix)]
+        children.sort(key=lambda md: md.path_lower)
+        return [self._items[path_lower]] + children
+
+    def _lookup(self, path: str) -> files.FileMetadata | files.FolderMetadata:
+        if path.startswith("rev:"):
+            path = self._revisions.get(path[4:], "")
+
+        try:
+            return self._items[path.lower()]
+        except KeyError:
+            raise _RouteError(files.LookupError.not_found, "path/not_found/")
+
+    def _remove(self, path_lower: str) -> files.Metadata:
+        subtree = self._subtree(self._lookup(path_lower).path_lower)
+
+        for md in subtree:
+            self._contents.pop(getattr(md, "rev", ""), None)
+            self._record(
+                files.DeletedMetadata(
+                    name=md.name, path_lower=md.path_lower, path_display=md.path_display
+                )
+            )
+
+        return subtree[0]
+
+    def _relocate(self, from_path: str, to_path: str) -> files.Metadata:
+        source = self._lookup(from_path)
+
+        if to_path.lower() in self._items:
+            raise _RouteError(
+                files.RelocationError.to(
+                    files.WriteError.conflict(files.WriteConflictError.file)
+                ),
+                "to/conflict/",
+            )
+
+        if to_path.lower().startswith(source.path_lower + "/"):
+            raise _RouteError(
+                files.RelocationError.cant_move_folder_into_itself,
+                "cant_move_folder_into_itself/",
+            )
+
+        self._make_parent(to_path)
+        subtree = self._subtree(source.path_lower)
+
+        for md in subtree:
+            self._record(
+                files.DeletedMetadata(
+                    name=md.name, path_lower=md.path_lower, path_display=md.path_display
+                )
+            )
+
+        moved = []
+
+        for md in subtree:
+            new_path = to_path + md.path_display[len(source.path_display) :]
+            new_md = (
+                files.FileMetadata(
+                    name=osp.basename(new_path),
+                    id=md.id,
+                    client_modified=md.client_modified,
+                    server_modified=md.server_modified,
+                    rev=md.rev,
+                    size=md.size,
+                    path_lower=new_path.lower(),
+                    path_display=new_path,
+                    content_hash=md.content_hash,
+                    is_downloadable=True,
+                )
+                if isinstance(md, files.FileMetadata)
+                else files.FolderMetadata(
+                    name=osp.basename(new_path),
+                    id=md.id,
+                    path_lower=new_path.lower(),
+                    path_display=new_path,
+                )
+            )
+            self._record(new_md)
+            moved.append(new_md)
+
+        return moved[0]
+
+    # ---- Cursors ---------------------------------------------------------------------
+
+    @staticmethod
+    def _encode_cursor(
+        path_lower: str, recursive: bool, pos: int, offset: int | None = None
+    ) -> str:
+        data = json.dumps([path_lower, recursive, pos, offset]).encode()
+        return urlsafe_b64encode(data).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple[str, bool, int, int | None]:
+        try:
+            path_lower, recursive, pos, offset = json.loads(urlsafe_b64decode(cursor))
+        except ValueError:
+            raise _RouteError(files.ListFolderContinueError.reset, "reset/")
+        return path_lower, recursive, pos, offset
+
+    @staticmethod
+    def _in_scope(path_lower: str, scope: str, recursive: bool) -> bool:
+        if path_lower == scope:
+            return scope != ""
+        if not path_lower.startswith(scope + "/"):
+            return False
+        return recursive or "/" not in path_lower[len(scope) + 1 :]
+
+    def _snapshot(
+        self, path_lower: str, recursive: bool, pos: int
+    ) -> list[files.Metadata]:
+        """Returns all items in the scope of a listing at the given log position."""
+        key = (path_lower, recursive, pos)
+
+        try:
+            self._snapshots.move_to_end(key)
+            return self._snapshots[key]
+        except KeyError:
+            pass
+
+        snapshot = [
+            md
+            for p, md in self._items.items()
+            if self._in_scope(p, path_lower, recursive)
+        ]
+        snapshot.sort(key=lambda md: md.path_lower)
+
+        self._snapshots[key] = snapshot
+        if len(self._snapshots) > SNAPSHOT_CACHE_SIZE:
+            self._snapshots.popitem(last=False)
+
+        return snapshot
+
+    def _list_page(
+        self, path_lower: str, recursive: bool, pos: int, offset: int, limit: int
+    ) -> files.ListFolderResult:
+        snapshot = self._snapshot(path_lower, recursive, pos)
+        end = offset + limit
+        has_more = end < len(snapshot)
+        cursor = self._encode_cursor(
+            path_lower, recursive, pos, end if has_more else None
+        )
+        return files.ListFolderResult(
+            entries=snapshot[offset:end], cursor=cursor, has_more=has_more
+        )
+
+    def _changes_page(
+        self, path_lower: str, recursive: bool, pos: int, limit: int
+    ) -> files.ListFolderResult:
+        changes: dict[str, files.Metadata] = {}
+        end = pos
+
+        while end < len(self._log) and len(changes) < limit:
+            md = self._log[end]
+            end += 1
+            if self._in_scope(md.path_lower, path_lower, recursive):
+                # Only report the latest change for each path.
+                changes.pop(md.path_lower, None)
+                changes[md.path_lower] = md
+
+        return files.ListFolderResult(
+            entries=list(changes.values()),
+            cursor=self._encode_cursor(path_lower, recursive, end),
+            has_more=end < len(self._log),
+        )
+
+    # ==== Routes ======================================================================
+
+    def _list_folder(self, arg: files.ListFolderArg) -> files.ListFolderResult:
+        with self._lock:
+            path_lower = arg.path.lower()
+
+            if path_lower and not isinstance(
+                self._lookup(path_lower), files.FolderMetadata
+            ):
+                raise _RouteError(
+                    files.ListFolderError.path(files.LookupError.not_folder),
+                    "path/not_folder/",
+                )
+
+            limit = min(arg.limit or LIST_FOLDER_LIMIT, LIST_FOLDER_LIMIT)
+            return self._list_page(path_lower, arg.recursive, len(self._log), 0, limit)
+
+    def _list_folder_continue(
+        self, arg: files.ListFolderContinueArg
+    ) -> files.ListFolderResult:
+        with self._lock:
+            path_lower, recursive, pos, offset = self._decode_cursor(arg.cursor)
+
+            if offset is not None:
+                return self._list_page(
+                    path_lower, recursive, pos, offset, LIST_FOLDER_LIMIT
+                )
+            return self._changes_page(path_lower, recursive, pos, LIST_FOLDER_LIMIT)
+
+    def _list_folder_get_latest_cursor(
+        self, arg: files.ListFolderArg
+    ) -> files.ListFolderGetLatestCursorResult:
+        with self._lock:
+            cursor = self._encode_cursor(
+                arg.path.lower(), arg.recursive, len(self._log)
+            )
+            return files.ListFolderGetLatestCursorResult(cursor)
+
+    def _list_folder_longpoll(
+        self, arg: files.ListFolderLongpollArg
+    ) -> files.ListFolderLongpollResult:
+        path_lower, recursive, pos, _ = self._decode_cursor(arg.cursor)
+
+        def has_changes() -> bool:
+            return any(
+                self._in_scope(md.path_lower, path_lower, recursive)
+                for md in self._log[pos:]
+            )
+
+        with self._changed:
+            changes = self._changed.wait_for(has_changes, timeout=arg.timeout)
+
+        return files.ListFolderLongpollResult(changes=changes)
+
+    def _get_metadata(self, arg: files.GetMetadataArg) -> files.Metadata:
+        with self._lock:
+            try:
+                return self._lookup(arg.path)
+            except _RouteError as exc:
+                raise _RouteError(files.GetMetadataError.path(exc.error), exc.summary)
+
+    def _download(self, arg: files.DownloadArg) -> tuple[files.FileMetadata, _Content]:
+        with self._lock:
+            try:
+                md = self._lookup(arg.path)
+            except _RouteError as exc:
+                raise _RouteError(files.DownloadError.path(exc.error), exc.summary)
+
+            if not isinstance(md, files.FileMetadata):
+                raise _RouteError(
+                    files.DownloadError.path(files.LookupError.not_file),
+                    "path/not_file/",
+                )
+
+            return md, self._contents[md.rev]
+
+    def _upload(self, arg: files.UploadArg, data: bytes) -> files.FileMetadata:
+        content = (
+            _Content.from_bytes(data)
+            if self.keep_uploads
+            else _Content(len(data), _content_hash(data))
+        )
+
+        with self._lock:
+            try:
+                return self._commit(
+                    arg.path, arg.mode, arg.autorename, arg.client_modified, content
+                )
+            except _RouteError as exc:
+                reason = files.UploadWriteFailed(reason=exc.error, upload_session_id="")
+                raise _RouteError(files.UploadError.path(reason), exc.summary)
+
+    def _upload_session_start(
+        self, arg: files.UploadSessionStartArg, data: bytes
+    ) -> files.UploadSessionStartResult:
+        session = _UploadSession(self.keep_uploads)
+        session.append(data)
+        session.closed = arg.close
+        session_id = uuid.uuid4().hex
+
+        with self._lock:
+            self._upload_sessions[session_id] = session
+
+        return files.UploadSessionStartResult(session_id)
+
+    def _get_upload_session(self, cursor: files.UploadSessionCursor) -> _UploadSession:
+        with self._lock:
+            session = self._upload_sessions.get(cursor.session_id)
+
+        if not session:
+            raise _RouteError(files.UploadSessionLookupError.not_found, "not_found/")
+        if session.offset != cursor.offset:
+            error = files.UploadSessionOffsetError(correct_offset=session.offset)
+            raise _RouteError(
+                files.UploadSessionLookupError.incorrect_offset(error),
+                "incorrect_offset/",
+            )
+        if session.closed:
+            raise _RouteError(files.UploadSessionLookupError.closed, "closed/")
+
+        return session
+
+    def _upload_session_append(
+        self, arg: files.UploadSessionAppendArg, data: bytes
+    ) -> None:
+        try:
+            session = self._get_upload_session(arg.cursor)
+        except _RouteError as exc:
+            # UploadSessionAppendError has the same tags as UploadSessionLookupError.
+            error = files.UploadSessionAppendError(exc.error._tag, exc.error._value)
+            raise _RouteError(error, exc.summary)
+
+        session.append(data)
+        session.closed = arg.close
+
+    def _upload_session_finish(
+        self, arg: files.UploadSessionFinishArg, data: bytes
+    ) -> files.FileMetadata:
+        try:
+            session = self._get_upload_session(arg.cursor)
+        except _RouteError as exc:
+            raise _RouteError(
+                files.UploadSessionFinishError.lookup_failed(exc.error), exc.summary
+            )
+
+        session.append(data)
+        commit = arg.commit
+
+        with self._lock:
+            del self._upload_sessions[arg.cursor.session_id]
+
+            try:
+                return self._commit(
+                    commit.path,
+                    commit.mode,
+                    commit.autorename,
+                    commit.client_modified,
+                    session.content(),
+                )
+            except _RouteError as exc:
+                raise _RouteError(
+                    files.UploadSessionFinishError.path(exc.error), exc.summary
+                )
+
+    def _create_folder(self, arg: files.CreateFolderArg) -> files.CreateFolderResult:
+        with self._lock:
+            if arg.path.lower() in self._items:
+                raise _RouteError(
+                    files.CreateFolderError.path(
+                        files.WriteError.conflict(files.WriteConflictError.folder)
+                    ),
+                    "path/conflict/folder/",
+                )
+
+            try:
+                return files.CreateFolderResult(self._make_folder(arg.path))
+            except _RouteError as exc:
+                raise _RouteError(files.CreateFolderError.path(exc.error), exc.summary)
+
+    def _delete(self, arg: files.DeleteArg) -> files.DeleteResult:
+        with self._lock:
+            try:
+                return files.DeleteResult(self._remove(arg.path.lower()))
+            except _RouteError as exc:
+                raise _RouteError(files.DeleteError.path_lookup(exc.error), exc.summary)
+
+    def _move(self, arg: files.RelocationArg) -> files.RelocationResult:
+        with self._lock:
+            try:
+                return files.RelocationResult(
+                    self._relocate(arg.from_path, arg.to_path)
+                )
+            except _RouteError as exc:
+                if isinstance(exc.error, files.LookupError):
+                    error = files.RelocationError.from_lookup(exc.error)
+                    raise _RouteError(error, f"from_lookup/{exc.summary}")
+                if isinstance(exc.error, files.WriteError):
+                    error = files.RelocationError.to(exc.error)
+                    raise _RouteError(error, f"to/{exc.summary}")
+                raise
+
+    def _delete_batch(self, arg: files.DeleteBatchArg) -> files.DeleteBatchLaunch:
+        entries = []
+
+        for delete_arg in arg.entries:
+            try:
+                result = self._delete(delete_arg)
+            except _RouteError as exc:
+                entries.append(files.DeleteBatchResultEntry.failure(exc.error))
+            else:
+                data = files.DeleteBatchResultData(result.metadata)
+                entries.append(files.DeleteBatchResultEntry.success(data))
+
+        status = files.DeleteBatchJobStatus.complete(files.DeleteBatchResult(entries))
+        return files.DeleteBatchLaunch.async_job_id(self._add_job(status))
+
+    def _create_folder_batch(
+        self, arg: files.CreateFolderBatchArg
+    ) -> files.CreateFolderBatchLaunch:
+        entries = []
+
+        for path in arg.paths:
+            try:
+                result = self._create_folder(files.CreateFolderArg(path))
+            except _RouteError as exc:
+                error = files.CreateFolderEntryError.path(exc.error.get_path())
+                entries.append(files.CreateFolderBatchResultEntry.failure(error))
+            else:
+                data = files.CreateFolderEntryResult(result.metadata)
+                entries.append(files.CreateFolderBatchResultEntry.success(data))
+
+        status = files.CreateFolderBatchJobStatus.complete(
+            files.CreateFolderBatchResult(entries)
+        )
+        return files.CreateFolderBatchLaunch.async_job_id(self._add_job(status))
+
+    def _add_job(self, status: Any) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = status
+        return job_id
+
+    def _check_job(self, arg: async_.PollArg) -> Any:
+        with self._lock:
+            try:
+                return self._jobs.pop(arg.async_job_id)
+            except KeyError:
+                raise _RouteError(
+                    async_.PollError.invalid_async_job_id, "invalid_async_job_id/"
+                )
+
+    def _get_current_account(self, arg: None) -> users.FullAccount:
+        return users.FullAccount(
+            account_id=ACCOUNT_ID,
+            name=users.Name(
+                given_name="Fake",
+                surname="User",
+                familiar_name="Fake",
+                display_name="Fake User",
+                abbreviated_name="FU",
+            ),
+            email="fake.user@example.com",
+            email_verified=True,
+            disabled=False,
+            locale="en",
+            referral_link="https://db.tt/fake",
+            is_paired=False,
+            account_type=users_common.AccountType.basic,
+            root_info=common.UserRootInfo(
+                root_namespace_id=NAMESPACE_ID, home_namespace_id=NAMESPACE_ID
+            ),
+            country="US",
+        )
+
+    def _get_space_usage(self, arg: None) -> users.SpaceUsage:
+        with self._lock:
+            used = sum(content.size for content in self._contents.values())
+
+        allocation = users.SpaceAllocation.individual(
+            users.IndividualSpaceAllocation(allocated=2 * 1024**4)
+        )
+        return users.SpaceUsage(used=used, allocation=allocation)
@@ -0,0 +1,46 @@
+"""
+Benchmark of the import time of the CLI entry point, measured with ``python -X
+importtime`` in a fresh interpreter.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+# Maximum cumulative import time of the CLI entry point in seconds.
+IMPORT_TIME_BUDGET = 0.25
+
+
+def cli_import_time() -> float:
+    """Returns the cumulative import time of maestral.cli in seconds."""
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import maestral.cli"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # Lines are formatted as "import time: self [us] | cumulative | imported package".
+    for line in res.stderr.splitlines():
+        _, cumulative_us, name = line.split("|")
+        if name.strip() == "maestral.cli":
+            return int(cumulative_us) / 1e6
+
+    pytest.fail("maestral.cli not found in import time output")
+
+
+@pytest.mark.benchmark(group="cli")
+def test_import_time(benchmark) -> None:
+    """Imports the CLI in a new interpreter and checks it against a budget."""
+    import_times: list[float] = []
+
+    def run() -> None:
+        import_times.append(cli_import_time())
+
+    benchmark.pedantic(run, rounds=5, iterations=1)
+
+    benchmark.extra_info["import_time_s"] = round(min(import_times), 4)
+    benchmark.extra_info["budget_s"] = IMPORT_TIME_BUDGET
+
+    assert min(import_times) < IMPORT_TIME_BUDGET
@@ -0,0 +1,46 @@
+"""
+Benchmark of matching the paths of a large tree against mignore patterns, compared to
+matching with pathspec directly. Use the ``--scale`` option to reduce the number of
+paths for quick runs.
+"""
+
+import random
+import time
+
+import pytest
+from pathspec import PathSpec
+
+from maestral.utils.mignore import MignoreMatcher
+
+from ..offline.utils.test_mignore import random_patterns, random_tree
+
+N_PATHS = 1_000_000
+
+
+@pytest.mark.benchmark(group="mignore")
+def test_match_paths(scale: float, benchmark) -> None:
+    """Matches 1M paths of a tree against 200 patterns."""
+    rng = random.Random(0)
+    patterns = random_patterns(rng, 200)
+    paths = random_tree(rng, max(int(N_PATHS * scale), 1000))
+    spec = PathSpec.from_lines("gitwildmatch", patterns)
+
+    def match_all() -> int:
+        matcher = MignoreMatcher(spec)
+        return sum(matcher.match_file(path) for path in paths)
+
+    n_matches = benchmark.pedantic(match_all, rounds=1, iterations=1)
+
+    # Match a sample of paths with the PathSpec directly for comparison.
+    sample = paths[:: max(len(paths) // 20_000, 1)]
+    t0 = time.perf_counter()
+    for path in sample:
+        spec.match_file(path)
+    pathspec_time = (time.perf_counter() - t0) * len(paths) / len(sample)
+
+    benchmark.extra_info["n_paths"] = len(paths)
+    benchmark.extra_info["matches"] = n_matches
+    benchmark.extra_info["pathspec_time_s"] = round(pathspec_time, 2)
+
+    if benchmark.stats:
+        assert benchmark.stats.stats.mean < pathspec_time / 5
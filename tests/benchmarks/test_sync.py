@@ -0,0 +1,154 @@
+"""
+Benchmarks of sync scenarios against the fake Dropbox API. Use the ``--scale`` option to
+reduce the number and size of files for quick runs and ``--api-latency`` and
+``--api-bandwidth`` to simulate network conditions. Results are saved for trend
+tracking with pytest-benchmark's ``--benchmark-json`` or ``--benchmark-autosave``
+options, including the number of files, bytes and API requests of each scenario as
+extra info.
+
+Upload scenarios run full upload sync cycles which wait for 1 sec without further file
+system events before uploading.
+"""
+
+import os
+import os.path as osp
+import random
+from stat import S_ISREG
+
+import pytest
+
+from maestral.sync import SyncEngine
+from maestral.utils.path import walk
+
+from .fake_dropbox import FakeDropbox
+
+N_SMALL_FILES = 100_000
+FILES_PER_FOLDER = 1000
+LARGE_FILE_SIZE = 5 * 1024**3
+
+
+def populate(fake_dropbox: FakeDropbox, root: str, n_files: int) -> None:
+    """Adds small files to the fake Dropbox, distributed over multiple folders."""
+    for i in range(n_files):
+        path = f"{root}/folder_{i // FILES_PER_FOLDER}/file_{i}.txt"
+        fake_dropbox.add_file(path, f"content of file {i}\n".encode())
+
+
+def count_local_files(sync: SyncEngine) -> int:
+    return sum(1 for _, stat in walk(sync.dropbox_path) if S_ISREG(stat.st_mode))
+
+
+def record_info(benchmark, fake_dropbox: FakeDropbox, **info: int) -> None:
+    benchmark.extra_info.update(info)
+    benchmark.extra_info["api_requests"] = sum(fake_dropbox.request_counts.values())
+    benchmark.extra_info["api_requests_by_route"] = dict(fake_dropbox.request_counts)
+
+
+@pytest.fixture
+def synced_files(sync: SyncEngine, fake_dropbox: FakeDropbox, scale: float) -> int:
+    """Populates the fake Dropbox with small files and downloads them."""
+    n_files = max(int(N_SMALL_FILES * scale), 1)
+    populate(fake_dropbox, "/folder", n_files)
+    sync.download_sync_cycle()
+    fake_dropbox.request_counts.clear()
+    return n_files
+
+
+@pytest.mark.benchmark(group="sync")
+def test_initial_sync_small_files(
+    sync: SyncEngine, fake_dropbox: FakeDropbox, scale: float, benchmark
+) -> None:
+    """Indexes and downloads a Dropbox with 100k small files."""
+    n_files = max(int(N_SMALL_FILES * scale), 1)
+    populate(fake_dropbox, "/folder", n_files)
+
+    benchmark.pedantic(sync.download_sync_cycle, rounds=1, iterations=1)
+
+    record_info(benchmark, fake_dropbox, n_files=n_files)
+    assert count_local_files(sync) == n_files
+
+
+@pytest.mark.benchmark(group="sync")
+def test_download_large_file(
+    sync: SyncEngine, fake_dropbox: FakeDropbox, scale: float, benchmark
+) -> None:
+    """Downloads a single file of 5 GB."""
+    size = int(LARGE_FILE_SIZE * scale)
+    fake_dropbox.add_file("/large.bin", size=size)
+
+    benchmark.pedantic(sync.download_sync_cycle, rounds=1, iterations=1)
+
+    record_info(benchmark, fake_dropbox, n_files=1, n_bytes=size)
+    assert osp.getsize(osp.join(sync.dropbox_path, "large.bin")) == size
+
+
+@pytest.mark.benchmark(group="sync")
+def test_upload_large_file(
+    sync: SyncEngine, fake_dropbox: FakeDropbox, scale: float, benchmark
+) -> None:
+    """Uploads a single file of 5 GB."""
+    size = int(LARGE_FILE_SIZE * scale)
+    block = random.Random(0).randbytes(4 * 1024**2)
+    fake_dropbox.keep_uploads = False
+
+    with open(osp.join(sync.dropbox_path, "large.bin"), "wb") as f:
+        for _ in range(size // len(block)):
+            f.write(block)
+        f.write(block[: size % len(block)])
+
+    benchmark.pedantic(sync.upload_sync_cycle, rounds=1, iterations=1)
+
+    record_info(benchmark, fake_dropbox, n_files=1, n_bytes=size)
+    assert fake_dropbox.request_counts["files/upload_session/finish"] == (
+        1 if size > 4 * 1024**2 else 0
+    )
+    assert sync.get_index_entry("/large.bin")
+
+
+@pytest.mark.benchmark(group="sync")
+def test_remote_mass_delete(
+    sync: SyncEngine, fake_dropbox: FakeDropbox, synced_files: int, benchmark
+) -> None:
+    """Deletes a folder with 100k small files on Dropbox and syncs the deletion."""
+    fake_dropbox.delete("/folder")
+
+    benchmark.pedantic(sync.download_sync_cycle, rounds=1, iterations=1)
+
+    record_info(benchmark, fake_dropbox, n_files=synced_files)
+    assert not osp.exists(osp.join(sync.dropbox_path, "folder"))
+    assert len(sync.get_index()) == 0
+
+
+@pytest.mark.benchmark(group="sync")
+def test_rename_large_folder(
+    sync: SyncEngine, fake_dropbox: FakeDropbox, synced_files: int, benchmark
+) -> None:
+    """Renames a local folder with 100k small files and syncs the move."""
+    os.rename(
+        osp.join(sync.dropbox_path, "folder"), osp.join(sync.dropbox_path, "renamed")
+    )
+
+    benchmark.pedantic(sync.upload_sync_cycle, rounds=1, iterations=1)
+
+    record_info(benchmark, fake_dropbox, n_files=synced_files)
+    assert fake_dropbox.request_counts["files/move:2"] == 1
+    assert sync.get_index_entry("/renamed/folder_0/file_0.txt")
+    assert not sync.get_index_entry("/folder/folder_0/file_0.txt")
+
+
+@pytest.mark.benchmark(group="sync")
+def test_startup_scan(
+    sync: SyncEngine, fake_dropbox: FakeDropbox, synced_files: int, benchmark
+) -> None:
+    """Scans a local Dropbox folder with 100k unchanged files on startup."""
+    sync.local_cursor = max(stat.st_ctime for _, stat in walk(sync.dropbox_path))
+
+    # Start with a new sync engine as when restarting Maestral.
+    new_sync = SyncEngine(sync.client)
+
+    benchmark.pedantic(
+        new_sync.upload_local_changes_while_inactive, rounds=1, iterations=1
+    )
+
+    record_info(benchmark, fake_dropbox, n_files=synced_files)
+    assert sum(fake_dropbox.request_counts.values()) == 0
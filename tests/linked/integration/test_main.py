@@ -113,6 +113,22 @@ def test_file_status(m: Maestral) -> None:
     assert file_status_parent == FileStatus.Error.value
 
 
+def test_file_status_batch(m: Maestral) -> None:
+    local_path = m.to_local_path("/test.txt")
+    with open(local_path, "w") as f:
+        f.write("new")
+
+    wait_for_idle(m)
+
+    paths = [m.dropbox_path, local_path, "/url/local"]
+    file_status = m.get_file_status_batch(paths)
+
+    assert file_status == {path: m.get_file_status(path) for path in paths}
+
+    children_status = m.get_folder_children_status(m.dropbox_path)
+    assert children_status["test.txt"] == FileStatus.Synced.value
+
+
 def test_move_dropbox_folder(m: Maestral) -> None:
     new_dir_short = "~/New Dropbox"
     new_dir = osp.realpath(osp.expanduser(new_dir_short))
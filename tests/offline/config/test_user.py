@@ -1,4 +1,6 @@
 import configparser as cp
+import os
+import os.path as osp
 
 import pytest
 from packaging.version import Version
@@ -84,3 +86,78 @@ def test_update(config):
 
         with pytest.raises(cp.NoOptionError):
             conf.get("sync", "path")
+
+
+def test_get_returns_copy(config):
+    config.set("sync", "excluded_items", ["a", "b"])
+
+    items = config.get("sync", "excluded_items")
+    items.append("c")
+
+    assert config.get("sync", "excluded_items") == ["a", "b"]
+
+
+def test_flush_interval(tmp_path):
+    config_path = str(tmp_path / "test-state.ini")
+    conf = UserConfig(
+        config_path, defaults=DEFAULTS_CONFIG, version=CONF_VERSION, flush_interval=60
+    )
+    conf.flush()
+
+    for i in range(10):
+        conf.set("auth", "keyring", f"keyring.backends.Backend{i}")
+
+    # Changes are not written before the interval has passed.
+    saved = UserConfig(config_path, defaults=DEFAULTS_CONFIG, version=CONF_VERSION)
+    assert saved.get("auth", "keyring") == "automatic"
+
+    conf.flush()
+
+    saved = UserConfig(config_path, defaults=DEFAULTS_CONFIG, version=CONF_VERSION)
+    assert saved.get("auth", "keyring") == "keyring.backends.Backend9"
+
+    conf.cleanup()
+
+
+def test_save_is_atomic(config, monkeypatch):
+    config.set("auth", "keyring", "keyring.backends.Saved")
+
+    def write(*args, **kwargs):
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(config, "write", write)
+
+    with pytest.raises(OSError):
+        config.set("auth", "keyring", "keyring.backends.New")
+
+    monkeypatch.undo()
+
+    # The previous file is left intact.
+    saved = UserConfig(
+        config.config_path, defaults=DEFAULTS_CONFIG, version=CONF_VERSION
+    )
+    assert saved.get("auth", "keyring") == "keyring.backends.Saved"
+
+    config_dir = osp.dirname(config.config_path)
+    assert not any(name.endswith(".tmp") for name in os.listdir(config_dir))
+
+
+@pytest.mark.benchmark(group="config")
+def test_state_updates_performance(tmp_path, benchmark):
+    """Updates a state value 1,000 times, as during sync of many pages."""
+    conf = UserConfig(
+        str(tmp_path / "test-state.ini"),
+        defaults={"sync": {"cursor": "", "indexing_counter": 0}},
+        flush_interval=5,
+    )
+
+    def update() -> None:
+        for i in range(1000):
+            conf.set("sync", "cursor", f"cursor-{i}")
+            conf.set(
+                "sync", "indexing_counter", conf.get("sync", "indexing_counter") + 1
+            )
+
+    benchmark(update)
+    conf.flush()
+    conf.cleanup()
@@ -1,7 +1,14 @@
+import json
 import logging
+import os
+import re
+import subprocess
+import sys
 
+import click
 from click.testing import CliRunner
 
+from maestral import metrics, tracing
 from maestral.autostart import AutoStart
 from maestral.cli import main
 from maestral.daemon import MaestralProxy, Start, start_maestral_daemon_process
@@ -12,6 +19,17 @@ from maestral.utils.appdirs import get_log_path
 
 TEST_TIMEOUT = 60
 
+# Modules which are slow to import and not needed for most commands.
+HEAVY_MODULES = [
+    "dropbox",
+    "requests",
+    "rich",
+    "watchdog",
+    "maestral.main",
+    "maestral.sync",
+    "maestral.daemon",
+]
+
 
 def test_help() -> None:
     """Test help output without args and with --help arg."""
@@ -27,6 +45,48 @@ def test_help() -> None:
     assert result_no_arg.output == result_help_arg.output
 
 
+def test_help_lists_lazy_commands() -> None:
+    """Test that lazily registered commands are listed and resolved."""
+    runner = CliRunner()
+    result = runner.invoke(main, ["--help"])
+
+    assert result.exit_code == 0, result.output
+
+    for name in main.lazy_commands:
+        assert f"  {name} " in result.output
+        assert main.get_command(click.Context(main), name) is not None
+
+
+def imported_heavy_modules(code: str) -> list[str]:
+    """Runs the given code in a new interpreter and returns the heavy modules which
+    were imported."""
+    imported = f"[m for m in {HEAVY_MODULES!r} if m in sys.modules]"
+    code += f"\nimport json, sys; print(json.dumps({imported}))"
+    out = subprocess.check_output([sys.executable, "-c", code], text=True)
+    return json.loads(out.splitlines()[-1])
+
+
+def test_import_cli_is_lightweight() -> None:
+    """Test that importing the CLI does not import any heavy dependencies."""
+    assert imported_heavy_modules("import maestral.cli") == []
+
+
+def test_status_is_lightweight(config_name: str) -> None:
+    """Test that status commands only import what they need to query the daemon."""
+    res = start_maestral_daemon_process(config_name, timeout=TEST_TIMEOUT)
+    assert res is Start.Ok
+
+    def invoke(*args: str) -> str:
+        cli_args = [*args, "-c", config_name]
+        return (
+            f"from maestral.cli import main; main({cli_args!r}, standalone_mode=False)"
+        )
+
+    # Only the daemon client is loaded to connect and rich to print the status table.
+    assert imported_heavy_modules(invoke("filestatus", "/usr")) == ["maestral.daemon"]
+    assert imported_heavy_modules(invoke("status")) == ["rich", "maestral.daemon"]
+
+
 def test_invalid_config() -> None:
     """Test failure of commands that require an existing config file"""
 
@@ -205,6 +265,27 @@ def test_notify_snooze(config_name: str) -> None:
     assert m.notification_snooze == 0
 
 
+def test_debug_profile(config_name: str) -> None:
+    start_maestral_daemon_process(config_name, timeout=TEST_TIMEOUT)
+
+    runner = CliRunner()
+    result = runner.invoke(
+        main, ["debug", "profile", "-m", "memory", "-d", "0.5", "-c", config_name]
+    )
+
+    assert result.exit_code == 0, result.output
+
+    match = re.search("Saved profile to '(.+)'", result.output)
+
+    assert match
+    assert match.group(1).startswith(get_log_path("maestral", config_name))
+
+    with open(match.group(1)) as f:
+        assert "Largest allocations" in f.read()
+
+    os.remove(match.group(1))
+
+
 def test_log_level(m: Maestral) -> None:
     runner = CliRunner()
     result = runner.invoke(main, ["log", "level", "-c", m.config_name])
@@ -223,10 +304,44 @@ def test_log_level(m: Maestral) -> None:
     assert isinstance(result.exception, SystemExit)
 
 
+def flush_log(logger: logging.Logger) -> None:
+    # Wait until queued records have been written.
+    for handler in logger.handlers:
+        handler.flush()
+
+
+def test_log_format(m: Maestral) -> None:
+    runner = CliRunner()
+    logger = scoped_logger("maestral", m.config_name)
+    logfile = get_log_path("maestral", f"{m.config_name}.log")
+
+    result = runner.invoke(main, ["log", "format", "-c", m.config_name])
+
+    assert result.exit_code == 0, result.output
+    assert "text" in result.output
+
+    result = runner.invoke(main, ["log", "format", "json", "-c", m.config_name])
+
+    assert result.exit_code == 0, result.output
+    assert m.log_format == "json"
+
+    logger.info("Hello from pytest!")
+    flush_log(logger)
+
+    with open(logfile) as f:
+        last_line = f.read().splitlines()[-1]
+
+    assert json.loads(last_line)["message"] == "Hello from pytest!"
+
+    result = runner.invoke(main, ["log", "format", "xml", "-c", m.config_name])
+    assert result.exit_code == 2
+
+
 def test_log_show(m: Maestral) -> None:
     # log a message
     logger = scoped_logger("maestral", m.config_name)
     logger.info("Hello from pytest!")
+    flush_log(logger)
     runner = CliRunner()
     result = runner.invoke(main, ["log", "show", "-c", m.config_name])
 
@@ -238,6 +353,7 @@ def test_log_clear(m: Maestral) -> None:
     # log a message
     logger = scoped_logger("maestral", m.config_name)
     logger.info("Hello from pytest!")
+    flush_log(logger)
     runner = CliRunner()
     result = runner.invoke(main, ["log", "show", "-c", m.config_name])
 
@@ -247,6 +363,7 @@ def test_log_clear(m: Maestral) -> None:
     # Stop connection helper to prevent spurious log messages.
     m.manager._connection_helper_running = False
     m.manager.connection_helper.join()
+    flush_log(logger)
 
     # clear the logs
     result = runner.invoke(main, ["log", "clear", "-c", m.config_name])
@@ -257,3 +374,62 @@ def test_log_clear(m: Maestral) -> None:
         log_content = f.read()
 
     assert log_content == ""
+
+
+def test_metrics(m: Maestral) -> None:
+    runner = CliRunner()
+
+    try:
+        result = runner.invoke(main, ["metrics", "-c", m.config_name])
+        assert result.exit_code == 0, result.output
+        assert "disabled" in result.output
+
+        result = runner.invoke(main, ["metrics", "--enable", "-c", m.config_name])
+        assert result.exit_code == 0, result.output
+        assert m.get_conf("app", "metrics_enabled")
+
+        m.sync.get_index()
+
+        result = runner.invoke(main, ["metrics", "-c", m.config_name])
+        assert result.exit_code == 0, result.output
+        assert "statement=SELECT" in result.output
+        assert "maestral_fs_event_queue_size" in result.output
+
+        result = runner.invoke(main, ["metrics", "--prometheus", "-c", m.config_name])
+        assert result.exit_code == 0, result.output
+        assert "# TYPE maestral_db_query_duration_seconds histogram" in result.output
+    finally:
+        m.metrics_enabled = False
+        metrics.registry.reset()
+
+
+def test_trace(m: Maestral, tmp_path) -> None:
+    runner = CliRunner()
+    path = str(tmp_path / "trace.json")
+
+    try:
+        result = runner.invoke(main, ["trace", "sample-rate", "-c", m.config_name])
+        assert result.exit_code == 0, result.output
+        assert "0.0" in result.output
+
+        result = runner.invoke(main, ["trace", "sample-rate", "1", "-c", m.config_name])
+        assert result.exit_code == 0, result.output
+        assert m.get_conf("app", "trace_sample_rate") == 1.0
+
+        result = runner.invoke(main, ["trace", "sample-rate", "2", "-c", m.config_name])
+        assert result.exit_code == 2
+
+        with tracing.tracer.span("test"):
+            m.sync.get_index()
+
+        result = runner.invoke(main, ["trace", "export", path, "-c", m.config_name])
+        assert result.exit_code == 0, result.output
+
+        with open(path) as f:
+            trace = json.load(f)
+
+        names = {e["name"] for e in trace["traceEvents"] if e["ph"] == "X"}
+        assert names == {"test", "database_access"}
+    finally:
+        m.trace_sample_rate = 0.0
+        tracing.tracer.clear()
@@ -1,14 +1,30 @@
+import socket
+import threading
+import time
 from datetime import datetime, timezone
 from unittest.mock import Mock
 
 import pytest
 import requests
-from dropbox import common, files, sharing, team_common, users, users_common
+from dropbox import (
+    auth,
+    common,
+    exceptions,
+    files,
+    sharing,
+    team_common,
+    users,
+    users_common,
+)
 from dropbox.oauth import DropboxOAuth2FlowNoRedirect
+from dropbox.session import API_CONTENT_HOST, API_HOST
 
 from maestral import core
 from maestral.client import (
     DropboxClient,
+    RequestScheduler,
+    _HTTPSConnection,
+    classify_route,
     convert_account,
     convert_full_account,
     convert_metadata,
@@ -90,6 +106,175 @@ def test_unlink_error():
         client.unlink()
 
 
+# ==== RequestScheduler tests ==========================================================
+
+
+def run_concurrently(scheduler: RequestScheduler, route: str, n: int) -> int:
+    """Sends n requests from separate threads and returns the maximum number of
+    concurrent requests."""
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def request() -> None:
+        nonlocal active, max_active
+
+        with scheduler.request(route):
+            with lock:
+                active += 1
+                max_active = max(active, max_active)
+
+            time.sleep(0.05)
+
+            with lock:
+                active -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(n)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return max_active
+
+
+def test_classify_route():
+    assert classify_route("files/get_metadata") == "metadata"
+    assert classify_route("files/delete_batch/check") == "metadata"
+    assert classify_route("files/delete_v2") == "write"
+    assert classify_route("files/upload") == "write"
+    assert classify_route("files/download") == "transfer"
+    assert classify_route("files/list_folder/longpoll") == "longpoll"
+
+
+def test_scheduler_concurrency():
+    scheduler = RequestScheduler({"write": (2, 0.0)})
+
+    assert run_concurrently(scheduler, "files/move_v2", 4) == 2
+    assert scheduler.throttled_time["write"] > 0
+    assert scheduler.throttled_time["metadata"] == 0
+
+
+def test_scheduler_rate():
+    scheduler = RequestScheduler({"metadata": (10, 50.0)})
+
+    t0 = time.monotonic()
+
+    # A burst of 50 requests is allowed, the next 10 require 0.2 sec.
+    for _ in range(60):
+        with scheduler.request("files/get_metadata"):
+            pass
+
+    assert time.monotonic() - t0 >= 0.15
+    assert scheduler.throttled_time["metadata"] > 0
+
+
+def test_scheduler_retry_after():
+    scheduler = RequestScheduler(max_jitter=0.1)
+
+    with pytest.raises(exceptions.RateLimitError):
+        with scheduler.request("files/get_metadata"):
+            raise exceptions.RateLimitError("request-id", None, 0.2)
+
+    assert scheduler.backoff_remaining > 0
+
+    # Longpolls are not delayed.
+    t0 = time.monotonic()
+
+    with scheduler.request("files/list_folder/longpoll"):
+        pass
+
+    assert time.monotonic() - t0 < 0.1
+
+    # Other requests wait for the retry-after.
+    with scheduler.request("files/download"):
+        pass
+
+    assert time.monotonic() - t0 >= 0.15
+    assert scheduler.backoff_remaining == 0
+
+
+def test_scheduler_serializes_contended_writes():
+    scheduler = RequestScheduler({"write": (4, 0.0)})
+    error = auth.RateLimitError(
+        reason=auth.RateLimitReason.too_many_write_operations, retry_after=0
+    )
+
+    with pytest.raises(exceptions.RateLimitError):
+        with scheduler.request("files/upload"):
+            raise exceptions.RateLimitError("request-id", error, 0)
+
+    assert run_concurrently(scheduler, "files/delete_v2", 3) == 1
+    assert run_concurrently(scheduler, "files/get_metadata", 3) == 3
+
+
+def test_connection_pool_size():
+    client = DropboxClient(
+        "test-config",
+        Mock(spec_set=CredentialStorage),
+        max_parallel_uploads=2,
+        max_parallel_downloads=3,
+    )
+    adapter = client._session.get_adapter("https://")
+    pool = adapter.poolmanager.connection_from_host(API_HOST, 443, "https")
+
+    # Concurrent requests and streamed downloads each hold a connection.
+    assert client.scheduler._states["transfer"].max_concurrent == 5
+    assert pool.pool.maxsize == client.scheduler.max_concurrent + 3
+
+
+def test_close_idle_connections():
+    client = DropboxClient("test-config", Mock(spec_set=CredentialStorage))
+    adapter = client._session.get_adapter("https://")
+    pool = adapter.poolmanager.connection_from_host(API_HOST, 443, "https")
+
+    sockets = []
+
+    def connected() -> _HTTPSConnection:
+        sock, peer = socket.socketpair()
+        sockets.extend([sock, peer])
+        conn = pool._get_conn()
+        conn.sock = sock
+        return conn
+
+    idle = connected()
+    active = connected()
+
+    try:
+        pool._put_conn(idle)
+        pool._put_conn(active)
+        idle.last_used -= 2 * pool.idle_timeout
+
+        assert client.close_idle_connections() == 1
+        assert idle.sock is None
+        assert active.sock is not None
+
+        # Connections which became idle are not reused.
+        active.last_used -= 2 * pool.idle_timeout
+        conn = pool._get_conn()
+
+        assert conn is active
+        assert conn.sock is None
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def test_warm_up_connections():
+    client = DropboxClient("test-config", Mock(spec_set=CredentialStorage))
+    client._session = Mock(spec_set=requests.Session)
+    client._session.head.side_effect = requests.ConnectionError()
+
+    client.warm_up_connections(n_connections=2)
+
+    urls = [c.args[0] for c in client._session.head.call_args_list]
+    assert sorted(urls) == 2 * [f"https://{API_HOST}/"] + 2 * [
+        f"https://{API_CONTENT_HOST}/"
+    ]
+
+
 # ==== type conversion tests ===========================================================
 
 
@@ -4,21 +4,28 @@ import sys
 import threading
 import time
 import uuid
+from datetime import datetime, timezone
 
 import pytest
 from Pyro5.api import Proxy
+from Pyro5.serializers import serializers
 
+from maestral.core import FileMetadata, TeamRootInfo
 from maestral.daemon import (
+    SERIALIZER,
+    URI,
     CommunicationError,
     Lock,
     MaestralProxy,
     Start,
     Stop,
+    sockpath_for_config,
     start_maestral_daemon_process,
     stop_maestral_daemon_process,
 )
 from maestral.exceptions import NotLinkedError
 from maestral.main import Maestral
+from maestral.models import ChangeType, ItemType, SyncDirection, SyncEvent, SyncStatus
 
 # locking tests
 
@@ -200,3 +207,135 @@ def test_remote_exceptions(config_name: str) -> None:
 
     # stop daemon
     stop_maestral_daemon_process(config_name)
+
+
+def test_batch(config_name: str) -> None:
+    # start daemon process
+    start_maestral_daemon_process(config_name, timeout=20)
+
+    with MaestralProxy(config_name) as m:
+        batch = m.batch()
+        batch.get_conf("sync", "upload")
+        batch.get_state("account", "email")
+        batch.get_account_info()
+
+        results = batch()
+
+        assert next(results) is True
+        assert next(results) == ""
+
+        with pytest.raises(NotLinkedError):
+            next(results)
+
+    # stop daemon
+    stop_maestral_daemon_process(config_name)
+
+
+def test_batch_fallback(config_name: str) -> None:
+    with MaestralProxy(config_name, fallback=True) as m:
+        batch = m.batch()
+        batch.get_conf("sync", "upload")
+        batch.get_state("account", "email")
+
+        assert list(batch()) == [True, ""]
+
+
+# serialization tests
+
+
+def _sync_events(n: int) -> list[SyncEvent]:
+    return [
+        SyncEvent(
+            dbx_path=f"/folder/file_{i}.txt",
+            dbx_path_lower=f"/folder/file_{i}.txt",
+            local_path=f"/Users/user/Dropbox/folder/file_{i}.txt",
+            direction=SyncDirection.Down,
+            status=SyncStatus.Syncing,
+            change_type=ChangeType.Added,
+            item_type=ItemType.File,
+            size=1000,
+            completed=500,
+            sync_time=1700000000.0,
+            rev="015f9d3f5e0e4e0000000020a5a6ef0",
+            content_hash="e3b0c44298fc1c149afbf4c8996fb924",
+        )
+        for i in range(n)
+    ]
+
+
+def test_serialization_roundtrip() -> None:
+    serializer = serializers[SERIALIZER]
+
+    event = _sync_events(1)[0]
+    now = datetime.now(timezone.utc)
+    metadata = FileMetadata(
+        "file.txt",
+        "/file.txt",
+        "/file.txt",
+        "id:123",
+        now,
+        now,
+        "rev",
+        10,
+        None,
+        False,
+        None,
+        True,
+        "hash",
+    )
+    root_info = TeamRootInfo("1", "2", "/home")
+
+    data = [event, metadata, root_info, {1, 2}, NotLinkedError("title", "message")]
+    res = serializer.loads(serializer.dumps(data))
+
+    assert res[0].dbx_path == event.dbx_path
+    assert res[0].status is SyncStatus.Syncing
+    assert res[0].sync_time == event.sync_time
+    assert res[1] == metadata
+    assert res[2] == root_info
+    assert res[3] == {1, 2}
+    assert isinstance(res[4], NotLinkedError)
+    assert res[4].title == "title"
+
+
+@pytest.mark.benchmark(
+    group="ipc-serialization",
+    min_time=0.1,
+    max_time=5,
+)
+@pytest.mark.parametrize("serializer_name", ["serpent", SERIALIZER])
+def test_serialization_performance(serializer_name: str, benchmark) -> None:
+    serializer = serializers[serializer_name]
+    events = _sync_events(2000)
+
+    def roundtrip():
+        return serializer.loads(serializer.dumps(events))
+
+    res = benchmark(roundtrip)
+    assert len(res) == 2000
+
+    size = len(serializer.dumps(events))
+    benchmark.extra_info["payload_bytes"] = size
+    if benchmark.stats:
+        mean = benchmark.stats.stats.mean
+        benchmark.extra_info["MB/s"] = round(size / mean / 1e6, 1)
+
+
+@pytest.mark.benchmark(
+    group="ipc-calls",
+    min_time=0.1,
+    max_time=2,
+)
+@pytest.mark.parametrize("serializer_name", ["serpent", SERIALIZER])
+def test_call_performance(config_name: str, serializer_name: str, benchmark) -> None:
+    start_maestral_daemon_process(config_name, timeout=20)
+
+    sock_name = sockpath_for_config(config_name)
+
+    with Proxy(URI.format(config_name, "./u:" + sock_name)) as proxy:
+        proxy._pyroSerializer = serializer_name
+        res = benchmark(proxy.get_conf, "sync", "upload")
+
+    assert res is True
+
+    stop_maestral_daemon_process(config_name)
@@ -0,0 +1,78 @@
+import json
+import logging
+import threading
+
+from maestral.logging import JsonFormatter, QueueingHandler
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, level: int = logging.NOTSET) -> None:
+        super().__init__(level)
+        self.records: list[logging.LogRecord] = []
+        self.threads: set[str] = set()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+        self.threads.add(threading.current_thread().name)
+
+
+def test_queueing_handler() -> None:
+    target = ListHandler(logging.INFO)
+    handler = QueueingHandler([target])
+    logger = logging.getLogger("test_queueing_handler")
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+
+    try:
+        items = ["a"]
+        logger.debug("Not handled")
+        logger.info("Items: %s", items)
+
+        # Arguments are formatted when logging.
+        items.append("b")
+
+        try:
+            raise ValueError("error")
+        except ValueError:
+            logger.exception("Failed")
+
+        handler.flush()
+
+        assert [r.getMessage() for r in target.records] == ["Items: ['a']", "Failed"]
+        assert "ValueError: error" in (target.records[1].exc_text or "")
+        assert threading.current_thread().name not in target.threads
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+    # Closing twice and flushing after closing does nothing.
+    handler.close()
+    handler.flush()
+
+
+def test_json_formatter() -> None:
+    formatter = JsonFormatter()
+    logger = logging.getLogger("test_json_formatter")
+
+    try:
+        raise ValueError("error")
+    except ValueError as exc:
+        record = logger.makeRecord(
+            logger.name,
+            logging.ERROR,
+            __file__,
+            1,
+            "Failed\nat %s",
+            ("/path",),
+            (type(exc), exc, exc.__traceback__),
+        )
+
+    line = formatter.format(record)
+    data = json.loads(line)
+
+    assert "\n" not in line
+    assert data["level"] == "ERROR"
+    assert data["logger"] == "test_json_formatter"
+    assert data["message"] == "Failed\nat /path"
+    assert "ValueError: error" in data["exc_info"]
+    assert data["time"].endswith("+00:00")
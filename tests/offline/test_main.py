@@ -1,10 +1,15 @@
+import os
+import os.path as osp
+
 import pytest
 import requests
 
 import maestral.main
+from maestral import metrics, tracing
 from maestral.constants import GITHUB_RELEASES_API
-from maestral.exceptions import NotLinkedError
+from maestral.exceptions import BusyError, NotLinkedError
 from maestral.main import Maestral
+from maestral.utils.appdirs import get_log_path
 
 
 def test_check_for_updates(m: Maestral) -> None:
@@ -47,3 +52,99 @@ def test_check_for_updates(m: Maestral) -> None:
 def test_not_linked_error(m: Maestral) -> None:
     with pytest.raises(NotLinkedError):
         m.get_metadata("/test")
+
+
+def test_get_metrics(m: Maestral, tmp_path) -> None:
+    textfile = str(tmp_path / "maestral.prom")
+    m.set_conf("app", "metrics_textfile", textfile)
+
+    try:
+        m.metrics_enabled = True
+        assert metrics.registry.enabled
+
+        m.sync.get_index()
+        families = {family["name"]: family for family in m.get_metrics()}
+
+        samples = families["maestral_db_query_duration_seconds"]["samples"]
+        select_count = [
+            s
+            for s in samples
+            if s["name"] == "maestral_db_query_duration_seconds_count"
+            and s["labels"] == {"statement": "SELECT"}
+        ]
+        assert select_count[0]["value"] > 0
+        fs_event_queue_size = {
+            s["labels"]["config"]: s["value"]
+            for s in families["maestral_fs_event_queue_size"]["samples"]
+        }
+        assert fs_event_queue_size[m.config_name] == 0
+
+        # Metrics are written to the textfile a last time when disabled.
+        m.metrics_enabled = False
+        assert not metrics.registry.enabled
+
+        with open(textfile) as f:
+            assert "maestral_db_query_duration_seconds_count" in f.read()
+    finally:
+        m.metrics_enabled = False
+        metrics.registry.reset()
+
+
+def test_shutdown_unregisters_metrics(m: Maestral) -> None:
+    gauge = metrics.registry.get("maestral_download_queue_size")
+    assert {"config": m.config_name} in [s["labels"] for s in gauge.samples()]
+
+    m.shutdown_daemon()
+    assert {"config": m.config_name} not in [s["labels"] for s in gauge.samples()]
+
+
+def test_get_trace(m: Maestral, tmp_path) -> None:
+    local_path = str(tmp_path / "file.txt")
+
+    with open(local_path, "w") as f:
+        f.write("content")
+
+    try:
+        m.trace_sample_rate = 1.0
+        assert tracing.tracer.sample_rate == 1.0
+
+        with tracing.tracer.span("test"):
+            m.sync.get_local_hash(local_path)
+
+        trace = m.get_trace(clear=True)
+        spans = {e["name"]: e for e in trace["traceEvents"] if e["ph"] == "X"}
+
+        assert spans.keys() == {"test", "content_hash", "database_access"}
+        assert spans["content_hash"]["dur"] <= spans["test"]["dur"]
+        assert spans["database_access"]["cat"] == "db"
+        assert len(tracing.tracer) == 0
+
+        # Spans are not recorded outside a trace or when tracing is disabled.
+        m.sync.get_local_hash(local_path)
+        m.trace_sample_rate = 0.0
+
+        with tracing.tracer.span("test"):
+            m.sync.get_local_hash(local_path)
+
+        assert len(tracing.tracer) == 0
+    finally:
+        m.trace_sample_rate = 0.0
+        tracing.tracer.clear()
+
+
+def test_profiling(m: Maestral) -> None:
+    assert m.stop_profiling() is None
+
+    path = m.start_profiling("sample", duration=10)
+
+    try:
+        assert osp.dirname(path) == get_log_path("maestral")
+        assert path.endswith(".folded")
+
+        with pytest.raises(BusyError):
+            m.start_profiling("memory")
+    finally:
+        assert m.stop_profiling() == path
+
+    assert osp.isfile(path)
+    os.remove(path)
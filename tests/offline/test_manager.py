@@ -1,4 +1,6 @@
 import os
+import threading
+from queue import Empty
 from unittest import mock
 
 import pytest
@@ -6,6 +8,8 @@ import pytest
 from maestral.core import AccountType, FullAccount, TeamRootInfo, UserRootInfo
 from maestral.exceptions import NoDropboxDirError
 from maestral.main import Maestral
+from maestral.manager import DownloadQueue
+from maestral.sync import SyncEngine
 from maestral.utils.appdirs import get_home_dir
 from maestral.utils.path import delete, generate_cc_name
 
@@ -276,3 +280,90 @@ def test_migrate_path_root_error(m: Maestral) -> None:
 
     with pytest.raises(NoDropboxDirError):
         m.manager.check_and_update_path_root()
+
+
+def test_download_queue(sync: SyncEngine) -> None:
+    queue = DownloadQueue(sync)
+    queue.put_batch(["/a", "/b", "/a/c"])
+
+    assert queue.qsize() == 2
+    assert "/a" in queue
+    assert "/a/c" not in queue
+
+    items = queue.get_batch(2)
+    assert set(items) == {"/a", "/b"}
+    assert queue.qsize() == 0
+
+    with pytest.raises(Empty):
+        queue.get(block=False)
+
+    with pytest.raises(Empty):
+        queue.get(timeout=0.01)
+
+    # Items in progress remain persisted until done.
+    assert DownloadQueue(sync).qsize() == 2
+
+    # Items which are put back can be retrieved again.
+    queue.put("/b")
+    assert queue.get() == "/b"
+
+    queue.task_done_batch(items)
+    assert "/a" not in queue
+    assert sync.queued_downloads_count() == 0
+
+
+def test_download_queue_parent_in_progress(sync: SyncEngine) -> None:
+    queue = DownloadQueue(sync)
+    queue.put("/a")
+    assert queue.get() == "/a"
+
+    # A parent which is being downloaded may already have walked past the child.
+    queue.put("/a/b")
+    assert queue.get(block=False) == "/a/b"
+
+    queue.task_done_batch(["/a", "/a/b"])
+    assert sync.queued_downloads_count() == 0
+
+
+def test_download_queue_task(sync: SyncEngine) -> None:
+    queue = DownloadQueue(sync)
+    queue.put_batch(["/a", "/b"])
+
+    item = queue.get()
+
+    with queue.task(item):
+        pass
+
+    assert item not in queue
+
+    # Items are put back if processing fails.
+    item = queue.get()
+
+    with pytest.raises(RuntimeError):
+        with queue.task(item):
+            raise RuntimeError()
+
+    assert queue.get(block=False) == item
+
+    # The failed item no longer covers its children.
+    queue.put(f"{item}/c")
+    assert queue.get(block=False) == f"{item}/c"
+
+
+def test_download_queue_blocking(sync: SyncEngine) -> None:
+    queue = DownloadQueue(sync)
+    results = []
+
+    def worker() -> None:
+        item = queue.get(timeout=10)
+        results.append(item)
+        queue.task_done(item)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+
+    queue.put("/folder")
+    queue.join()
+    thread.join()
+
+    assert results == ["/folder"]
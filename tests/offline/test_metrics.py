@@ -0,0 +1,165 @@
+import gc
+import os.path as osp
+import time
+from queue import Queue
+
+import pytest
+
+from maestral.metrics import MetricsRegistry, TextfileExporter, to_prometheus_text
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry(enabled=True)
+
+
+def test_counter(registry: MetricsRegistry) -> None:
+    counter = registry.counter("test_bytes_total", "Bytes.", ("direction",))
+
+    counter.inc(10, "up")
+    counter.inc(5, "up")
+    counter.inc(1, "down")
+
+    assert counter.get("up") == 15
+    assert counter.get("down") == 1
+
+    with pytest.raises(ValueError):
+        counter.inc(-1, "up")
+
+    with pytest.raises(ValueError):
+        counter.inc(1)
+
+
+def test_gauge(registry: MetricsRegistry) -> None:
+    gauge = registry.gauge("test_size", "Size.")
+
+    gauge.set(3)
+    gauge.inc()
+    gauge.dec(2)
+    assert gauge.get() == 2
+
+    gauge.set_function(lambda: 42)
+    assert gauge.get() == 42
+    assert registry.collect()[0]["samples"][0]["value"] == 42
+
+
+def test_gauge_function_references(registry: MetricsRegistry) -> None:
+    gauge = registry.gauge("test_size", "Size.", ("config",))
+    queue = Queue()
+    queue.put(1)
+
+    gauge.set_function(queue.qsize, "a")
+    gauge.set_function(lambda: 2, "b")
+    assert gauge.get("a") == 1
+    assert gauge.get("b") == 2
+
+    # Bound methods do not keep their instance alive.
+    del queue
+    gc.collect()
+    assert gauge.get("a") == 0
+    assert [s["labels"] for s in gauge.samples()] == [{"config": "b"}]
+
+    gauge.remove("b")
+    assert gauge.samples() == []
+
+
+def test_histogram(registry: MetricsRegistry) -> None:
+    histogram = registry.histogram("test_seconds", "Time.", buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.get_count() == 4
+    assert histogram.get_sum() == pytest.approx(2.65)
+
+    samples = {
+        (s["name"], s["labels"].get("le")): s["value"]
+        for s in registry.collect()[0]["samples"]
+    }
+
+    # Buckets are cumulative and include their upper bound.
+    assert samples[("test_seconds_bucket", "0.1")] == 2
+    assert samples[("test_seconds_bucket", "1.0")] == 3
+    assert samples[("test_seconds_bucket", "+Inf")] == 4
+    assert samples[("test_seconds_count", None)] == 4
+
+    with histogram.time():
+        time.sleep(0.01)
+
+    assert histogram.get_count() == 5
+
+
+def test_disabled(registry: MetricsRegistry) -> None:
+    counter = registry.counter("test_total", "Count.")
+    histogram = registry.histogram("test_seconds", "Time.")
+
+    registry.enabled = False
+
+    counter.inc()
+    histogram.observe(1.0)
+
+    with histogram.time():
+        pass
+
+    assert counter.get() == 0
+    assert histogram.get_count() == 0
+
+
+def test_register_existing(registry: MetricsRegistry) -> None:
+    counter = registry.counter("test_total", "Count.")
+
+    assert registry.counter("test_total", "Count.") is counter
+
+    with pytest.raises(ValueError):
+        registry.gauge("test_total", "Count.")
+
+
+def test_prometheus_text(registry: MetricsRegistry) -> None:
+    counter = registry.counter("test_total", "Number of\ntests.", ("path",))
+    counter.inc(2, '/a "b"')
+    registry.histogram("test_seconds", "Time.", buckets=(1.0,)).observe(0.5)
+
+    text = to_prometheus_text(registry.collect())
+
+    assert text == (
+        "# HELP test_seconds Time.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="1.0"} 1.0\n'
+        'test_seconds_bucket{le="+Inf"} 1.0\n'
+        "test_seconds_sum 0.5\n"
+        "test_seconds_count 1.0\n"
+        "# HELP test_total Number of\\ntests.\n"
+        "# TYPE test_total counter\n"
+        'test_total{path="/a \\"b\\""} 2.0\n'
+    )
+
+
+def test_textfile_exporter(registry: MetricsRegistry, tmp_path) -> None:
+    registry.counter("test_total", "Count.").inc()
+    path = osp.join(tmp_path, "maestral.prom")
+
+    exporter = TextfileExporter(path, interval=60, metrics_registry=registry)
+    exporter.start()
+    exporter.stop()
+
+    with open(path) as f:
+        assert f.read() == to_prometheus_text(registry.collect())
+
+    assert not osp.exists(f"{path}.tmp")
+
+
+@pytest.mark.benchmark(group="metrics")
+def test_disabled_overhead(benchmark) -> None:
+    """Measures 1M updates of a histogram while metrics collection is disabled."""
+    registry = MetricsRegistry(enabled=False)
+    histogram = registry.histogram("test_seconds", "Time.", ("label",))
+
+    def observe() -> None:
+        for _ in range(1_000_000):
+            histogram.observe(1.0, "label")
+
+    benchmark.pedantic(observe, rounds=1, iterations=1)
+
+    if benchmark.stats:
+        # Less than 1 µs per update.
+        assert benchmark.stats.stats.mean < 1.0
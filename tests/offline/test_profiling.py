@@ -0,0 +1,110 @@
+import os.path as osp
+import pstats
+import threading
+import time
+
+import pytest
+
+from maestral.profiling import (
+    CProfiler,
+    MemoryProfiler,
+    StackSampler,
+    create_profiler,
+)
+
+
+def busy_work(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def test_cprofile(tmp_path) -> None:
+    path = str(tmp_path / "profile.prof")
+    profiler = CProfiler(path)
+    stop = threading.Event()
+
+    profiler.start()
+
+    # Threads started while profiling are recorded.
+    thread = threading.Thread(target=busy_work, args=(stop,))
+    thread.start()
+    time.sleep(0.1)
+    stop.set()
+    thread.join()
+
+    profiler.stop()
+
+    stats = pstats.Stats(path)
+    functions = {func_name for _, _, func_name in stats.stats}
+
+    assert "busy_work" in functions
+    assert not profiler.running
+
+
+def test_stack_sampler(tmp_path) -> None:
+    path = str(tmp_path / "profile.folded")
+    profiler = StackSampler(path, interval=0.001)
+    stop = threading.Event()
+
+    # Threads which are already running are sampled.
+    thread = threading.Thread(target=busy_work, args=(stop,), name="worker")
+    thread.start()
+
+    profiler.start()
+    time.sleep(0.1)
+    profiler.stop()
+
+    stop.set()
+    thread.join()
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    assert profiler.n_samples > 0
+    assert any(line.startswith("worker;") and "busy_work" in line for line in lines)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) >= profiler.n_samples
+
+
+def test_memory_profiler(tmp_path) -> None:
+    path = str(tmp_path / "profile.txt")
+    profiler = MemoryProfiler(path)
+
+    profiler.start()
+    data = [bytearray(1024) for _ in range(1000)]
+    profiler.stop()
+
+    with open(path) as f:
+        report = f.read()
+
+    assert "test_profiling.py" in report
+    assert len(data) == 1000
+
+
+def test_duration(tmp_path) -> None:
+    path = str(tmp_path / "profile.folded")
+    profiler = StackSampler(path)
+
+    profiler.start(duration=0.1)
+    assert profiler.running
+
+    time.sleep(0.5)
+
+    assert not profiler.running
+    assert osp.isfile(path)
+
+    # Stopping again does nothing.
+    profiler.stop()
+
+    with pytest.raises(RuntimeError):
+        profiler.start()
+
+
+def test_create_profiler(tmp_path) -> None:
+    path = str(tmp_path / "profile")
+
+    assert create_profiler("cprofile", path).path == path + ".prof"
+    assert isinstance(create_profiler("sample", path), StackSampler)
+    assert isinstance(create_profiler("memory", path), MemoryProfiler)
+
+    with pytest.raises(ValueError):
+        create_profiler("invalid", path)
@@ -1,8 +1,42 @@
+import os
+import os.path as osp
+import re
+import threading
+import time
+import tracemalloc
 from datetime import datetime
+from itertools import islice
 from queue import Queue
-
-from maestral.models import ChangeType, ItemType, SyncDirection, SyncEvent, SyncStatus
-from maestral.sync import ActivityNode, ActivityTree
+from types import SimpleNamespace
+
+import pytest
+from hypothesis import HealthCheck, given, settings
+from hypothesis import strategies as st
+from watchdog.events import DirDeletedEvent, FileDeletedEvent
+
+from maestral.constants import EXCLUDED_DIR_NAMES, EXCLUDED_FILE_NAMES
+from maestral.core import (
+    DeletedMetadata,
+    FileMetadata,
+    FolderMetadata,
+    ListFolderResult,
+    Metadata,
+)
+from maestral.database.orm import Model
+from maestral.models import (
+    ActivityChange,
+    ChangeType,
+    DbxPathColumn,
+    IndexEntry,
+    ItemType,
+    LocalPathColumn,
+    SyncDirection,
+    SyncEvent,
+    SyncStatus,
+)
+from maestral.sync import ActivityNode, ActivityTree, SyncEngine, is_deleted
+from maestral.utils import removeprefix
+from maestral.utils.path import is_equal_or_child, normalize
 
 EVENT1 = SyncEvent(
     dbx_path="/d0/file1.txt",
@@ -107,6 +141,151 @@ def test_activity_tree_failed_replaced() -> None:
     assert_tree_integrity(tree)
 
 
+def test_activity_tree_counters() -> None:
+    tree = ActivityTree()
+    tree.add(EVENT1)
+    tree.add(EVENT2_FAILED)
+
+    node = tree.get_node("/d0")
+    assert node.num_events == 2
+    assert node.num_uploading == 1
+    assert node.num_failed == 1
+    assert node.size == 20
+
+    assert tree.get_node(EVENT1.dbx_path).events == {EVENT1}
+
+    tree.remove(EVENT1)
+
+    assert node.num_events == 1
+    assert node.num_uploading == 0
+    assert tree.num_failed == 1
+
+    assert_tree_integrity(tree)
+
+
+def test_activity_tree_update() -> None:
+    event = SyncEvent(
+        dbx_path="/d1/file.txt",
+        direction=SyncDirection.Down,
+        status=SyncStatus.Queued,
+        local_path="/d1/file.txt",
+        dbx_path_lower="/d1/file.txt",
+        change_type=ChangeType.Added,
+        completed=0,
+        size=10,
+        item_type=ItemType.File,
+        sync_time=datetime.today(),
+    )
+
+    tree = ActivityTree()
+    tree.add(event)
+
+    assert tree.num_queued == 1
+    assert tree.num_downloading == 0
+
+    event.status = SyncStatus.Syncing
+    event.completed = 5
+    tree.update(event)
+
+    assert tree.num_queued == 0
+    assert tree.get_node("/d1").num_downloading == 1
+    assert tree.get_node("/d1").completed == 5
+
+    event.status = SyncStatus.Failed
+    tree.update(event)
+
+    assert tree.num_downloading == 0
+    assert tree.num_failed == 1
+
+    assert_tree_integrity(tree)
+
+
+def test_activity_tree_get_events() -> None:
+    tree = ActivityTree()
+    tree.add(EVENT1)
+    tree.add(EVENT2)
+
+    assert tree.get_events() == [EVENT1, EVENT2]
+    assert tree.get_events(limit=1) == [EVENT1]
+
+
+def test_activity_subscription() -> None:
+    tree = ActivityTree()
+    tree.add(EVENT1)
+
+    subscription = tree.subscribe(max_rate=100)
+
+    updates = subscription.get_updates(timeout=0)
+    assert [(u.change, u.dbx_path) for u in updates] == [
+        (ActivityChange.Added, EVENT1.dbx_path)
+    ]
+
+    # Events which are added and removed between polls are never reported.
+    tree.add(EVENT2)
+    tree.remove(EVENT2)
+    tree.remove(EVENT1)
+
+    updates = subscription.get_updates(timeout=0)
+    assert [(u.change, u.dbx_path) for u in updates] == [
+        (ActivityChange.Removed, EVENT1.dbx_path)
+    ]
+
+    tree.unsubscribe(subscription)
+    tree.add(EVENT1)
+
+    assert subscription.get_updates(timeout=0) == []
+
+
+def test_activity_subscription_expires() -> None:
+    tree = ActivityTree()
+    subscription = tree.subscribe(max_rate=100, expire_after=0.1)
+
+    tree.add(EVENT1)
+    assert not subscription.expired
+
+    time.sleep(0.2)
+
+    # Expired subscriptions are dropped on the next change and stop collecting.
+    assert subscription.expired
+    tree.add(EVENT2)
+
+    assert subscription.get_updates(timeout=0) == []
+
+
+def test_activity_subscription_progress() -> None:
+    event = SyncEvent(
+        dbx_path="/file.txt",
+        direction=SyncDirection.Down,
+        status=SyncStatus.Syncing,
+        local_path="/file.txt",
+        dbx_path_lower="/file.txt",
+        change_type=ChangeType.Added,
+        completed=0,
+        size=10,
+        item_type=ItemType.File,
+        sync_time=datetime.today(),
+    )
+
+    tree = ActivityTree()
+    tree.add(event)
+
+    subscription = tree.subscribe(max_rate=100)
+    subscription.get_updates(timeout=0)
+
+    # Progress changes are sampled and coalesced.
+    event.completed = 5
+    event.completed = 8
+
+    updates = subscription.get_updates(timeout=0)
+    assert len(updates) == 1
+    assert updates[0].change is ActivityChange.Updated
+    assert updates[0].completed == 8
+
+    assert subscription.get_updates(timeout=0) == []
+
+    tree.remove(event)
+
+
 def assert_in_tree(tree: ActivityTree, event: SyncEvent) -> None:
     assert event in tree.sync_events
     assert tree.has_path(event.dbx_path)
@@ -136,6 +315,12 @@ def assert_not_in_tree(tree: ActivityTree, event: SyncEvent) -> None:
 
 
 def assert_tree_integrity(node: ActivityNode) -> None:
+    # Aggregate counters must match the SyncEvents of this node and its children.
+    sync_events = node.sync_events
+    assert node.num_events == len(sync_events)
+    assert node.num_failed == sum(e.status is SyncStatus.Failed for e in sync_events)
+    assert node.size == sum(e.size for e in sync_events)
+
     if node.parent:
         # The parent node should contain all of this node's sync events.
         assert node.sync_events.issubset(node.parent.sync_events)
@@ -145,3 +330,628 @@ def assert_tree_integrity(node: ActivityNode) -> None:
     # Recurse.
     for child in node.children.values():
         assert_tree_integrity(child)
+
+
+def test_get_index_entries(sync: SyncEngine) -> None:
+    for dbx_path in ("/Folder", "/Folder/File.txt"):
+        entry = IndexEntry(
+            dbx_path_lower=dbx_path.lower(),
+            dbx_path_cased=dbx_path,
+            dbx_id="id:123",
+            item_type=ItemType.File,
+            last_sync=None,
+            rev="1",
+            content_hash=None,
+        )
+        sync._index_table.save(entry)
+
+    entries = sync.get_index_entries(["/folder", "/folder/file.txt", "/missing"])
+    assert set(entries) == {"/folder", "/folder/file.txt"}
+
+    local_paths = [
+        sync.dropbox_path + "/Folder/File.txt",
+        sync.dropbox_path + "/FOLDER",
+        sync.dropbox_path + "/missing",
+    ]
+    entries = sync.get_index_entries_for_local_paths(local_paths)
+    assert set(entries) == {sync.dropbox_path + "/Folder/File.txt"}
+
+
+def _folder_md(path: str) -> FolderMetadata:
+    name = path.rsplit("/", 1)[-1]
+    return FolderMetadata(name, normalize(path), path, f"id:{path}", False)
+
+
+def _file_md(path: str) -> FileMetadata:
+    return FileMetadata(
+        name=path.rsplit("/", 1)[-1],
+        path_lower=normalize(path),
+        path_display=path,
+        id=f"id:{path}",
+        client_modified=datetime.now(),
+        server_modified=datetime.now(),
+        rev="1",
+        size=0,
+        symlink_target=None,
+        shared=False,
+        modified_by=None,
+        is_downloadable=True,
+        content_hash="abc",
+    )
+
+
+def _index_entry(dbx_path: str, item_type: ItemType) -> IndexEntry:
+    is_folder = item_type is ItemType.Folder
+    return IndexEntry(
+        dbx_path_lower=normalize(dbx_path),
+        dbx_path_cased=dbx_path,
+        dbx_id=f"id:{dbx_path}",
+        item_type=item_type,
+        last_sync=None,
+        rev="folder" if is_folder else "1",
+        content_hash="folder" if is_folder else "abc",
+    )
+
+
+def test_correct_case_batch(sync: SyncEngine, monkeypatch) -> None:
+    sync._index_table.save(_index_entry("/Folder", ItemType.Folder))
+
+    entries = [
+        _folder_md("/folder/Sub"),
+        _folder_md("/folder/sub/Deep"),
+        _file_md("/folder/sub/deep/File.txt"),
+    ]
+
+    def get_metadata(*args, **kwargs):
+        raise AssertionError("Casing should be resolved without server lookups")
+
+    monkeypatch.setattr(sync.client, "get_metadata", get_metadata)
+
+    sync.correct_case_batch(entries)
+
+    assert sync.correct_case("/folder/sub/deep/File.txt") == "/Folder/Sub/Deep/File.txt"
+
+
+def test_from_metadata_page(sync: SyncEngine, monkeypatch) -> None:
+    monkeypatch.setattr(
+        sync.client, "_cached_account_info", SimpleNamespace(account_id="dbid:1")
+    )
+
+    sync._index_table.save(_index_entry("/Folder", ItemType.Folder))
+    sync._index_table.save(_index_entry("/Folder/Old.txt", ItemType.File))
+    sync._index_table.save(_index_entry("/Folder/Deleted", ItemType.Folder))
+
+    entries = [
+        _file_md("/folder/New.txt"),
+        _file_md("/folder/Old.txt"),
+        DeletedMetadata("Deleted", "/folder/deleted", "/folder/Deleted"),
+        DeletedMetadata("Unknown", "/folder/unknown", "/folder/Unknown"),
+    ]
+
+    new, old, deleted, unknown = SyncEvent.from_metadata_page(entries, sync)
+
+    assert new.change_type is ChangeType.Added
+    assert new.dbx_path == "/Folder/New.txt"
+    assert new.change_dbid == "dbid:1"
+    assert old.change_type is ChangeType.Modified
+    assert deleted.change_type is ChangeType.Removed
+    assert deleted.item_type is ItemType.Folder
+    assert unknown.item_type is ItemType.Unknown
+
+
+@pytest.mark.benchmark(group="from_metadata_page")
+def test_from_metadata_page_performance(
+    sync: SyncEngine, monkeypatch, benchmark
+) -> None:
+    """Measures the conversion rate for a page of 2,000 remote changes."""
+    monkeypatch.setattr(
+        sync.client, "_cached_account_info", SimpleNamespace(account_id="dbid:1")
+    )
+
+    entries: list[Metadata] = []
+
+    for i in range(100):
+        folder = f"/Folder {i}"
+        entries.append(_folder_md(folder))
+        sync._index_table.save(_index_entry(folder, ItemType.Folder))
+
+        for j in range(19):
+            path = f"{folder}/File {j}.txt"
+            entries.append(_file_md(path))
+            if j % 2 == 0:
+                sync._index_table.save(_index_entry(path, ItemType.File))
+
+    def convert() -> list[SyncEvent]:
+        sync._clear_caches()
+        return SyncEvent.from_metadata_page(entries, sync)
+
+    events = benchmark(convert)
+
+    assert len(events) == 2000
+    if benchmark.stats:
+        mean = benchmark.stats.stats.mean
+        benchmark.extra_info["events/s"] = round(len(entries) / mean)
+
+
+def test_sync_event_local_path(sync: SyncEngine, monkeypatch) -> None:
+    monkeypatch.setattr(
+        sync.client, "_cached_account_info", SimpleNamespace(account_id="dbid:1")
+    )
+
+    event = SyncEvent.from_metadata(_file_md("/File.txt"), sync)
+
+    assert event.local_path == sync.dropbox_path + "/File.txt"
+    assert event._local_path == sync.dropbox_path
+
+    # The local path must not follow changes to the Dropbox path.
+    event.dbx_path = "/Other.txt"
+    assert event.local_path == sync.dropbox_path + "/File.txt"
+
+    event.local_path = "/elsewhere/File.txt"
+    assert event.local_path == "/elsewhere/File.txt"
+
+
+def test_path_columns_resolve_each_other() -> None:
+    class Event(Model):
+        __tablename__ = "events"
+        remote = DbxPathColumn(local_path_attr="local")
+        local = LocalPathColumn(dbx_path_attr="remote")
+
+    event = Event(remote="/File.txt", local="/folder/File.txt")
+
+    assert event.local == "/folder/File.txt"
+    assert event._local == "/folder"
+
+    # The local path must not follow changes to the Dropbox path.
+    event.remote = "/Other.txt"
+    assert event.local == "/folder/File.txt"
+
+
+@pytest.mark.benchmark(group="sync_event_memory")
+def test_sync_event_memory(sync: SyncEngine, monkeypatch, benchmark) -> None:
+    """Measures the peak memory of queued remote changes, per million events."""
+    monkeypatch.setattr(
+        sync.client, "_cached_account_info", SimpleNamespace(account_id="dbid:1")
+    )
+
+    n_pages = 25
+    page_size = 2000
+
+    def page(i: int) -> list[Metadata]:
+        entries: list[Metadata] = [_folder_md(f"/Folder {i}")]
+
+        for j in range(page_size // 20 - 1):
+            folder = f"/Folder {i}/Sub Folder {j}"
+            entries.append(_folder_md(folder))
+            entries.extend(_file_md(f"{folder}/File {k}.txt") for k in range(20))
+
+        return entries
+
+    events: list[SyncEvent] = []
+
+    def collect() -> int:
+        sync._clear_caches()
+        events.clear()
+
+        tracemalloc.start()
+        for i in range(n_pages):
+            events.extend(SyncEvent.from_metadata_page(page(i), sync))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return peak
+
+    peak = benchmark.pedantic(collect, rounds=1, iterations=1)
+    peak_per_million = peak * 1_000_000 / len(events)
+
+    benchmark.extra_info["peak_MB_per_million_events"] = round(peak_per_million / 1e6)
+
+    assert peak_per_million < 600e6
+
+
+class FakeListFolder:
+    """Serves list_folder requests for an in-memory tree, one page at a time."""
+
+    def __init__(self, entries: list[Metadata], page_size: int = 10) -> None:
+        self.entries = entries
+        self.page_size = page_size
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def get_latest_cursor(self, dbx_path: str) -> str:
+        return "latest"
+
+    def list_folder(self, dbx_path: str, recursive: bool = False) -> ListFolderResult:
+        entries = [
+            e for res in self.list_folder_iterator(dbx_path) for e in res.entries
+        ]
+        return ListFolderResult(entries=entries, has_more=False, cursor="root")
+
+    def list_folder_iterator(self, dbx_path: str, recursive: bool = False):
+        prefix = "" if dbx_path == "/" else dbx_path
+
+        def included(e: Metadata) -> bool:
+            if e.path_lower == dbx_path:
+                return True
+            if not e.path_lower.startswith(prefix + "/"):
+                return False
+            return recursive or "/" not in e.path_lower[len(prefix) + 1 :]
+
+        entries = [e for e in self.entries if included(e)]
+        yield from self._pages(dbx_path, entries, 0)
+
+    def list_remote_changes_iterator(self, last_cursor: str):
+        dbx_path, _, start = last_cursor.rpartition(":")
+        entries = [
+            e for res in self.list_folder_iterator(dbx_path, True) for e in res.entries
+        ]
+        yield from self._pages(dbx_path, entries, int(start))
+
+    def _pages(self, dbx_path: str, entries: list[Metadata], start: int):
+        for i in range(start, len(entries), self.page_size):
+            with self._lock:
+                self.active += 1
+                self.max_active = max(self.active, self.max_active)
+
+            time.sleep(0.01)  # Network latency.
+
+            with self._lock:
+                self.active -= 1
+
+            page = entries[i : i + self.page_size]
+            has_more = i + self.page_size < len(entries)
+            cursor = f"{dbx_path}:{i + self.page_size}"
+            yield ListFolderResult(entries=page, has_more=has_more, cursor=cursor)
+
+
+@pytest.fixture
+def list_folder_server(sync: SyncEngine, monkeypatch) -> FakeListFolder:
+    monkeypatch.setattr(
+        sync.client, "_cached_account_info", SimpleNamespace(account_id="dbid:1")
+    )
+
+    entries: list[Metadata] = [_file_md("/Root file.txt")]
+
+    for i in range(4):
+        entries.append(_folder_md(f"/Folder {i}"))
+        entries.append(_folder_md(f"/Folder {i}/Sub"))
+        for j in range(30):
+            entries.append(_file_md(f"/Folder {i}/Sub/File {j}.txt"))
+
+    server = FakeListFolder(entries)
+
+    for name in (
+        "get_latest_cursor",
+        "list_folder",
+        "list_folder_iterator",
+        "list_remote_changes_iterator",
+    ):
+        monkeypatch.setattr(sync.client, name, getattr(server, name))
+
+    return server
+
+
+def test_list_folder_sharded(
+    sync: SyncEngine, list_folder_server: FakeListFolder
+) -> None:
+    server = list_folder_server
+    entries = server.entries
+
+    results = list(sync.list_remote_changes_iterator(""))
+    events = [event for sync_events, _ in results for event in sync_events]
+    cursors = [cursor for _, cursor in results]
+
+    # All items are listed exactly once.
+    assert sorted(e.dbx_path for e in events) == sorted(e.path_display for e in entries)
+
+    # The last cursor must be taken before listing any content.
+    assert cursors[-1] == "latest"
+    assert all(c.startswith("sharded:") for c in cursors[:-1])
+
+    # Top-level folders are listed concurrently.
+    assert server.max_active > 1
+
+    # Sequential indexing is still supported.
+    sync._conf.set("sync", "indexing_shards", 1)
+    results = list(sync.list_remote_changes_iterator(""))
+    assert sum(len(sync_events) for sync_events, _ in results) == len(entries)
+
+
+def test_list_folder_sharded_resume(
+    sync: SyncEngine, list_folder_server: FakeListFolder
+) -> None:
+    entries = list_folder_server.entries
+
+    # Interrupt the indexing after a few pages.
+    results = list(islice(sync.list_remote_changes_iterator(""), 6))
+    listed = [event.dbx_path for sync_events, _ in results for event in sync_events]
+    cursor = results[-1][1]
+
+    # Resume from the last saved cursor.
+    results = list(sync.list_remote_changes_iterator(cursor))
+    listed += [event.dbx_path for sync_events, _ in results for event in sync_events]
+
+    # Each item is listed at least once and only pages which were not yet yielded
+    # are listed again.
+    assert set(listed) == {e.path_display for e in entries}
+    assert len(listed) == len(entries)
+    assert results[-1][1] == "latest"
+
+
+def _create_local_changes(sync: SyncEngine) -> None:
+    # Items in the index which were deleted locally.
+    for path in ("/Deleted", "/Deleted/Sub"):
+        sync._index_table.save(_index_entry(path, ItemType.Folder))
+    for path in ("/Deleted/a.txt", "/Deleted/Sub/b.txt", "/Gone.txt"):
+        sync._index_table.save(_index_entry(path, ItemType.File))
+
+    # Items in the index which still exist locally.
+    sync._index_table.save(_index_entry("/Kept", ItemType.Folder))
+    os.mkdir(sync.dropbox_path + "/Kept")
+
+    # Items which were created locally.
+    for folder in ("/Kept/New", "/Kept/New/Sub"):
+        os.mkdir(sync.dropbox_path + folder)
+        for i in range(15):
+            with open(f"{sync.dropbox_path}{folder}/file_{i}.txt", "w") as f:
+                f.write("content")
+
+
+def test_local_changes_while_inactive(sync: SyncEngine) -> None:
+    _create_local_changes(sync)
+
+    batches = list(sync._iter_local_changes_while_inactive(time.time(), batch_size=4))
+    events = [event for batch in batches for event in batch]
+
+    assert all(len(batch) <= 4 for batch in batches)
+    assert len(batches) == 9
+
+    # Deletions are reported first, children of deleted folders are omitted.
+    assert events[:2] == [
+        DirDeletedEvent(sync.dropbox_path + "/Deleted"),
+        FileDeletedEvent(sync.dropbox_path + "/Gone.txt"),
+    ]
+    assert not any(is_deleted(event) for event in events[2:])
+
+    # Parent folders are reported before their children.
+    created = [event.src_path for event in events[2:]]
+    assert len(created) == 32
+    for i, path in enumerate(created):
+        parent = osp.dirname(path)
+        if parent in created:
+            assert created.index(parent) < i
+
+    # The full list of changes is the same.
+    changes, _ = sync._get_local_changes_while_inactive()
+    assert changes == events
+
+
+def test_upload_local_changes_while_inactive(sync: SyncEngine, monkeypatch) -> None:
+    _create_local_changes(sync)
+
+    applied: list[list[SyncEvent]] = []
+    monkeypatch.setattr(sync, "apply_local_changes", applied.append)
+
+    sync.upload_local_changes_while_inactive()
+
+    # Deletions are applied before creations, each in its own batch.
+    assert [len(batch) for batch in applied] == [2, 32]
+    assert all(event.is_deleted for event in applied[0])
+    assert all(event.is_added for event in applied[1])
+    assert sync.local_cursor > 0
+
+
+def test_queue_downloads(sync: SyncEngine) -> None:
+    assert sync.queue_downloads(["/a/b", "/c", "/c/d"]) == 2
+    assert set(sync.get_queued_downloads()) == {"/a/b", "/c"}
+
+    # Children of queued folders are not queued again.
+    assert sync.queue_downloads(["/a/b/e", "/c"]) == 0
+
+    # Queued children are folded into a newly queued parent.
+    assert sync.queue_downloads(["/a"]) == 1
+    assert set(sync.get_queued_downloads()) == {"/a", "/c"}
+    assert sync.is_download_queued("/a")
+    assert not sync.is_download_queued("/a/b")
+
+    # Children of folders which are being downloaded are still queued.
+    assert sync.queue_downloads(["/a/b"], in_progress={"/a"}) == 1
+    assert sync.is_download_queued("/a/b")
+
+    # Items with a higher priority come first.
+    sync.queue_downloads(["/f"], priority=1)
+    assert sync.get_queued_downloads(limit=1) == ["/f"]
+
+    sync.remove_queued_downloads(["/a", "/a/b", "/f"])
+    assert sync.get_queued_downloads() == ["/c"]
+    assert sync.queued_downloads_count() == 1
+
+
+@pytest.mark.benchmark(group="download_queue")
+def test_queue_downloads_performance(sync: SyncEngine, benchmark) -> None:
+    """Queues 10,000 folders and their parents, as when including many folders."""
+    paths = [f"/folder_{i // 100}/sub_{i}" for i in range(10_000)]
+
+    def queue_all() -> None:
+        sync.remove_queued_downloads(sync.get_queued_downloads())
+        sync.queue_downloads(paths)
+        sync.queue_downloads({path.rpartition("/")[0] for path in paths})
+
+    benchmark(queue_all)
+
+    assert sync.queued_downloads_count() == 100
+
+
+def _history_event(dbx_path: str, sync_time: float) -> SyncEvent:
+    return SyncEvent(
+        dbx_path=dbx_path,
+        dbx_path_lower=dbx_path.lower(),
+        local_path=f"/local{dbx_path}",
+        direction=SyncDirection.Down,
+        status=SyncStatus.Done,
+        change_type=ChangeType.Added,
+        item_type=ItemType.File,
+        size=10,
+        completed=10,
+        sync_time=sync_time,
+    )
+
+
+def test_history_batched(sync: SyncEngine) -> None:
+    now = time.time()
+
+    for i in range(10):
+        sync._history_buffer.append(_history_event(f"/file_{i}", now + i))
+
+    # Events are saved on the next cleanup or when reading the history.
+    assert sync._history_table.count() == 0
+    assert [e.dbx_path for e in sync.get_history(limit=3)] == [
+        "/file_7",
+        "/file_8",
+        "/file_9",
+    ]
+    assert len(sync.get_history(dbx_path="/file_2", limit=3)) == 1
+    assert sync._history_table.count() == 10
+    assert sync._history_buffer == []
+
+
+def test_history_pruning(sync: SyncEngine, monkeypatch) -> None:
+    monkeypatch.setattr(sync, "_max_history", 5)
+    keep_history = sync._conf.get("sync", "keep_history")
+    now = time.time()
+
+    sync._history_buffer.append(_history_event("/old", now - keep_history - 10))
+    for i in range(7):
+        sync._history_buffer.append(_history_event(f"/file_{i}", now + i))
+
+    sync._clean_history()
+
+    # Events older than keep_history and beyond the maximum count are removed.
+    assert [e.dbx_path for e in sync.get_history()] == [
+        f"/file_{i}" for i in range(2, 7)
+    ]
+
+    # Pruning is skipped until the interval has passed.
+    sync._history_buffer.append(_history_event("/file_7", now + 7))
+    sync._clean_history()
+    assert len(sync.get_history()) == 6
+
+    sync._last_history_pruning = 0.0
+    sync._clean_history()
+    assert len(sync.get_history()) == 5
+
+
+@pytest.mark.benchmark(group="history")
+def test_history_performance(sync: SyncEngine, benchmark) -> None:
+    """Saves and prunes 20,000 sync events in pages of 500 events."""
+    now = time.time()
+    events = [_history_event(f"/file_{i}", now + i) for i in range(20_000)]
+
+    def save_all() -> None:
+        sync._history_table.clear()
+
+        for i in range(0, len(events), 500):
+            for event in events[i : i + 500]:
+                event.id = None
+                sync._history_buffer.append(event)
+
+            sync._last_history_pruning = 0.0
+            sync._clean_history()
+
+    benchmark.pedantic(save_all, rounds=1, iterations=1)
+
+    assert sync._history_table.count() == 1000
+
+
+def test_excluded_items(sync: SyncEngine) -> None:
+    sync.excluded_items = ["/Folder", "/folder/child", "/Other/Sub/", "/other/sub/x"]
+
+    assert sync.excluded_items == {"/folder", "/other/sub"}
+
+    assert sync.is_excluded_by_user("/folder")
+    assert sync.is_excluded_by_user("/folder/file.txt")
+    assert not sync.is_excluded_by_user("/folder2")
+    assert not sync.is_excluded_by_user("/other")
+
+    assert sync.has_excluded_children("/other")
+    assert not sync.has_excluded_children("/folder")
+
+
+def to_dbx_path_reference(sync: SyncEngine, local_path: str) -> str:
+    path = os.fsdecode(local_path)
+
+    if not is_equal_or_child(path, sync.dropbox_path, sync.is_fs_case_sensitive):
+        raise ValueError(f'"{path}" is not in "{sync.dropbox_path}"')
+    return "/" + removeprefix(
+        path, sync.dropbox_path, sync.is_fs_case_sensitive
+    ).lstrip("/")
+
+
+def is_excluded_reference(sync: SyncEngine, path: str) -> bool:
+    dirname, basename = osp.split(path)
+
+    if basename in EXCLUDED_FILE_NAMES:
+        return True
+
+    try:
+        dbx_dirname = to_dbx_path_reference(sync, dirname)
+    except ValueError:
+        dbx_dirname = dirname
+
+    root_dir = next(iter(part for part in dbx_dirname.split("/", 2) if part), "")
+
+    if root_dir in EXCLUDED_DIR_NAMES:
+        return True
+
+    if "~" in basename:
+        if basename.startswith("~$") or basename.startswith(".~"):
+            return True
+        if basename.startswith("~") and basename.endswith(".tmp"):
+            return True
+
+    return False
+
+
+path_parts = st.sampled_from(
+    ["/", "a", "B", "é", "e\u0301", "İ", "~$", ".~", ".tmp", *EXCLUDED_DIR_NAMES]
+)
+paths = st.lists(path_parts, max_size=8).map("".join)
+
+
+@settings(suppress_health_check=[HealthCheck.function_scoped_fixture])
+@given(root=paths, path=paths, case_sensitive=st.booleans())
+def test_to_dbx_path_parity(
+    sync: SyncEngine, root: str, path: str, case_sensitive: bool
+) -> None:
+    dropbox_path = sync.dropbox_path
+
+    # Only change the cached attributes so that the fixture still cleans up the actual
+    # Dropbox folder.
+    sync._dropbox_path = "/" + root.strip("/")
+    sync._update_dropbox_path_prefixes()
+    sync._is_fs_case_sensitive = case_sensitive
+
+    try:
+        for local_path in (
+            path,
+            f"{sync.dropbox_path}{path}",
+            f"{sync.dropbox_path}/{path}",
+        ):
+            try:
+                expected = to_dbx_path_reference(sync, local_path)
+            except ValueError as exc:
+                with pytest.raises(ValueError, match=re.escape(str(exc))):
+                    sync.to_dbx_path(local_path)
+            else:
+                assert sync.to_dbx_path(local_path) == expected
+                assert sync.to_dbx_path(os.fsencode(local_path)) == expected
+                assert sync.to_dbx_path_lower(local_path) == normalize(expected)
+
+            assert sync.is_excluded(local_path) == is_excluded_reference(
+                sync, local_path
+            )
+    finally:
+        sync._dropbox_path = dropbox_path
+        sync._update_dropbox_path_prefixes()
+        sync._is_fs_case_sensitive = sync._check_fs_case_sensitive()
@@ -0,0 +1,216 @@
+import json
+import os.path as osp
+import threading
+
+import pytest
+
+from maestral.tracing import (
+    Tracer,
+    run_in_context,
+    trace_iter,
+    traced,
+)
+from maestral.tracing import tracer as global_tracer
+from maestral.tracing import write_chrome_trace
+
+
+def _spans(tracer: Tracer) -> list[dict]:
+    return [e for e in tracer.chrome_trace()["traceEvents"] if e["ph"] == "X"]
+
+
+def test_nested_spans() -> None:
+    tracer = Tracer(sample_rate=1.0)
+
+    with tracer.span("parent", path="/a"):
+        with tracer.span("child", "api"):
+            pass
+
+    child, parent = _spans(tracer)
+
+    assert parent["name"] == "parent"
+    assert parent["args"] == {"path": "/a"}
+    assert child["cat"] == "api"
+    assert child["ts"] >= parent["ts"]
+    assert child["ts"] + child["dur"] <= parent["ts"] + parent["dur"]
+
+
+def test_sampling() -> None:
+    tracer = Tracer(sample_rate=0.0)
+
+    with tracer.span("root"):
+        pass
+
+    assert len(tracer) == 0
+
+    tracer.sample_rate = 1.0
+
+    with tracer.span("root"):
+        pass
+
+    assert len(tracer) == 1
+
+    with pytest.raises(ValueError):
+        tracer.sample_rate = 1.5
+
+
+def test_unsampled_trace(monkeypatch) -> None:
+    tracer = Tracer(sample_rate=0.5)
+    monkeypatch.setattr("random.random", lambda: 0.9)
+
+    # Children of an unsampled trace are never recorded.
+    with tracer.span("root"):
+        monkeypatch.setattr("random.random", lambda: 0.0)
+        with tracer.span("child"):
+            pass
+        with tracer.leaf_span("leaf"):
+            pass
+
+    assert len(tracer) == 0
+
+
+def test_leaf_span() -> None:
+    tracer = Tracer(sample_rate=1.0)
+
+    # Leaf spans do not start a new trace.
+    with tracer.leaf_span("leaf"):
+        pass
+
+    assert len(tracer) == 0
+
+    def generator():
+        with tracer.leaf_span("leaf"):
+            yield 1
+            yield 2
+
+    # Leaf spans may remain open across a yield.
+    with tracer.span("root"):
+        gen = generator()
+        next(gen)
+
+    next(gen)
+    gen.close()
+
+    assert [s["name"] for s in _spans(tracer)] == ["root", "leaf"]
+
+
+def test_ring_buffer() -> None:
+    tracer = Tracer(sample_rate=1.0, buffer_size=10)
+
+    for i in range(15):
+        with tracer.span(f"span-{i}"):
+            pass
+
+    spans = _spans(tracer)
+
+    assert len(spans) == 10
+    assert spans[0]["name"] == "span-5"
+    assert spans[0]["ts"] == 0
+
+    tracer.clear()
+    assert len(tracer) == 0
+
+
+def test_run_in_context() -> None:
+    tracer = Tracer(sample_rate=1.0)
+
+    def work() -> None:
+        with tracer.span("work"):
+            pass
+
+    # Without a parent in the worker thread, a new trace is started.
+    with tracer.span("root"):
+        thread = threading.Thread(target=run_in_context(work), name="worker")
+        thread.start()
+        thread.join()
+
+    trace = tracer.chrome_trace()
+    thread_names = {
+        e["tid"]: e["args"]["name"] for e in trace["traceEvents"] if e["ph"] == "M"
+    }
+    work_span = next(s for s in _spans(tracer) if s["name"] == "work")
+
+    assert thread_names[work_span["tid"]] == "worker"
+
+    # Spans in threads of an unsampled trace are not recorded.
+    tracer.clear()
+    tracer.sample_rate = 0.5
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr("random.random", lambda: 0.9)
+
+        with tracer.span("root"):
+            func = run_in_context(work)
+
+        monkeypatch.setattr("random.random", lambda: 0.0)
+        thread = threading.Thread(target=func)
+        thread.start()
+        thread.join()
+
+    assert len(tracer) == 0
+
+
+def test_trace_iter() -> None:
+    def generator():
+        for i in range(3):
+            with global_tracer.span("produce"):
+                pass
+            yield i
+
+    try:
+        global_tracer.sample_rate = 1.0
+
+        with global_tracer.span("root"):
+            assert list(trace_iter(generator(), "next")) == [0, 1, 2]
+
+        names = [s["name"] for s in _spans(global_tracer)]
+
+        # One span per item and one for the final StopIteration.
+        assert names.count("next") == 4
+        assert names.count("produce") == 3
+    finally:
+        global_tracer.sample_rate = 0.0
+        global_tracer.clear()
+
+
+def test_traced() -> None:
+    @traced()
+    def func(x: int) -> int:
+        return x + 1
+
+    try:
+        global_tracer.sample_rate = 1.0
+        assert func(1) == 2
+        assert [s["name"] for s in _spans(global_tracer)] == ["func"]
+    finally:
+        global_tracer.sample_rate = 0.0
+        global_tracer.clear()
+
+
+def test_write_chrome_trace(tmp_path) -> None:
+    tracer = Tracer(sample_rate=1.0)
+
+    with tracer.span("root", path="/a"):
+        pass
+
+    path = osp.join(tmp_path, "trace.json")
+    write_chrome_trace(path, tracer.chrome_trace())
+
+    with open(path) as f:
+        assert json.load(f) == tracer.chrome_trace()
+
+
+@pytest.mark.benchmark(group="tracing")
+def test_disabled_overhead(benchmark) -> None:
+    """Measures 1M spans while tracing is disabled."""
+    tracer = Tracer(sample_rate=0.0)
+
+    def trace() -> None:
+        for _ in range(1_000_000):
+            with tracer.span("span", path="/a"):
+                pass
+
+    benchmark.pedantic(trace, rounds=1, iterations=1)
+
+    if benchmark.stats:
+        # Less than 1 µs per span.
+        assert benchmark.stats.stats.mean < 1.0
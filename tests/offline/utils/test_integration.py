@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from maestral.utils.integration import CPU_CORE_COUNT, CPUGovernor, _process_time
+
+
+def _busy_workers(governor: CPUGovernor | None, duration: float) -> float:
+    """
+    Runs CPU bound work items in multiple threads, admitted by the given governor.
+    Returns the CPU usage of the process during the run in percent.
+    """
+    stop = threading.Event()
+
+    def worker() -> None:
+        while not stop.is_set():
+            if governor:
+                governor.wait()
+
+            # A small CPU bound work item, as for instance hashing a file.
+            t0 = time.perf_counter()
+            while time.perf_counter() - t0 < 0.002:
+                pass
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+
+    t0 = time.monotonic()
+    pt0 = _process_time()
+
+    for t in threads:
+        t.start()
+
+    time.sleep(duration)
+    stop.set()
+
+    for t in threads:
+        t.join()
+
+    return (_process_time() - pt0) / (time.monotonic() - t0) * 100
+
+
+def test_disabled() -> None:
+    governor = CPUGovernor(max_percent=100 * CPU_CORE_COUNT)
+
+    assert not governor.enabled
+    assert governor.wait(timeout=0)
+    assert governor._thread is None
+
+
+def test_idle_thread_exits() -> None:
+    governor = CPUGovernor(max_percent=10, interval=0.05, idle_timeout=0.2)
+
+    governor.wait()
+    assert governor._thread is not None
+
+    time.sleep(1)
+    assert governor._thread is None
+    assert governor.is_open
+
+
+def test_caps_cpu_usage() -> None:
+    """Measures the CPU usage of busy workers with and without a governor."""
+    usage_unlimited = _busy_workers(None, duration=1)
+
+    # The CPU time available to the workers depends on the number of cores and on the
+    # load of the machine. Cap the usage well below what they reach without limit.
+    if usage_unlimited < 20:
+        pytest.skip(f"Workers only reach {usage_unlimited:.0f}% CPU usage")
+
+    governor = CPUGovernor(max_percent=min(30, usage_unlimited / 3), interval=0.05)
+    usage_limited = _busy_workers(governor, duration=3)
+
+    assert governor.enabled
+    assert usage_limited < 1.5 * governor.max_percent
+
+
+def test_wait_performance(benchmark) -> None:
+    """Workers which are admitted should not pay for sampling CPU usage."""
+    governor = CPUGovernor(max_percent=100 * CPU_CORE_COUNT - 1)
+    governor.wait()
+
+    benchmark(governor.wait)
+
+    if benchmark.stats:
+        assert benchmark.stats.stats.mean < 0.001
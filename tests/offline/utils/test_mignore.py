@@ -0,0 +1,155 @@
+import random
+
+import pytest
+from pathspec import PathSpec
+
+from maestral.utils.mignore import MignoreMatcher
+
+NAMES = ["src", "lib", "build", "docs", "tests", "data", "cache", "img", "a", "b"]
+EXTENSIONS = ["py", "pyc", "txt", "md", "log", "tmp", "jpg", "o", "so", "swp"]
+
+
+def random_patterns(rng: random.Random, n: int) -> list[str]:
+    """Generates a mix of patterns as typically found in a mignore file."""
+    patterns = []
+
+    for i in range(n):
+        name = rng.choice(NAMES)
+        ext = rng.choice(EXTENSIONS)
+        kind = rng.randrange(8)
+
+        if kind == 0:
+            patterns.append(f"*.{ext}{i}")
+        elif kind == 1:
+            patterns.append(f"{name}{i}/")
+        elif kind == 2:
+            patterns.append(f"/{name}/{name}{i}/**")
+        elif kind == 3:
+            patterns.append(f"!{name}{i}.{ext}")
+        elif kind == 4:
+            patterns.append(f"**/{name}{i}/*.{ext}")
+        elif kind == 5:
+            patterns.append(f"{name}{i}*.{ext}")
+        elif kind == 6:
+            patterns.append(f"/{name}{i}")
+        else:
+            patterns.append(f".{name}{i}")
+
+    return patterns
+
+
+def random_tree(rng: random.Random, n: int, files_per_dir: int = 20) -> list[str]:
+    """Generates paths of files and folders in a tree with up to ``n`` items."""
+    components = NAMES + [f"{name}{i}" for name in NAMES for i in range(0, 200, 7)]
+    paths = []
+    dirs = [""]
+
+    while len(paths) < n:
+        parent = rng.choice(dirs)
+        if parent.count("/") > 8:
+            continue
+
+        dirname = f"{parent}{rng.choice(components)}/"
+        dirs.append(dirname)
+        paths.append(dirname)
+
+        for _ in range(files_per_dir):
+            name = rng.choice(components + ["file", "README"])
+            paths.append(f"{dirname}{name}.{rng.choice(EXTENSIONS)}")
+
+    return paths[:n]
+
+
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        [],
+        ["# comment", ""],
+        ["*.pyc", "!keep.pyc"],
+        ["build/", "!build/keep/"],
+        ["x*", "!x1/", "*/"],
+        ["**"],
+        ["*", "!*/"],
+        ["a/**/b", "!/a/c/b"],
+        ["a/*/", "/b/", "b/c", ".*"],
+        ["[ab]*.txt", "file?.md", "!**/docs/*.md"],
+        ["foo", "!/foo", "bar/foo/"],
+        ["with space", "back\\slash", "dash-name", "dot.name", "$dollar"],
+    ],
+)
+def test_matches_pathspec(patterns: list[str]) -> None:
+    spec = PathSpec.from_lines("gitwildmatch", patterns)
+    matcher = MignoreMatcher(spec)
+    paths = [
+        "",
+        "a",
+        "a/",
+        "a/b",
+        "a/b/",
+        "a/c/b",
+        "b/",
+        "b/c",
+        "x1",
+        "x1/",
+        "d/x1/f",
+        "keep.pyc",
+        "lib/keep.pyc",
+        "lib/other.pyc",
+        "build/keep/",
+        "build/keep/file.txt",
+        ".hidden",
+        "a/.hidden/",
+        "a.txt",
+        "file1.md",
+        "docs/file1.md",
+        "foo",
+        "foo/",
+        "bar/foo/",
+        "bar/foo",
+        "with space",
+        "dir/back\\slash",
+        "dash-name/",
+        "dotxname",
+        "dot.name",
+        "$dollar",
+        "line\nbreak",
+        "/leading/slash",
+    ]
+
+    for path in paths:
+        assert matcher.match_file(path) == spec.match_file(path), path
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_pathspec_random(seed: int) -> None:
+    rng = random.Random(seed)
+    spec = PathSpec.from_lines("gitwildmatch", random_patterns(rng, 200))
+    matcher = MignoreMatcher(spec, cache_size=100)
+
+    for path in random_tree(rng, 5_000, files_per_dir=5):
+        assert matcher.match_file(path) == spec.match_file(path), path
+
+
+def test_match_dir() -> None:
+    spec = PathSpec.from_lines("gitwildmatch", ["build/", "*.txt"])
+    matcher = MignoreMatcher(spec)
+
+    assert matcher.match_dir("build")
+    assert matcher.match_dir("src/build/")
+    assert not matcher.match_dir("src")
+    assert not matcher.match_file("build")
+    assert matcher.match_file("src/file.txt")
+
+
+def test_uses_fast_paths() -> None:
+    """
+    Test that patterns are sorted into the fast paths. This depends on the regular
+    expressions which pathspec generates and fails if their format changes.
+    """
+    spec = PathSpec.from_lines("gitwildmatch", ["*.pyc", "build/", "cache", "/docs/*"])
+    matcher = MignoreMatcher(spec)
+
+    assert matcher._names._suffixes == {".pyc": 0}
+    assert matcher._dir_names._names == {"build": 1, "cache": 2}
+    assert list(matcher._anchored) == ["docs"]
+    assert matcher._other == []
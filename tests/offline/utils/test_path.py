@@ -1,19 +1,31 @@
 import os
+import random
 import stat
+import unicodedata
 
 import pytest
 import xattr
+from hypothesis import given
+from hypothesis import strategies as st
 
 from maestral.constants import IS_LINUX
 from maestral.utils.appdirs import get_home_dir
 from maestral.utils.path import (
+    PathTrie,
     get_existing_equivalent_paths,
     is_child,
+    is_equal_or_child,
     is_fs_case_sensitive,
     move,
+    normalize,
     normalized_path_exists,
 )
 
+# Path components with characters that change under unicode normalization or when
+# converting to lower case, in some cases changing the length of the string.
+path_chars = st.sampled_from(["/", "a", "B", "é", "e\u0301", "İ", "ß", "Σ", "ǅ", " "])
+paths = st.lists(path_chars, max_size=12).map("".join)
+
 
 def touch(path: str) -> None:
     open(path, "w").close()
@@ -91,6 +103,91 @@ def test_is_child():
     assert not is_child("/path1", "/path2")
 
 
+def normalize_reference(path: str | bytes) -> str:
+    return unicodedata.normalize("NFC", os.fsdecode(path)).lower()
+
+
+def is_child_reference(path: str, parent: str, case_sensitive: bool) -> bool:
+    if not case_sensitive:
+        path = normalize_reference(path)
+        parent = normalize_reference(parent)
+
+    return path.rstrip("/").startswith(parent.rstrip("/") + "/")
+
+
+@given(paths, st.booleans())
+def test_normalize_parity(path: str, as_bytes: bool) -> None:
+    arg = os.fsencode(path) if as_bytes else path
+
+    assert normalize(arg) == normalize_reference(path)
+    assert normalize(normalize(arg)) == normalize(arg)
+
+
+@given(paths, paths, st.booleans())
+def test_is_child_parity(path: str, parent: str, case_sensitive: bool) -> None:
+    expected = is_child_reference(path, parent, case_sensitive)
+
+    assert is_child(path, parent, case_sensitive) == expected
+    assert is_child(os.fsencode(path), os.fsencode(parent), case_sensitive) == expected
+    assert is_equal_or_child(path, parent, case_sensitive) == (
+        expected or path == parent
+    )
+
+
+def test_path_trie():
+    trie = PathTrie(["/a", "/b/c", "/b/c/d"])
+
+    assert len(trie) == 3
+    assert "/b/c" in trie
+    assert "/b" not in trie
+
+    assert trie.contains_equal_or_parent("/a")
+    assert trie.contains_equal_or_parent("/a/x")
+    assert not trie.contains_equal_or_parent("/b")
+    assert not trie.contains_equal_or_parent("/ab")
+
+    assert trie.contains_child("/b")
+    assert not trie.contains_child("/a")
+
+    assert trie.parents("/b/c/d/e") == ["/b/c", "/b/c/d"]
+    assert sorted(trie.children("/b")) == ["/b/c", "/b/c/d"]
+
+    trie.discard("/b/c/d")
+    trie.discard("/b/c")
+
+    assert set(trie) == {"/a"}
+    assert not trie.contains_child("/b")
+
+
+def test_path_trie_matches_is_child():
+    rng = random.Random(0)
+
+    def random_path() -> str:
+        return "/" + "/".join(rng.choice("abc") for _ in range(rng.randint(1, 4)))
+
+    for _ in range(200):
+        paths = {random_path() for _ in range(rng.randint(0, 8))}
+        trie = PathTrie(paths)
+
+        for path in list(paths)[:2]:
+            trie.discard(path)
+            paths.discard(path)
+
+        assert set(trie) == paths
+
+        for _ in range(10):
+            p = random_path()
+            parents = {q for q in paths if is_child(p, q)}
+            children = {q for q in paths if is_child(q, p)}
+
+            assert trie.contains_equal_or_parent(p) == any(
+                is_equal_or_child(p, q) for q in paths
+            )
+            assert trie.contains_child(p) == bool(children)
+            assert set(trie.parents(p)) == parents
+            assert set(trie.children(p)) == children
+
+
 def test_move_preserves_permissions(tmp_path):
     src_path = str(tmp_path / "source.txt")
     dest_path = str(tmp_path / "dest.txt")
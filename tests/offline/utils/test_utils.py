@@ -1,6 +1,10 @@
+import itertools
+import threading
+import time
+
 import pytest
 
-from maestral.utils import get_newer_version
+from maestral.utils import get_newer_version, prefetch
 
 releases = (
     "0.6.1",
@@ -22,3 +26,46 @@ releases = (
 )
 def test_has_newer_version(current_version, newer_version):
     assert get_newer_version(current_version, releases) == newer_version
+
+
+def test_prefetch_order():
+    assert list(prefetch(range(100), n=3)) == list(range(100))
+
+
+def test_prefetch_exception():
+    def items():
+        yield 1
+        raise ValueError("failed")
+
+    it = prefetch(items())
+
+    assert next(it) == 1
+    with pytest.raises(ValueError, match="failed"):
+        next(it)
+
+
+def test_prefetch_overlap():
+    """Producing and consuming items should happen concurrently."""
+
+    def slow_items():
+        for i in range(5):
+            time.sleep(0.1)
+            yield i
+
+    t0 = time.monotonic()
+
+    for _ in prefetch(slow_items(), n=2):
+        time.sleep(0.1)
+
+    # Sequential processing would take at least 1 sec.
+    assert time.monotonic() - t0 < 0.9
+
+
+def test_prefetch_close():
+    it = prefetch(itertools.count(), n=1)
+    assert next(it) == 0
+
+    it.close()
+    time.sleep(0.5)
+
+    assert not any(t.name == "maestral-prefetch" for t in threading.enumerate())